@@ -0,0 +1,273 @@
+import argparse
+import base64
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+# Add parent directory to path so face_auth_api resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.synthetic import make_frames, make_gallery
+
+# Load generator for the face API:
+#   python benchmarks/api_load.py --users 10000 --image samples/face.jpg
+# In-process mode builds a synthetic gallery per matching strategy and
+# drives the endpoints through Flask's test client; with --url it sends the
+# same requests over HTTP to a running server instead.
+#   python benchmarks/api_load.py --url http://127.0.0.1:5002 --requests 500
+# Results can be saved with --json and compared with --baseline, which
+# exits non-zero when a p95 regresses by more than --tolerance. In-process
+# runs also report each strategy's accuracy against exact search (recall
+# and confidence error), e.g. for FACE_QUANT_* settings of the quantized index.
+
+SCENARIOS = ["status", "verify-frame", "verify-frame-raw", "register-embeddings"]
+
+
+# ------------------ Clients ------------------
+class TestClient:
+    """Flask test client, one per thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, payload=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        if isinstance(payload, bytes):
+            response = client.open(path, method=method, data=payload, content_type="image/jpeg")
+        else:
+            response = client.open(path, method=method, json=payload)
+        return response.status_code
+
+
+class HttpClient:
+    """Plain urllib client against a running server"""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def request(self, method, path, payload=None):
+        if isinstance(payload, bytes):
+            data, content_type = payload, "image/jpeg"
+        else:
+            data, content_type = (json.dumps(payload).encode() if payload is not None else None), "application/json"
+        req = urllib.request.Request(self.url + path, data=data, method=method,
+                                     headers={"Content-Type": content_type})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+# ------------------ Measurement ------------------
+def rss_mb():
+    """Current resident set size of this process (peak RSS where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def drive(client, requests, concurrency):
+    """Send (method, path, payload) requests from `concurrency` threads; return the stats"""
+    latencies = np.zeros(len(requests))
+    statuses = [0] * len(requests)
+    cursor = iter(range(len(requests)))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(cursor, None)
+            if i is None:
+                return
+            method, path, payload = requests[i]
+            started = time.perf_counter()
+            try:
+                statuses[i] = client.request(method, path, payload)
+            except Exception as e:
+                print(f"[WARNING] Request failed: {e}")
+                statuses[i] = -1
+            latencies[i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99])
+    return {
+        "requests": len(requests),
+        "errors": sum(1 for s in statuses if not 200 <= s < 300),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "throughput_rps": round(len(requests) / elapsed, 1),
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+def scenario_requests(name, count, frames, dim, run_id):
+    if name == "status":
+        return [("GET", "/api/face/status", None)] * count
+    if name == "verify-frame":
+        images = [base64.b64encode(frame).decode() for frame in frames]
+        return [("POST", "/api/face/verify-frame", {"image": images[i % len(images)]}) for i in range(count)]
+    if name == "verify-frame-raw":
+        return [("POST", "/api/face/verify-frame", frames[i % len(frames)]) for i in range(count)]
+    rng = np.random.default_rng(count)
+    return [("POST", "/api/face/register-embeddings",
+             {"username": f"bench-{run_id}-{i}", "embeddings": rng.uniform(0, 255, (5, dim)).tolist()})
+            for i in range(count)]
+
+
+def accuracy_queries(snapshot, count, seed=0):
+    """Enrolled vectors of random users plus a little noise, like a fresh capture of them"""
+    rng = np.random.default_rng(seed)
+    names = list(snapshot)
+    picks = rng.choice(len(names), min(count, len(names)), replace=False)
+    rows = np.asarray([snapshot[names[i]][0] for i in picks], dtype=np.float32)
+    noise = rng.normal(0, 0.02, rows.shape) * np.abs(rows).mean(axis=1, keepdims=True)
+    return rows + noise.astype(np.float32)
+
+
+def print_row(strategy, scenario, stats):
+    print(f"{strategy:<8} {scenario:<20} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f} "
+          f"{stats['throughput_rps']:9.1f} {stats['rss_mb']:8.1f} {stats['errors']:6d}")
+
+
+# ------------------ Runs ------------------
+def sample_embedding(image_path):
+    """Embedding of the sample image, registered so verify-frame has a true match"""
+    import cv2
+    from face_auth.embedders import get_embedder
+    frame = cv2.imdecode(np.frombuffer(make_frames(1, image_path)[0], np.uint8), cv2.IMREAD_COLOR)
+    embedding = get_embedder().embed(frame)
+    return None if embedding is None else np.asarray([embedding] * 5, dtype=np.float32)
+
+
+def run_in_process(args, frames):
+    import face_auth.gallery as gallery_module
+    from face_auth.index import INDEX_TYPES
+    import face_auth_api
+
+    from face_auth import cache
+    from face_auth.index import evaluate
+
+    # Repeated frames are answered from the result caches unless disabled
+    cache.frame_cache.enabled = cache.match_cache.enabled = not args.no_cache
+
+    strategies = args.strategies or sorted(INDEX_TYPES)
+    results, accuracy = {}, {}
+    workdir = tempfile.mkdtemp(prefix="face-bench-")
+    try:
+        extra = None
+        if args.image:
+            embedding = sample_embedding(args.image)
+            extra = {"sample-user": embedding} if embedding is not None else None
+        base_path = os.path.join(workdir, "face_db")
+        started = time.perf_counter()
+        store = make_gallery(base_path, args.users, args.k, args.dim, extra=extra)
+        print(f"[INFO] Gallery written in {time.perf_counter() - started:.1f} s")
+
+        for strategy in strategies:
+            # Fresh gallery per strategy so each pays its own load and index build
+            started = time.perf_counter()
+            gallery_module._gallery = gallery_module.FaceGallery(base_path, index_kind=strategy).load()
+            face_auth_api.warm_up()
+            print(f"[INFO] {strategy}: gallery + index ready in {time.perf_counter() - started:.2f} s, RSS {rss_mb():.0f} MB")
+            gallery = gallery_module._gallery
+            report = evaluate(gallery.index(), gallery.snapshot(), accuracy_queries(gallery.snapshot(), args.queries))
+            accuracy[strategy] = {key: report[key] for key in ("recall@1", "mean_score_error", "max_score_error", "index_mb")}
+            print(f"[INFO] {strategy}: recall@1 {report['recall@1']:.3f}, confidence error mean "
+                  f"{report['mean_score_error']:.4f} / max {report['max_score_error']:.4f}, index {report['index_mb']} MB")
+            client = TestClient(face_auth_api.app)
+            for scenario in args.scenarios:
+                requests = scenario_requests(scenario, args.requests, frames, store.dim, strategy)
+                stats = drive(client, requests, args.concurrency)
+                results[f"{strategy}/{scenario}"] = stats
+                print_row(strategy, scenario, stats)
+            if os.path.exists(gallery_module._gallery.index_path):
+                os.remove(gallery_module._gallery.index_path)
+    finally:
+        gallery_module._gallery = None
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results, accuracy
+
+
+def run_http(args, frames):
+    client = HttpClient(args.url)
+    results = {}
+    for scenario in args.scenarios:
+        requests = scenario_requests(scenario, args.requests, frames, args.dim or 7, f"http{os.getpid()}")
+        stats = drive(client, requests, args.concurrency)
+        results[f"http/{scenario}"] = stats
+        print_row("http", scenario, stats)
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    """Print p95 changes against a saved run; return the regressed keys"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for key, stats in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["p95_ms"], stats["p95_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = "REGRESSION" if change > tolerance else "ok"
+        print(f"[{flag}] {key}: p95 {before:.2f} -> {after:.2f} ms ({change:+.0%})")
+        if change > tolerance:
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the face API under synthetic load")
+    parser.add_argument("--users", type=int, default=1000, help="synthetic gallery size (1k-1M)")
+    parser.add_argument("--k", type=int, default=5, help="embeddings per user")
+    parser.add_argument("--dim", type=int, default=None, help="embedding size (default: the embedder's)")
+    parser.add_argument("--strategies", nargs="*", help="index kinds to compare (default: all)")
+    parser.add_argument("--scenarios", nargs="*", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--image", help="sample face image for verify-frame (default: faceless frames)")
+    parser.add_argument("--frames", type=int, default=20, help="distinct synthetic frames")
+    parser.add_argument("--queries", type=int, default=200, help="probes for the accuracy report")
+    parser.add_argument("--no-cache", action="store_true", help="disable the frame/match result caches (in-process)")
+    parser.add_argument("--url", help="benchmark a running server over HTTP instead of in-process")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown vs the baseline")
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.image)
+    print(f"{'strategy':<8} {'scenario':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'RSS MB':>8} {'errors':>6}")
+    accuracy = {}
+    if args.url:
+        results = run_http(args, frames)
+    else:
+        results, accuracy = run_in_process(args, frames)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results, "accuracy": accuracy}, f, indent=2)
+        print(f"[INFO] Results written to {args.json}")
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,89 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import cv2
+import numpy as np
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.detector import FaceDetector, FaceTracker, face_cascade
+
+# Face detection throughput on sample images:
+#   python benchmarks/detection.py --images "samples/*.jpg" --frames 200
+# Each image is replayed as a short "video" (small shifts frame to frame) and
+# detected three ways: the original full-resolution detectMultiScale, the
+# downscaled detector, and the downscaled detector with ROI tracking.
+
+
+def load_frames(patterns, frames, width):
+    """Grayscale frames built from the sample images, `frames` per image"""
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)})
+    if not paths:
+        raise SystemExit(f"[ERROR] No sample images match {patterns}")
+    sequences = []
+    rng = np.random.default_rng(0)
+    for path in paths:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"[WARNING] Skipping unreadable image {path}")
+            continue
+        if width and gray.shape[1] != width:
+            gray = cv2.resize(gray, (width, int(gray.shape[0] * width / gray.shape[1])))
+        # Random walk of a few pixels per frame, like a hand-held webcam
+        offsets = np.cumsum(rng.integers(-3, 4, size=(frames, 2)), axis=0)
+        sequence = []
+        for dx, dy in offsets:
+            shift = np.float32([[1, 0, dx], [0, 1, dy]])
+            sequence.append(cv2.warpAffine(gray, shift, (gray.shape[1], gray.shape[0]), borderMode=cv2.BORDER_REPLICATE))
+        sequences.append(sequence)
+    return sequences
+
+
+def run(name, sequences, detect_sequence):
+    total = sum(len(s) for s in sequences)
+    found = 0
+    started = time.perf_counter()
+    for sequence in sequences:
+        found += detect_sequence(sequence)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<28} {total / elapsed:8.1f} frames/s  {elapsed / total * 1000:7.2f} ms/frame  faces found {found}/{total}")
+    return total / elapsed
+
+
+def full_resolution(sequence):
+    return sum(len(face_cascade.detectMultiScale(gray, 1.3, 5)) > 0 for gray in sequence)
+
+
+def downscaled(detector):
+    def detect_sequence(sequence):
+        return sum(detector.detect_one(gray) is not None for gray in sequence)
+    return detect_sequence
+
+
+def tracked(detector):
+    def detect_sequence(sequence):
+        tracker = FaceTracker(detector)
+        found = sum(tracker.detect_one(gray) is not None for gray in sequence)
+        print(f"  tracker: {tracker.roi_hits} ROI hits, {tracker.full_searches} full-frame searches")
+        return found
+    return detect_sequence
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark face detection frames/sec")
+    parser.add_argument("--images", nargs="+", required=True, help="sample image paths or glob patterns")
+    parser.add_argument("--frames", type=int, default=100, help="frames replayed per image")
+    parser.add_argument("--width", type=int, default=640, help="resize samples to this width (0 = as is)")
+    parser.add_argument("--detect-width", type=int, default=320, help="downscaled detection width")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    sequences = load_frames(args.images, args.frames, args.width)
+    detector = FaceDetector(width=args.detect_width)
+
+    print(f"[INFO] {len(sequences)} images x {args.frames} frames, detection width {args.detect_width}")
+    baseline = run("full resolution (before)", sequences, full_resolution)
+    scaled = run("downscaled", sequences, downscaled(detector))
+    tracking = run("downscaled + ROI tracking", sequences, tracked(detector))
+    print(f"[RESULT] speedup: downscaled {scaled / baseline:.1f}x, with tracking {tracking / baseline:.1f}x")
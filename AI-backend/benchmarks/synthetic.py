@@ -0,0 +1,116 @@
+import os
+import sys
+import cv2
+import numpy as np
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.embedders import EMBEDDER, embedder_metric
+from face_auth.store import EmbeddingStore
+
+# Synthetic data for benchmarks: galleries of any size written straight into
+# the binary store, and JPEG frames shaped like webcam uploads.
+
+# Embedding size of each backend when no --dim is given
+DEFAULT_DIMS = {"haar-stats": 7, "facenet": 128, "onnx": 128}
+
+# Bulk writes are split into chunks so 1M-user galleries never sit in memory
+CHUNK_USERS = 10000
+
+
+def user_name(i):
+    return f"user{i:07d}"
+
+
+def _haar_stats_users(rng, count, k):
+    """[x, y, w, h, w/h, mean, std] around a per-user face, like login_enhanced produces"""
+    size = rng.uniform(80, 260, count)
+    base = np.column_stack([
+        rng.uniform(0, 640 - size), rng.uniform(0, 480 - size), size, size, np.ones(count),
+        rng.uniform(40, 220, count), rng.uniform(10, 80, count),
+    ])
+    jitter = rng.normal(0, 1, (count, k, 7)) * np.array([4, 4, 3, 3, 0, 2, 1])
+    vectors = base[:, None, :] + jitter
+    vectors[..., 4] = vectors[..., 2] / vectors[..., 3]
+    return vectors
+
+
+def _unit_users(rng, count, k, dim):
+    """Unit vectors clustered per user, like a cosine embedding model produces"""
+    base = rng.normal(size=(count, 1, dim))
+    vectors = base + 0.2 * rng.normal(size=(count, k, dim))
+    return vectors / np.linalg.norm(vectors, axis=2, keepdims=True)
+
+
+def synthetic_users(count, k, dim=None, embedder=EMBEDDER, seed=0, start=0):
+    """Yield (name, k x dim float32 embeddings) for `count` synthetic users"""
+    rng = np.random.default_rng(seed + start)
+    dim = dim or DEFAULT_DIMS.get(embedder, 128)
+    for chunk_start in range(0, count, CHUNK_USERS):
+        n = min(CHUNK_USERS, count - chunk_start)
+        if embedder == "haar-stats" and dim == 7:
+            block = _haar_stats_users(rng, n, k)
+        else:
+            block = _unit_users(rng, n, k, dim)
+        block = block.astype(np.float32)
+        for i in range(n):
+            yield user_name(start + chunk_start + i), block[i]
+
+
+def make_gallery(base_path, users, k=5, dim=None, embedder=EMBEDDER, seed=0, extra=None):
+    """
+    Write a synthetic gallery of `users` x `k` embeddings to a new store.
+    `extra` is an optional {name: embeddings} of real users added first.
+    """
+    store = EmbeddingStore(base_path)
+    if store.exists():
+        raise FileExistsError(f"Store already exists at {store.index_path}")
+    store.open()
+    if extra:
+        store.append_many(extra.items(), embedder=embedder)
+    store.append_many(synthetic_users(users, k, dim, embedder, seed), embedder=embedder)
+    print(f"[INFO] Synthetic gallery: {len(store.meta['users'])} users, {store.meta['rows']} rows "
+          f"of {store.dim}-d {embedder} ({embedder_metric(embedder)}) at {store.index_path}")
+    return store
+
+
+def make_frames(count, image_path=None, width=640, height=480, quality=85, seed=0):
+    """
+    JPEG-encoded frames. With `image_path` each frame is that image shifted by
+    a few pixels (a face the detector finds); otherwise noisy gradients with
+    no face, which exercise decode + a full-frame detection miss.
+    """
+    rng = np.random.default_rng(seed)
+    if image_path:
+        source = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if source is None:
+            raise FileNotFoundError(f"Cannot read sample image {image_path}")
+        source = cv2.resize(source, (width, int(source.shape[0] * width / source.shape[1])))
+    else:
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        source = np.broadcast_to(gradient, (height, width, 3)).astype(np.uint8)
+
+    frames = []
+    for _ in range(count):
+        dx, dy = rng.integers(-6, 7, size=2)
+        shift = np.float32([[1, 0, dx], [0, 1, dy]])
+        frame = cv2.warpAffine(source, shift, (source.shape[1], source.shape[0]), borderMode=cv2.BORDER_REPLICATE)
+        if not image_path:
+            frame = cv2.add(frame, rng.integers(0, 32, frame.shape, dtype=np.uint8))
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frames.append(encoded.tobytes())
+    return frames
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a synthetic face gallery store")
+    parser.add_argument("store", help="store base path (without extension)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5, help="embeddings per user")
+    parser.add_argument("--dim", type=int, default=None)
+    parser.add_argument("--embedder", default=EMBEDDER)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    make_gallery(args.store, args.users, args.k, args.dim, args.embedder, args.seed)
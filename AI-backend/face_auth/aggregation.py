@@ -0,0 +1,133 @@
+import math
+import os
+import numpy as np
+from face_auth.calibration import ScoreCalibrator
+
+# Multi-frame evidence for a login. Each frame's top candidates are turned
+# into log-odds with the gallery's score calibration (log(p / (1 - p))),
+# summed per user, and compared to Wald's sequential probability ratio
+# test bounds: the session stops as soon as one user is confidently
+# accepted, or every user confidently rejected.
+
+# Target false accept / false reject rates of the sequential test
+ALPHA = float(os.environ.get("FACE_SPRT_ALPHA", "0.001"))
+BETA = float(os.environ.get("FACE_SPRT_BETA", "0.01"))
+
+# Frames of one login are correlated (same face, same light), so no decision
+# is taken on fewer frames and a single frame's evidence is capped
+MIN_FRAMES = int(os.environ.get("FACE_SPRT_MIN_FRAMES", "3"))
+MAX_FRAME_EVIDENCE = float(os.environ.get("FACE_SPRT_MAX_FRAME_EVIDENCE", "3.0"))
+
+# Candidates kept per frame; users outside a frame's top-K are credited
+# with that frame's K-th score (an upper bound of theirs)
+CANDIDATES = int(os.environ.get("FACE_SPRT_CANDIDATES", "5"))
+
+ACCEPT = "accept"
+REJECT = "reject"
+
+
+# ------------------ Evidence Aggregator ------------------
+class EvidenceAggregator:
+    """
+    Per-user evidence over the frames of one login.
+
+    add() takes one frame's candidates as (username, score) best first
+    (top_k / index.search output). decision() is ACCEPT once the leading
+    user's summed log-odds reach log((1 - beta) / alpha) and exceed the
+    runner-up's by as much, REJECT once they fall to log(beta / (1 - alpha)),
+    and None while the evidence is inconclusive. The per-frame cap applies
+    to the accept/reject evidence only; users are ranked and separated on
+    the uncapped log-odds, so two users scoring near 1.0 are still told apart.
+    """
+
+    def __init__(self, calibrator=None, alpha=ALPHA, beta=BETA, min_frames=MIN_FRAMES,
+                 max_frame_evidence=MAX_FRAME_EVIDENCE):
+        self.calibrator = calibrator or ScoreCalibrator()
+        self.accept_at = math.log((1 - beta) / alpha)
+        self.reject_at = math.log(beta / (1 - alpha))
+        self.min_frames = min_frames
+        self.max_frame_evidence = max_frame_evidence
+        self.frames = 0
+        self._scores = {}              # user -> scores in the frames where they were a candidate
+        # (capped, uncapped) log-odds sums: per user over the frames where they were a
+        # candidate, the floor credited in those frames, and the floor over all frames
+        self._evidence = {}
+        self._floor_credit = {}
+        self._floor_total = np.zeros(2)
+        self._truncated = False        # whether any frame left users out
+
+    def add(self, candidates, truncated=None):
+        """
+        Record one frame's candidates. `truncated` says whether users were
+        left out (default: as many candidates as CANDIDATES were given).
+        Returns decision().
+        """
+        if not candidates:
+            return self.decision()
+        self.frames += 1
+        scores = np.array([score for _, score in candidates], dtype=np.float64)
+        raw = self.calibrator.log_odds(scores)
+        evidence = np.column_stack([np.clip(raw, -self.max_frame_evidence, self.max_frame_evidence), raw])
+        if truncated is None:
+            truncated = len(candidates) >= CANDIDATES
+        floor = evidence[-1] if truncated else np.zeros(2)
+        self._truncated = self._truncated or truncated
+        self._floor_total += floor
+        for (name, score), value in zip(candidates, evidence):
+            self._scores.setdefault(name, []).append(float(score))
+            self._evidence[name] = self._evidence.get(name, 0.0) + value
+            self._floor_credit[name] = self._floor_credit.get(name, 0.0) + floor
+        return self.decision()
+
+    def _sums(self, name):
+        """(capped, uncapped) log-odds of `name`, with the floor credited for frames they were not a candidate in"""
+        return self._evidence.get(name, 0.0) + self._floor_total - self._floor_credit.get(name, 0.0)
+
+    def evidence(self, name):
+        """Summed (capped) log-odds that the frames show `name`"""
+        return float(self._sums(name)[0])
+
+    def ranking(self):
+        """Users seen so far, best first, as (username, uncapped log-odds)"""
+        return sorted(((name, float(self._sums(name)[1])) for name in self._evidence), key=lambda item: -item[1])
+
+    @property
+    def leader(self):
+        ranking = self.ranking()
+        return ranking[0][0] if ranking else None
+
+    def margin(self, ranking=None):
+        """Leader's uncapped log-odds minus the runner-up's (how distinct the leading user is)"""
+        ranking = self.ranking() if ranking is None else ranking
+        if not ranking:
+            return 0.0
+        # Users never among the candidates are bounded by the summed floors
+        unseen = self._floor_total[1] if self._truncated else -math.inf
+        runner_up = max(ranking[1][1] if len(ranking) > 1 else -math.inf, unseen)
+        return ranking[0][1] - runner_up
+
+    def stats(self, name):
+        """Frames, mean, median and max score, and evidence for one user"""
+        scores = self._scores.get(name)
+        if not scores:
+            return {"frames": 0, "mean": 0.0, "median": 0.0, "max": 0.0, "evidence": 0.0}
+        return {"frames": len(scores), "mean": float(np.mean(scores)), "median": float(np.median(scores)),
+                "max": max(scores), "evidence": self.evidence(name)}
+
+    def decision(self):
+        if self.frames < self.min_frames or not self._evidence:
+            return None
+        ranking = self.ranking()
+        evidence = self.evidence(ranking[0][0])
+        if evidence <= self.reject_at:
+            return REJECT
+        if evidence >= self.accept_at and self.margin(ranking) >= self.accept_at:
+            return ACCEPT
+        return None
+
+    def summary(self):
+        leader = self.leader
+        margin = self.margin()
+        return dict(self.stats(leader), username=leader, decision=self.decision(),
+                    margin=margin if math.isfinite(margin) else None,
+                    accept_at=self.accept_at, reject_at=self.reject_at, total_frames=self.frames)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from face_auth.metrics import CACHE_ENTRIES, CACHE_LOOKUPS
+
+# Short-lived caches for clients retrying the same or a near-identical frame
+# during a login. Entries are tied to the gallery version they were computed
+# against, so any registration or reload invalidates them.
+
+# Set FACE_CACHE=0 to disable both caches
+ENABLED = os.environ.get("FACE_CACHE", "1") == "1"
+
+# Entries kept per cache, and seconds an entry stays valid
+CACHE_SIZE = int(os.environ.get("FACE_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.environ.get("FACE_CACHE_TTL", "30"))
+
+# Embeddings are snapped to a grid of this fraction of their norm, so frames
+# whose embeddings differ by less (same pose, same light) share a match
+EMBEDDING_STEP = float(os.environ.get("FACE_CACHE_EMBEDDING_STEP", "0.01"))
+
+# Stored for frames without a face, which are worth caching too
+NO_FACE = object()
+
+
+# ------------------ LRU/TTL Cache ------------------
+class ResultCache:
+    """
+    Bounded LRU cache with a TTL whose entries belong to one gallery version.
+    A lookup or insert for a newer version empties it first.
+    """
+
+    def __init__(self, name, max_entries=CACHE_SIZE, ttl=CACHE_TTL, enabled=ENABLED):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled and max_entries > 0
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+            CACHE_ENTRIES.set(0, cache=self.name)
+
+    def get(self, key, version):
+        """Cached value for `key` computed against gallery `version`, or None"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        CACHE_LOOKUPS.inc(cache=self.name, result="miss" if entry is None else "hit")
+        return None if entry is None else entry[1]
+
+    def put(self, key, version, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            if version != self.version:
+                # Computed against a gallery that has changed since
+                if self.version is not None and version < self.version:
+                    return
+                self._check_version(version)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            CACHE_ENTRIES.set(len(self._entries), cache=self.name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            CACHE_ENTRIES.set(0, cache=self.name)
+
+
+# ------------------ Keys ------------------
+def frame_key(image_bytes):
+    """Content hash of an encoded frame (identical retries)"""
+    return hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+
+def embedding_key(embedding, step=EMBEDDING_STEP):
+    """Quantized embedding (near-duplicate frames)"""
+    embedding = np.asarray(embedding, dtype=np.float32).ravel()
+    scale = max(float(np.linalg.norm(embedding)) * step, 1e-12)
+    return np.rint(embedding / scale).astype(np.int32).tobytes()
+
+
+# Whole-frame results (decode, detect and match skipped) and match results
+frame_cache = ResultCache("frame")
+match_cache = ResultCache("match")
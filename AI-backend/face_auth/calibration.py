@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+import numpy as np
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.matcher import EmbeddingMatcher, score_rows
+from face_auth.metrics import get_logger
+
+logger = get_logger("calibration")
+
+# Raw matcher scores are not probabilities and differ per metric (Euclidean
+# 1 - d / MAX_DISTANCE vs mean cosine). A logistic curve fitted on the gallery
+# maps them to an estimated probability that the probe is that user:
+#   python face_auth/calibration.py fit
+# writes <store>.calibration.json, loaded by the gallery on first use.
+
+# Uncalibrated default: 0.5 at the login threshold, ~0.12 / 0.88 at -/+ 0.1
+DEFAULT_SLOPE = 20.0
+DEFAULT_MIDPOINT = float(os.environ.get("FACE_CALIBRATION_MIDPOINT", "0.65"))
+
+
+# ------------------ Calibrator ------------------
+class ScoreCalibrator:
+    """confidence = 1 / (1 + exp(-slope * (score - midpoint)))"""
+
+    def __init__(self, slope=DEFAULT_SLOPE, midpoint=DEFAULT_MIDPOINT, metric="euclidean", fitted=False):
+        self.slope = slope
+        self.midpoint = midpoint
+        self.metric = metric
+        self.fitted = fitted
+
+    def __call__(self, scores):
+        confidence = 1.0 / (1.0 + np.exp(-self.slope * (np.asarray(scores, dtype=np.float64) - self.midpoint)))
+        return float(confidence) if np.ndim(confidence) == 0 else confidence
+
+    def log_odds(self, scores):
+        """log(confidence / (1 - confidence)), the evidence a score carries"""
+        return self.slope * (np.asarray(scores, dtype=np.float64) - self.midpoint)
+
+    @classmethod
+    def fit(cls, genuine, impostor, metric="euclidean", iterations=50, ridge=1e-3):
+        """Logistic regression (Newton's method) of same-user vs other-user scores"""
+        x = np.concatenate([genuine, impostor]).astype(np.float64)
+        y = np.concatenate([np.ones(len(genuine)), np.zeros(len(impostor))])
+        if len(genuine) == 0 or len(impostor) == 0:
+            raise ValueError("Calibration needs both same-user and other-user scores")
+        features = np.column_stack([x, np.ones_like(x)])
+        weights = np.zeros(2)
+        for _ in range(iterations):
+            p = 1.0 / (1.0 + np.exp(-features @ weights))
+            gradient = features.T @ (p - y) + ridge * weights
+            hessian = (features * (p * (1 - p))[:, None]).T @ features + ridge * np.eye(2)
+            step = np.linalg.solve(hessian, gradient)
+            weights -= step
+            if np.abs(step).max() < 1e-8:
+                break
+        slope, intercept = weights
+        if slope <= 0:
+            raise ValueError("Scores do not separate same-user from other-user pairs")
+        return cls(float(slope), float(-intercept / slope), metric, fitted=True)
+
+    def to_dict(self):
+        return {"slope": self.slope, "midpoint": self.midpoint, "metric": self.metric}
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+def load_calibrator(path, metric="euclidean"):
+    """The calibration fitted for this gallery, or the default curve"""
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return ScoreCalibrator(metric=metric)
+    if data.get("metric", "euclidean") != metric:
+        logger.warning("Ignoring calibration fitted for another metric", extra={"path": path, "metric": data.get("metric")})
+        return ScoreCalibrator(metric=metric)
+    return ScoreCalibrator(data["slope"], data["midpoint"], metric, fitted=True)
+
+
+# ------------------ Fitting on a Gallery ------------------
+def gallery_scores(db, metric="euclidean", max_users=2000, seed=0, chunk=256):
+    """
+    Leave-one-out scores from an enrolled gallery: each sampled user's first
+    embedding against their other embeddings (genuine) and against the best
+    other user (impostor). Users with a single embedding are skipped.
+    """
+    matcher = EmbeddingMatcher(db, metric)
+    candidates = np.flatnonzero(matcher.counts >= 2)
+    rng = np.random.default_rng(seed)
+    if len(candidates) > max_users:
+        candidates = rng.choice(candidates, max_users, replace=False)
+
+    genuine, impostor = [], []
+    for start in range(0, len(candidates), chunk):
+        users = candidates[start:start + chunk]
+        probes = matcher.matrix[matcher.offsets[users]]
+        scores = matcher.score_matrix(probes)
+        for row, (uid, probe) in enumerate(zip(users, probes)):
+            rows = matcher.user_rows(matcher.users[uid])
+            genuine.append(score_rows(probe, rows[1:], metric))
+            scores[row, uid] = -np.inf
+            impostor.append(float(scores[row].max()) if scores.shape[1] > 1 else 0.0)
+    return np.asarray(genuine), np.asarray(impostor)
+
+
+def fit_gallery(gallery, max_users=2000):
+    """Fit and save the calibration for a FaceGallery; returns the calibrator"""
+    genuine, impostor = gallery_scores(gallery.snapshot(), gallery.metric, max_users)
+    calibrator = ScoreCalibrator.fit(genuine, impostor, gallery.metric)
+    calibrator.save(gallery.calibration_path)
+    logger.info("Fitted score calibration", extra={"slope": round(calibrator.slope, 2),
+                                                   "midpoint": round(calibrator.midpoint, 4),
+                                                   "genuine": len(genuine), "impostor": len(impostor),
+                                                   "path": gallery.calibration_path})
+    return calibrator
+
+
+if __name__ == "__main__":
+    import argparse
+    from face_auth.gallery import FaceGallery
+    from face_auth.store import STORE_FILE
+
+    parser = argparse.ArgumentParser(description="Fit or show the score calibration of a face gallery")
+    parser.add_argument("command", choices=["fit", "show"])
+    parser.add_argument("--store", default=STORE_FILE, help="store base path (without extension)")
+    parser.add_argument("--max-users", type=int, default=2000, help="users sampled for fitting")
+    args = parser.parse_args()
+
+    gallery = FaceGallery(args.store).load()
+    calibrator = fit_gallery(gallery, args.max_users) if args.command == "fit" else gallery.calibrator()
+    print(f"metric: {calibrator.metric}")
+    print(f"fitted: {calibrator.fitted}")
+    print(f"slope: {calibrator.slope:.3f}")
+    print(f"midpoint (50% confidence): {calibrator.midpoint:.4f}")
+    for score in (0.5, 0.6, 0.7, 0.8, 0.9):
+        print(f"  score {score:.2f} -> confidence {calibrator(score):.3f}")
@@ -0,0 +1,140 @@
+import os
+import cv2
+import numpy as np
+from face_auth.embedders import EMBEDDER
+from face_auth.metrics import timed
+
+# Haar cascade shared by every detector in the process (loaded once)
+face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+# haar-stats embeds the box itself ([x, y, w, h, ...]), so its stored
+# embeddings only match boxes from the original full-resolution search;
+# downscaling and the size window are opt-in there. Embedders that only
+# crop the box default to the faster downscaled search.
+_BOX_IS_EMBEDDING = EMBEDDER == "haar-stats"
+
+# Run the cascade on frames downscaled to this width (0 = full resolution)
+DETECT_WIDTH = int(os.environ.get("FACE_DETECT_WIDTH", "0" if _BOX_IS_EMBEDDING else "320"))
+SCALE_FACTOR = float(os.environ.get("FACE_DETECT_SCALE_FACTOR", "1.3"))
+MIN_NEIGHBORS = int(os.environ.get("FACE_DETECT_MIN_NEIGHBORS", "5"))
+
+# Plausible face sizes as a fraction of the frame's shorter side
+MIN_FACE = float(os.environ.get("FACE_DETECT_MIN_FACE", "0" if _BOX_IS_EMBEDDING else "0.1"))
+MAX_FACE = float(os.environ.get("FACE_DETECT_MAX_FACE", "1.0"))
+
+# Tracking searches the previous box grown by this fraction on each side
+TRACK_MARGIN = float(os.environ.get("FACE_TRACK_MARGIN", "0.5"))
+
+# Never shrink a frame so far that the smallest wanted face drops below this
+# many pixels; the cascade's own window is 24x24
+MIN_WINDOW = 30
+
+
+# ------------------ Detector ------------------
+class FaceDetector:
+    """
+    Haar detection, optionally on a downscaled copy of the frame.
+
+    Boxes are mapped back to full-resolution coordinates, so callers see
+    the same (x, y, w, h) as a full-size detectMultiScale, and faces
+    outside [min_face, max_face] of the shorter side are never searched.
+    """
+
+    def __init__(self, width=DETECT_WIDTH, scale_factor=SCALE_FACTOR, min_neighbors=MIN_NEIGHBORS,
+                 min_face=MIN_FACE, max_face=MAX_FACE, cascade=None):
+        self.width = width
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_face = min_face
+        self.max_face = max_face
+        self.cascade = cascade or face_cascade
+
+    def detect(self, gray, roi=None, min_size=None, max_size=None):
+        """
+        Return an (N, 4) int array of face boxes in `gray` coordinates.
+        `roi` = (x0, y0, x1, y1) limits the search to part of the frame;
+        `min_size`/`max_size` (pixels) override the face size range.
+        """
+        height, width = gray.shape[:2]
+        short_side = min(height, width)
+        min_size = int(min_size or self.min_face * short_side)
+        max_size = int(max_size or self.max_face * short_side)
+
+        x0 = y0 = 0
+        if roi is not None:
+            x0, y0 = max(0, int(roi[0])), max(0, int(roi[1]))
+            x1, y1 = min(width, int(roi[2])), min(height, int(roi[3]))
+            if x1 - x0 < MIN_WINDOW or y1 - y0 < MIN_WINDOW:
+                return np.zeros((0, 4), dtype=np.int32)
+            gray = gray[y0:y1, x0:x1]
+
+        scale = 1.0
+        if self.width and gray.shape[1] > self.width:
+            scale = min(1.0, max(self.width / gray.shape[1], MIN_WINDOW / max(min_size, 1)))
+        small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        smallest = max(int(min_size * scale), 24)
+        largest = max(int(max_size * scale), smallest)
+        with timed("detect"):
+            faces = self.cascade.detectMultiScale(small, self.scale_factor, self.min_neighbors,
+                                                  minSize=(smallest, smallest), maxSize=(largest, largest))
+        if len(faces) == 0:
+            return np.zeros((0, 4), dtype=np.int32)
+        boxes = np.round(np.asarray(faces, dtype=np.float64) / scale).astype(np.int32)
+        boxes[:, 0] += x0
+        boxes[:, 1] += y0
+        return boxes
+
+    def detect_one(self, gray):
+        """First face box as an (x, y, w, h) tuple, or None"""
+        faces = self.detect(gray)
+        return tuple(int(v) for v in faces[0]) if len(faces) else None
+
+
+# ------------------ Tracker ------------------
+class FaceTracker:
+    """
+    Per-session detection state: once a face is found, later frames only
+    search a window around the previous box at a similar scale, falling
+    back to a full-frame search when the face is lost.
+
+    One tracker belongs to one stream or batch of the same person; it is
+    not meant to be shared across unrelated requests.
+    """
+
+    def __init__(self, detector=None, margin=TRACK_MARGIN):
+        self.detector = detector or get_detector()
+        self.margin = margin
+        self.box = None
+        self.roi_hits = 0
+        self.full_searches = 0
+
+    def detect_one(self, gray):
+        box = self.box
+        if box is not None:
+            x, y, w, h = box
+            pad_x, pad_y = int(w * self.margin), int(h * self.margin)
+            faces = self.detector.detect(gray, roi=(x - pad_x, y - pad_y, x + w + pad_x, y + h + pad_y),
+                                         min_size=int(w * 0.7), max_size=int(w * 1.4))
+            if len(faces):
+                self.roi_hits += 1
+                self.box = tuple(int(v) for v in faces[0])
+                return self.box
+
+        self.full_searches += 1
+        self.box = self.detector.detect_one(gray)
+        return self.box
+
+    def reset(self):
+        self.box = None
+
+
+_detector = None
+
+
+def get_detector():
+    """Return the process-wide detector configured from the environment"""
+    global _detector
+    if _detector is None:
+        _detector = FaceDetector()
+    return _detector
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+import numpy as np
+from face_auth.metrics import get_logger, timed
+
+logger = get_logger("embedders")
+
+# Embedding backend used by the API: "haar-stats" (default), "facenet" or "onnx".
+# Heavy libraries (OpenCV DNN, DeepFace/TensorFlow) are imported only when the
+# chosen backend is loaded, once per process.
+EMBEDDER = os.environ.get("FACE_EMBEDDER", "haar-stats")
+
+# ONNX face embedding model for the "onnx" backend (e.g. an ArcFace/SFace export)
+ONNX_MODEL = os.environ.get("FACE_ONNX_MODEL", "")
+ONNX_INPUT_SIZE = int(os.environ.get("FACE_ONNX_INPUT_SIZE", "112"))
+
+_REGISTRY = {}
+
+
+def register_embedder(cls):
+    """Class decorator adding an embedder to the registry under `cls.name`"""
+    _REGISTRY[cls.name] = cls
+    return cls
+
+
+def available_embedders():
+    return sorted(_REGISTRY)
+
+
+def _gray(frame):
+    import cv2
+    if frame.ndim == 2:
+        return frame
+    with timed("color_convert"):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def get_detector():
+    from face_auth.detector import get_detector
+    return get_detector()
+
+
+def _bgr(frame):
+    import cv2
+    if frame.ndim == 3:
+        return frame
+    with timed("color_convert"):
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+# ------------------ Embedders ------------------
+class Embedder:
+    """
+    Base class, in two steps: `detect(frame, tracker)` finds the face box
+    in a grayscale or BGR frame (None without a face) and
+    `embed_crops(frames, boxes)` embeds the faces of several frames at
+    once (face_auth/utils/preprocess.py prepares the crops), returning 1D
+    float vectors. `embed(frame, tracker)` does both for one frame.
+    `tracker` is an optional FaceTracker carried across the frames of one
+    session.
+    """
+
+    name = None
+    # Whether embed() wants colour input (decides how frames are decoded)
+    color = False
+    # How the matcher compares vectors from this backend
+    metric = "euclidean"
+    # Length of the vectors (None when it depends on the loaded model)
+    dim = None
+
+    def load(self):
+        return self
+
+    def detect(self, frame, tracker=None):
+        """(x, y, w, h) of the face to embed, or None"""
+        gray = _gray(frame)
+        return tracker.detect_one(gray) if tracker is not None else get_detector().detect_one(gray)
+
+    def embed_crops(self, frames, boxes):
+        raise NotImplementedError
+
+    def embed(self, frame, tracker=None):
+        box = self.detect(frame, tracker)
+        return None if box is None else self.embed_crops([frame], [box])[0]
+
+    def embed_batch(self, frames, tracker=None):
+        """embed() for several frames of one person, with one embed_crops() call"""
+        boxes = [self.detect(frame, tracker) for frame in frames]
+        found = [i for i, box in enumerate(boxes) if box is not None]
+        embeddings = [None] * len(frames)
+        if found:
+            vectors = self.embed_crops([frames[i] for i in found], [boxes[i] for i in found])
+            for i, vector in zip(found, vectors):
+                embeddings[i] = vector
+        return embeddings
+
+    def warm_up(self):
+        """Run one dummy frame so first-request latency excludes lazy init"""
+        started = time.perf_counter()
+        self.embed(np.zeros((160, 160, 3) if self.color else (160, 160), dtype=np.uint8))
+        return time.perf_counter() - started
+
+
+@register_embedder
+class HaarStatsEmbedder(Embedder):
+    """Haar box position/size plus crop mean/std (the login_enhanced embedding)"""
+
+    name = "haar-stats"
+    dim = 7
+
+    def embed_crops(self, frames, boxes):
+        from face_auth.utils.preprocess import crop_stats
+        rows = np.empty((len(boxes), 7), dtype=np.float64)
+        for i, (frame, box) in enumerate(zip(frames, boxes)):
+            x, y, w, h = box
+            rows[i, :5] = x, y, w, h, w / h
+            rows[i, 5:] = crop_stats(_gray(frame), [box])[0]
+        return list(rows)
+
+
+@register_embedder
+class FacenetEmbedder(Embedder):
+    """Facenet via DeepFace (TensorFlow), as used by register.py / login.py"""
+
+    name = "facenet"
+    color = True
+    metric = "cosine"
+    dim = 128
+
+    def load(self):
+        from deepface import DeepFace
+        self._deepface = DeepFace
+        DeepFace.build_model("Facenet")
+        return self
+
+    def detect(self, frame, tracker=None):
+        # DeepFace detects and aligns the face itself, on the whole frame
+        return (0, 0, frame.shape[1], frame.shape[0])
+
+    def embed_crops(self, frames, boxes):
+        embeddings = []
+        for frame in frames:
+            result = self._deepface.represent(_bgr(frame), model_name="Facenet", enforce_detection=False)
+            if not result or result[0].get("face_confidence", 1) == 0:
+                embeddings.append(None)
+            else:
+                embeddings.append(np.asarray(result[0]["embedding"], dtype=np.float32))
+        return embeddings
+
+
+@register_embedder
+class OnnxEmbedder(Embedder):
+    """
+    CPU embedding model run through OpenCV DNN: Haar detection, aligned
+    crops resized to the model input (one NCHW batch per call) and
+    L2-normalized outputs.
+    """
+
+    name = "onnx"
+    color = True
+    metric = "cosine"
+
+    def __init__(self, model_path=ONNX_MODEL, input_size=ONNX_INPUT_SIZE):
+        self.model_path = model_path
+        self.input_size = input_size
+        self._local = threading.local()
+
+    def load(self):
+        import cv2
+        if not self.model_path or not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"FACE_ONNX_MODEL not found: '{self.model_path}'")
+        self._net = cv2.dnn.readNetFromONNX(self.model_path)
+        self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self._net_lock = threading.Lock()
+        return self
+
+    def _batcher(self):
+        """This thread's crop buffers: (x - 127.5) / 127.5, RGB, NCHW"""
+        batcher = getattr(self._local, "batcher", None)
+        if batcher is None:
+            from face_auth.utils.preprocess import CropBatcher
+            batcher = self._local.batcher = CropBatcher(self.input_size, 3, "nchw", mean=127.5,
+                                                        scale=1.0 / 127.5, swap_rb=True)
+        return batcher
+
+    def embed_crops(self, frames, boxes):
+        blob = self._batcher()(frames, boxes)
+        # A cv2.dnn.Net keeps its input between setInput and forward
+        with self._net_lock:
+            self._net.setInput(blob)
+            vectors = self._net.forward().reshape(len(boxes), -1).astype(np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return list(vectors)
+
+    def warm_up(self):
+        started = time.perf_counter()
+        with self._net_lock:
+            self._net.setInput(np.zeros((1, 3, self.input_size, self.input_size), dtype=np.float32))
+            self._net.forward()
+        return time.perf_counter() - started
+
+
+# ------------------ Embedder Cache ------------------
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_embedder(name=None):
+    """Return the loaded embedder `name` (default FACE_EMBEDDER), loading it once"""
+    name = name or EMBEDDER
+    embedder = _loaded.get(name)
+    if embedder is None:
+        with _loaded_lock:
+            embedder = _loaded.get(name)
+            if embedder is None:
+                if name not in _REGISTRY:
+                    raise ValueError(f"Unknown face embedder '{name}', expected one of {available_embedders()}")
+                started = time.perf_counter()
+                embedder = _REGISTRY[name]().load()
+                _loaded[name] = embedder
+                logger.info("Loaded embedder", extra={"embedder": name, "ms": round((time.perf_counter() - started) * 1000)})
+    return embedder
+
+
+def embedder_metric(name=None):
+    """Matching metric of a backend, without loading it"""
+    name = name or EMBEDDER
+    return _REGISTRY[name].metric if name in _REGISTRY else "euclidean"
+
+
+def embedder_dim(name=None):
+    """Vector length of a backend without loading it (None if model-dependent or unknown)"""
+    name = name or EMBEDDER
+    return _REGISTRY[name].dim if name in _REGISTRY else None
+
+
+def warm_up_embedder(name=None):
+    """Load the configured embedder and run it once (called at boot)"""
+    embedder = get_embedder(name)
+    elapsed = embedder.warm_up()
+    logger.info("Warmed up embedder", extra={"embedder": embedder.name, "ms": round(elapsed * 1000)})
+    return embedder
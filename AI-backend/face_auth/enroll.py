@@ -0,0 +1,218 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from face_auth.embedders import get_embedder
+from face_auth.metrics import get_logger, timed
+from face_auth.utils.preprocess import crop_stats, crop_view
+
+logger = get_logger("enroll")
+
+# One-shot enrollment from a burst of frames or a short clip: every frame is
+# decoded, searched and scored on a worker pool, the best few (sharp, large,
+# well exposed, in varied poses) are embedded as one batch and written to
+# the gallery in a single operation.
+
+# Frames kept per enrolled user, and frames considered per request
+KEEP = int(os.environ.get("FACE_ENROLL_KEEP", "5"))
+MAX_FRAMES = int(os.environ.get("FACE_ENROLL_MAX_FRAMES", "60"))
+
+# Fewer usable frames than this and the enrollment is refused
+MIN_FRAMES = int(os.environ.get("FACE_ENROLL_MIN_FRAMES", "3"))
+
+# Frames whose face crop is blurrier (Laplacian variance at QUALITY_SIZE) or
+# smaller (fraction of the frame's shorter side) than this are not used
+MIN_SHARPNESS = float(os.environ.get("FACE_ENROLL_MIN_SHARPNESS", "20"))
+MIN_FACE = float(os.environ.get("FACE_ENROLL_MIN_FACE", "0.12"))
+
+# Weight of pose diversity against quality when picking frames (0 = quality only)
+DIVERSITY = float(os.environ.get("FACE_ENROLL_DIVERSITY", "0.5"))
+
+WORKERS = int(os.environ.get("FACE_ENROLL_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Crops are compared at a fixed size so sharpness does not depend on distance
+QUALITY_SIZE = 112
+# Side of the thumbnail used to tell poses apart
+POSE_SIZE = 16
+# Sharpness and face size at which a frame scores full marks
+SHARPNESS_TARGET = 150.0
+FACE_TARGET = 0.35
+
+
+class EnrollmentError(ValueError):
+    """The frames sent cannot produce an enrollment (too few usable faces)"""
+
+
+# ------------------ Frame Sources ------------------
+def video_frames(data, max_frames=MAX_FRAMES, color=None):
+    """
+    Up to `max_frames` frames spread evenly over a video clip (any format
+    FFmpeg reads), BGR when `color` (default: the embedder takes colour), else gray
+    """
+    if color is None:
+        color = get_embedder().color
+    with tempfile.NamedTemporaryFile(suffix=".video") as f:
+        f.write(data)
+        f.flush()
+        cap = cv2.VideoCapture(f.name)
+        try:
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or max_frames
+            step = max(1, total // max_frames)
+            frames = []
+            index = 0
+            while len(frames) < max_frames:
+                if index % step:
+                    # Skip without converting the frame
+                    if not cap.grab():
+                        break
+                else:
+                    ok, frame = cap.read()
+                    if not ok:
+                        break
+                    frames.append(frame if color else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+                index += 1
+        finally:
+            cap.release()
+    if not frames:
+        raise EnrollmentError("Unsupported or empty video")
+    return frames
+
+
+# ------------------ Frame Quality ------------------
+def assess(frame, embedder):
+    """
+    Detect the face in one decoded frame and score it: None without a face,
+    else a dict with the box, sharpness, face size, exposure, quality in
+    [0, 1] and a pose thumbnail for diversity
+    """
+    box = embedder.detect(frame)
+    if box is None:
+        return None
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    crop = cv2.resize(crop_view(gray, box), (QUALITY_SIZE, QUALITY_SIZE), interpolation=cv2.INTER_AREA)
+    _, lap_std = cv2.meanStdDev(cv2.Laplacian(crop, cv2.CV_64F))
+    sharpness = float(lap_std[0, 0]) ** 2
+    face_size = box[2] / float(min(gray.shape[:2]))
+    brightness, contrast = crop_stats(gray, [box])[0]
+    # Full marks between 60 and 190 mean brightness, fading out towards black / white
+    exposure = float(np.clip(min(brightness - 20, 235 - brightness) / 40.0, 0.0, 1.0))
+
+    # Pose thumbnail: zero-mean, unit-norm, so frames differ by shape, not lighting
+    pose = cv2.resize(crop, (POSE_SIZE, POSE_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    pose -= pose.mean()
+    pose /= max(float(np.linalg.norm(pose)), 1e-6)
+
+    usable = sharpness >= MIN_SHARPNESS and face_size >= MIN_FACE and contrast > 0
+    quality = (min(1.0, sharpness / SHARPNESS_TARGET) * min(1.0, face_size / FACE_TARGET) * exposure
+               if usable else 0.0)
+    return {"box": box, "sharpness": sharpness, "face_size": face_size, "exposure": exposure,
+            "quality": quality, "usable": usable and quality > 0, "pose": pose}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="face-enroll")
+    return _pool
+
+
+def assess_frames(frames, embedder=None):
+    """
+    Decode (bytes / base64) or take decoded frames and assess them in
+    parallel; returns (frames, assessments) with None for frames that
+    could not be decoded or show no face
+    """
+    from face_auth.pipeline import decode_bgr, decode_gray
+
+    embedder = embedder or get_embedder()
+    decode = decode_bgr if embedder.color else decode_gray
+
+    def run(item):
+        try:
+            frame = item if isinstance(item, np.ndarray) else decode(item)
+            return frame, assess(frame, embedder)
+        except Exception as e:
+            logger.debug("Skipping enrollment frame", extra={"error": str(e)})
+            return None, None
+
+    with timed("assess"):
+        results = list(_get_pool().map(run, frames))
+    return [frame for frame, _ in results], [found for _, found in results]
+
+
+# ------------------ Frame Selection ------------------
+def select_frames(assessments, keep=KEEP, diversity=DIVERSITY):
+    """
+    Indices of up to `keep` usable frames, picked greedily: each pick
+    maximizes quality minus `diversity` x its similarity to the closest
+    pose already picked, so a burst of identical frames is not kept whole
+    """
+    candidates = [i for i, found in enumerate(assessments) if found is not None and found["usable"]]
+    if not candidates:
+        return []
+    quality = np.array([assessments[i]["quality"] for i in candidates])
+    poses = np.stack([assessments[i]["pose"] for i in candidates])
+    closest = np.full(len(candidates), -np.inf)
+    chosen = []
+    for _ in range(min(keep, len(candidates))):
+        gain = quality - diversity * np.maximum(closest, 0.0)
+        gain[chosen] = -np.inf
+        best = int(np.argmax(gain))
+        chosen.append(best)
+        closest = np.maximum(closest, poses @ poses[best])
+    return [candidates[i] for i in chosen]
+
+
+# ------------------ Enrollment ------------------
+def enroll(name, frames, gallery=None, keep=KEEP, embedder=None):
+    """
+    Enroll `name` from a burst: assess all frames, keep the best `keep`,
+    embed them in one batch and write them to the gallery at once
+    (replacing any previous embeddings). Returns a report dict; raises
+    EnrollmentError when fewer than MIN_FRAMES frames are usable.
+    """
+    from face_auth.gallery import get_gallery
+
+    if keep < MIN_FRAMES:
+        raise EnrollmentError(f"At least {MIN_FRAMES} frames must be kept, not {keep}")
+    embedder = embedder or get_embedder()
+    gallery = gallery or get_gallery()
+    decoded, assessments = assess_frames(frames, embedder)
+    chosen = select_frames(assessments, keep)
+    with_face = sum(1 for found in assessments if found is not None)
+    if len(chosen) < MIN_FRAMES:
+        raise EnrollmentError(f"Only {len(chosen)} usable face frames out of {len(frames)} "
+                              f"({with_face} with a face); at least {MIN_FRAMES} are needed")
+
+    with timed("embed"):
+        vectors = embedder.embed_crops([decoded[i] for i in chosen], [assessments[i]["box"] for i in chosen])
+    kept = [(i, vector) for i, vector in zip(chosen, vectors) if vector is not None]
+    if len(kept) < MIN_FRAMES:
+        raise EnrollmentError("The embedder found no face in the selected frames")
+
+    embeddings = np.stack([np.asarray(vector, dtype=np.float32) for _, vector in kept])
+    with timed("store"):
+        gallery.set_user(name, embeddings, embedder=embedder.name)
+    logger.info("Enrolled user", extra={"user": name, "frames": len(frames), "with_face": with_face,
+                                        "kept": len(kept)})
+    return {
+        "username": name,
+        "embedder": embedder.name,
+        "frames_received": len(frames),
+        "frames_with_face": with_face,
+        "frames_used": len(kept),
+        "selected": [{
+            "frame": i,
+            "quality": round(assessments[i]["quality"], 4),
+            "sharpness": round(assessments[i]["sharpness"], 1),
+            "face_size": round(assessments[i]["face_size"], 4)
+        } for i, _ in kept]
+    }
@@ -0,0 +1,301 @@
+import os
+import threading
+import time
+from face_auth.calibration import load_calibrator
+from face_auth.embedders import EMBEDDER, embedder_dim, embedder_metric
+from face_auth.matcher import EmbeddingMatcher
+from face_auth.metrics import GALLERY_LOAD_SECONDS, GALLERY_USERS, GALLERY_VERSION, get_logger, observe_stage
+from face_auth.index import INDEX_KIND, INDEX_TYPES
+from face_auth.store import (DEFAULT_STORE_FILE, EmbedderMismatchError, EmbeddingStore, PICKLE_FILE, STORE_FILE,
+                             StoreMismatchError, migrate_from_pickle)
+
+# Process-resident view of the face database.
+# Legacy pickle DB, migrated into the binary store on first load
+DB_FILE = PICKLE_FILE
+
+logger = get_logger("gallery")
+
+# Persist the index after this many incremental inserts
+INDEX_SAVE_EVERY = int(os.environ.get("FACE_INDEX_SAVE_EVERY", "100"))
+
+# How often (seconds) readers may stat the store's WAL to pick up changes
+# written by other processes. Reads in between never touch the disk.
+CHECK_INTERVAL = float(os.environ.get("FACE_GALLERY_CHECK_INTERVAL", "1.0"))
+
+
+# ------------------ Gallery ------------------
+class FaceGallery:
+    """
+    In-memory view of the embedding store shared by every request in the process.
+
+    The store is memory-mapped once; local writes append to it and swap in
+    a new snapshot, and writes made by other processes are read from the
+    store's WAL at most once every `check_interval` seconds and applied
+    incrementally. A store tagged with a different embedder than
+    `embedder` is refused.
+    """
+
+    def __init__(self, store_path=STORE_FILE, check_interval=CHECK_INTERVAL, index_kind=INDEX_KIND,
+                 embedder=EMBEDDER):
+        self.store = EmbeddingStore(store_path)
+        self.path = self.store.index_path
+        # Search index persisted next to the DB
+        self.index_path = store_path + ".index.npz"
+        # Score calibration fitted for this gallery (see face_auth/calibration.py)
+        self.calibration_path = store_path + ".calibration.json"
+        if index_kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown face index '{index_kind}', expected one of {sorted(INDEX_TYPES)}")
+        self.index_kind = index_kind
+        self.embedder = embedder
+        self.metric = embedder_metric(embedder)
+        self.check_interval = check_interval
+        self.version = 0
+        # Full (re)loads, as opposed to incremental WAL updates
+        self.loads = 0
+        self.load_time = 0.0
+        self._db = {}
+        self._stamp = None
+        self._exists = False
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_version = -1
+        self._matcher = None
+        self._matcher_version = -1
+        self._pending_inserts = 0
+        self._calibrator = None
+
+    def load(self):
+        """Map the store from disk, replacing the in-memory snapshot"""
+        with self._lock:
+            started = time.perf_counter()
+            if not self.store.exists() and self._owns_pickle() and os.path.exists(DB_FILE):
+                logger.info("Migrating legacy face DB to the binary store", extra={"pickle": DB_FILE})
+                try:
+                    migrate_from_pickle(DB_FILE, self.store.base_path, self.embedder, embedder_dim(self.embedder))
+                except StoreMismatchError as e:
+                    logger.warning("Not migrating legacy face DB", extra={"pickle": DB_FILE, "error": str(e)})
+            self.store.open()
+            self._install(started)
+            return self
+
+    def _owns_pickle(self):
+        """The legacy pickle belongs to the default store; an explicit FACE_STORE_PATH starts empty"""
+        return self.store.base_path == DEFAULT_STORE_FILE and not os.environ.get("FACE_STORE_PATH")
+
+    def _install(self, started):
+        """Take the store's freshly opened snapshot (full reload)"""
+        self.store.take_changes()
+        self._check_embedder()
+        db = self.store.snapshot()
+        self._db = db
+        self._stamp = self.store.stamp
+        self._exists = self.store.exists()
+        self._last_check = time.monotonic()
+        self.version += 1
+        self.loads += 1
+        self.load_time = time.perf_counter() - started
+        observe_stage("db_load", self.load_time)
+        GALLERY_LOAD_SECONDS.set(self.load_time)
+        self._publish()
+        logger.info("Face gallery loaded", extra={"users": len(db), "path": self.path,
+                                                  "ms": round(self.load_time * 1000, 1)})
+
+    def _publish(self):
+        GALLERY_USERS.set(len(self._db))
+        GALLERY_VERSION.set(self.version)
+
+    def _check_embedder(self):
+        tag = self.store.embedder
+        if tag is None:
+            if len(self.store.meta["users"]):
+                logger.warning("Face DB is not tagged with an embedder", extra={"path": self.path, "assuming": self.embedder})
+        elif tag != self.embedder:
+            raise EmbedderMismatchError(
+                f"Face DB {self.path} holds '{tag}' embeddings but FACE_EMBEDDER is '{self.embedder}'")
+
+    def refresh(self, force=False):
+        """Apply writes other processes made since the last check; True if any"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return False
+        with self._lock:
+            self._last_check = now
+            started = time.perf_counter()
+            self.store.refresh()
+            return self._sync(started)
+
+    def _sync(self, started=None):
+        """Swap in the store's current snapshot, incrementally when possible"""
+        reloaded, changes = self.store.take_changes()
+        if reloaded:
+            self._install(started or time.perf_counter())
+            return True
+        if changes:
+            self._after_write(changes)
+            return True
+        return False
+
+    @property
+    def exists(self):
+        """Whether the store existed at the last load/check"""
+        return self._exists
+
+    def snapshot(self):
+        """Return the current {username: embeddings} mapping (do not mutate)"""
+        self.refresh()
+        return self._db
+
+    def index(self):
+        """Return the search index for the current version, rebuilt on change"""
+        self.refresh()
+        index = self._index
+        if index is None or self._index_version != self.version:
+            with self._lock:
+                if self._index is None or self._index_version != self.version:
+                    self._set_index(self._open_index())
+                    self._index_version = self.version
+                    self._pending_inserts = 0
+                index = self._index
+        return index
+
+    def _set_index(self, index):
+        """Swap the live index, closing the one it replaces (a tiered index holds the store file open)"""
+        old, self._index = self._index, index
+        if old is not None and old is not index and hasattr(old, "close"):
+            old.close()
+
+    def _open_index(self):
+        index_type = INDEX_TYPES[self.index_kind]
+        index = index_type.load(self.index_path, stamp=self._stamp, metric=self.metric)
+        if index is not None:
+            logger.info("Loaded index", extra={"kind": index.kind, "users": len(index), "path": self.index_path})
+            return index
+        started = time.perf_counter()
+        index = index_type(metric=self.metric).build(self._db)
+        index.save(self.index_path, stamp=self._stamp)
+        elapsed = time.perf_counter() - started
+        observe_stage("index_build", elapsed)
+        logger.info("Built index", extra={"kind": index.kind, "users": len(index), "ms": round(elapsed * 1000, 1)})
+        return index
+
+    def matcher(self):
+        """Return an exact EmbeddingMatcher for the current version"""
+        index = self.index()
+        if hasattr(index, "matcher"):
+            return index.matcher()
+        with self._lock:
+            if self._matcher_version != self.version:
+                self._matcher = EmbeddingMatcher(self._db, self.metric)
+                self._matcher_version = self.version
+            return self._matcher
+
+    def calibrator(self):
+        """Maps raw scores to confidences; loaded once per process"""
+        if self._calibrator is None:
+            self._calibrator = load_calibrator(self.calibration_path, self.metric)
+        return self._calibrator
+
+    def users(self):
+        return list(self.snapshot().keys())
+
+    def get(self, name):
+        return self.snapshot().get(name)
+
+    def user_rows(self, name):
+        """
+        One user's embeddings for a 1:1 check, or None if not enrolled;
+        a tiered index serves them from its hot block and reads only them otherwise
+        """
+        index = self.index()
+        if hasattr(index, "user_rows"):
+            return index.user_rows(name)
+        return self.get(name)
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    def __contains__(self, name):
+        return name in self.snapshot()
+
+    def set_user(self, name, embeddings, embedder=None):
+        """
+        Add or replace a user's embeddings in memory and on disk.
+        `embedder` names the backend that produced them (default: the gallery's).
+        """
+        embedder = embedder or self.embedder
+        if embedder != self.embedder:
+            raise EmbedderMismatchError(f"Gallery uses '{self.embedder}' embeddings, got '{embedder}'")
+        # Not under the gallery lock, so concurrent registrations share a group commit
+        # (a legacy untagged store is adopted for the configured embedder)
+        self.store.append(name, embeddings, embedder=embedder, adopt_untagged=True)
+        self._after_store_write()
+
+    def remove_user(self, name):
+        removed = self.store.remove(name)
+        self._after_store_write()
+        return removed
+
+    def apply_changes(self, items):
+        """
+        Write (name, embeddings) puts and (name, None) removals as one commit
+        (used by replicas). Returns [(name, error)] for rejected writes.
+        """
+        failed = self.store.write_many(items, embedder=self.embedder, adopt_untagged=True)
+        self._after_store_write()
+        return failed
+
+    def _after_store_write(self):
+        with self._lock:
+            self._sync()
+        # Periodic maintenance folds the WAL into the main store
+        if self.store.needs_compaction():
+            self.store.compact()
+        elif self.store.needs_checkpoint():
+            self.store.checkpoint()
+        with self._lock:
+            self._sync()
+
+    def _after_write(self, changes):
+        # Swap in a new snapshot so readers holding the old one are unaffected
+        self._db = self.store.snapshot()
+        self._stamp = self.store.stamp
+        self._last_check = time.monotonic()
+        self.version += 1
+        self._publish()
+        self._update_index(changes)
+
+    def _update_index(self, changes):
+        """Apply WAL changes to the live index instead of rebuilding it"""
+        if self._index is None or self._index_version != self.version - 1:
+            return
+        if not self._index.incremental:
+            # Rebuilt lazily from the new snapshot on the next search
+            self._set_index(None)
+            return
+        # Each user's latest span: where its rows sit in the store file
+        spans = {change.name: change.span for change in changes}
+        for name, span in spans.items():
+            if name in self._db:
+                self._index.add(name, self._db[name], span=span)
+            else:
+                self._index.remove(name)
+        self._index_version = self.version
+        self._pending_inserts += 1
+        if self._pending_inserts >= INDEX_SAVE_EVERY:
+            self._index.save(self.index_path, stamp=self._stamp)
+            self._pending_inserts = 0
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+
+
+def get_gallery():
+    """Return the process-wide gallery, loading it on first use"""
+    global _gallery
+    if _gallery is None:
+        with _gallery_lock:
+            if _gallery is None:
+                _gallery = FaceGallery().load()
+    return _gallery
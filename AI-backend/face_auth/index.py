@@ -0,0 +1,689 @@
+import os
+import sys
+import time
+import numpy as np
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.matcher import EmbeddingMatcher, MAX_DISTANCE, top_k
+from face_auth.shards import ShardedIndex
+from face_auth.tiered import TieredIndex
+
+# Index used behind verify-frame: "flat" (exact, default), "ivf" (approximate)
+# "quantized" (compact scan + exact re-rank), "sharded" (exact, multi-process)
+# or "tiered" (exact, hot users in RAM within a budget, the rest read from disk)
+INDEX_KIND = os.environ.get("FACE_INDEX", "flat")
+
+# Number of inverted lists probed per query by the IVF index
+IVF_NPROBE = int(os.environ.get("FACE_IVF_NPROBE", "8"))
+
+# Code type scanned by the quantized index: "int8" (per-vector scale) or "float16"
+QUANT_DTYPE = os.environ.get("FACE_QUANT_DTYPE", "int8")
+
+# Scan one mean vector per user instead of every enrolled embedding
+QUANT_CENTROIDS = os.environ.get("FACE_QUANT_CENTROIDS", "0") == "1"
+
+# Best users from the compact scan re-scored against their raw float32 rows
+# (0 = return the approximate scores as-is)
+QUANT_RERANK = int(os.environ.get("FACE_QUANT_RERANK", "16"))
+
+# Rows dequantized at a time during a scan (a 512 KB float32 buffer at 128-d,
+# small enough to stay in cache between the copy and the product)
+SCAN_BLOCK = 1024
+
+
+def _group_rows(keys, rows):
+    """Yield (key, rows) for each distinct key without a per-key scan"""
+    if len(keys) == 0:
+        return
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    for start, block in zip(starts, np.split(rows[order], starts[1:])):
+        yield int(keys[start]), block
+
+
+# ------------------ Exact Flat Index ------------------
+class FlatIndex:
+    """
+    Exact search over every enrolled embedding (wraps EmbeddingMatcher).
+
+    The matrix is contiguous, so inserts only mark it stale and it is
+    rebuilt on the next search; built from a store snapshot it scores
+    the memory-mapped rows in place.
+    """
+
+    kind = "flat"
+    incremental = False
+
+    def __init__(self, metric="euclidean"):
+        self.metric = metric
+        self._db = {}
+        self._matcher = EmbeddingMatcher({}, metric)
+
+    def __len__(self):
+        return len(self._db)
+
+    def build(self, db):
+        self._db = db
+        self._matcher = EmbeddingMatcher(db, self.metric)
+        return self
+
+    def add(self, name, embeddings, span=None):
+        self._db = dict(self._db)
+        self._db[name] = embeddings
+        self._matcher = None
+
+    def remove(self, name):
+        self._db = dict(self._db)
+        self._db.pop(name, None)
+        self._matcher = None
+
+    def matcher(self):
+        if self._matcher is None:
+            self._matcher = EmbeddingMatcher(self._db, self.metric)
+        return self._matcher
+
+    def search(self, probe, k=1):
+        return self.search_batch(probe, k)[0]
+
+    def search_batch(self, probes, k=1):
+        """Score all probes with one matrix product; one top-k list per probe"""
+        matcher = self.matcher()
+        scores = matcher.score_matrix(probes)
+        return [top_k(matcher.users, row, k) for row in scores]
+
+    def save(self, path, stamp=None):
+        """Nothing to persist: the flat index is rebuilt from the DB"""
+
+    @classmethod
+    def load(cls, path, stamp=None, metric=None):
+        return None
+
+
+# ------------------ IVF Index ------------------
+class IVFIndex:
+    """
+    Inverted-file index: embeddings are bucketed by their nearest k-means
+    centroid and a query only scans the `nprobe` closest buckets.
+
+    New users are appended to their buckets without retraining; the
+    centroids are retrained once the index has grown well past the size
+    it was trained on. With metric="cosine" vectors are L2-normalized and
+    a user's score is their mean cosine similarity, as with FlatIndex: the
+    probed buckets only choose which users get scored.
+    """
+
+    kind = "ivf"
+    incremental = True
+
+    def __init__(self, nlist=None, nprobe=IVF_NPROBE, seed=0, metric="euclidean"):
+        self.metric = metric
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.dim = 0
+        self.users = []
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.trained_size = 0
+        self._user_ids = {}
+        self._user_rows = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._owners = np.zeros(0, dtype=np.int32)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._lists = []
+        # Mean of each user's unit vectors (cosine): their mean cosine is one dot product
+        self._means = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._user_rows)
+
+    # -------- training --------
+    def _kmeans(self, vectors, nlist, iterations=10, max_sample=50000):
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > max_sample:
+            vectors = vectors[rng.choice(len(vectors), max_sample, replace=False)]
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._nearest(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            counts = np.bincount(assign, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids
+
+    @staticmethod
+    def _nearest(vectors, centroids):
+        sq = np.einsum("ij,ij->i", centroids, centroids)
+        return np.argmin(sq[None, :] - 2.0 * vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def build(self, db):
+        blocks, owners = [], []
+        self.users, self._user_ids, self._user_rows = [], {}, {}
+        self.dim = 0
+        for name, embeddings in db.items():
+            block = self._block(embeddings)
+            if block is None:
+                continue
+            uid = self._user_id(name)
+            blocks.append(block)
+            owners.append(np.full(len(block), uid, dtype=np.int32))
+
+        vectors = np.vstack(blocks) if blocks else np.zeros((0, self.dim), dtype=np.float32)
+        nlist = self.nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, max(1, len(vectors)))
+        self.centroids = self._kmeans(vectors, nlist) if len(vectors) else np.zeros((0, self.dim), dtype=np.float32)
+        self.trained_size = len(vectors)
+
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._owners = np.zeros(0, dtype=np.int32)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._lists = [np.zeros(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self._means = np.zeros((0, self.dim), dtype=np.float32)
+        if blocks:
+            self._append(vectors, np.concatenate(owners))
+        return self
+
+    def _block(self, embeddings):
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        block = np.asarray(embeddings, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[None, :]
+        if self.dim == 0:
+            self.dim = block.shape[1]
+        if block.shape[1] != self.dim:
+            return None
+        return self._normalize(block)
+
+    def _normalize(self, block):
+        if self.metric != "cosine":
+            return block
+        return block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+
+    def _user_id(self, name):
+        uid = self._user_ids.get(name)
+        if uid is None:
+            uid = len(self.users)
+            self.users.append(name)
+            self._user_ids[name] = uid
+        return uid
+
+    # -------- incremental updates --------
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._vectors):
+            return
+        capacity = max(needed, 2 * len(self._vectors), 64)
+        grow = lambda a, *shape: np.concatenate([a[:self._size], np.zeros((capacity - self._size,) + shape, dtype=a.dtype)])
+        self._vectors = grow(self._vectors, self.dim)
+        self._sq_norms = grow(self._sq_norms)
+        self._owners = grow(self._owners)
+        self._assign = grow(self._assign)
+        self._alive = grow(self._alive)
+
+    def _append(self, vectors, owners):
+        self._reserve(len(vectors))
+        rows = np.arange(self._size, self._size + len(vectors))
+        assign = self._nearest(vectors, self.centroids)
+        self._vectors[rows] = vectors
+        self._sq_norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+        self._owners[rows] = owners
+        self._assign[rows] = assign
+        self._alive[rows] = True
+        self._size += len(vectors)
+        for uid, block in _group_rows(owners, rows):
+            self._user_rows[self.users[uid]] = block
+        for c, block in _group_rows(assign, rows):
+            self._lists[c] = np.concatenate([self._lists[c], block])
+        self._update_means(owners, rows)
+
+    def _update_means(self, owners, rows):
+        """Recompute the means of the users whose (complete) rows are `rows`"""
+        if self.metric != "cosine":
+            return
+        if len(self._means) < len(self.users):
+            grown = np.zeros((max(len(self.users), 2 * len(self._means)), self.dim), dtype=np.float32)
+            grown[:len(self._means)] = self._means
+            self._means = grown
+        for uid, block in _group_rows(owners, rows):
+            self._means[uid] = self._vectors[block].mean(axis=0)
+
+    def add(self, name, embeddings, span=None):
+        """Insert or replace one user without retraining the centroids"""
+        if len(self.centroids) == 0:
+            db = {n: self._vectors[r] for n, r in self._user_rows.items()}
+            db[name] = embeddings
+            self.build(db)
+            return
+        self.remove(name)
+        block = self._block(embeddings)
+        if block is None:
+            return
+        uid = self._user_id(name)
+        self._append(block, np.full(len(block), uid, dtype=np.int32))
+        if self._size > 4 * max(self.trained_size, 16):
+            self.build({n: self._vectors[r] for n, r in self._user_rows.items()})
+
+    def remove(self, name):
+        rows = self._user_rows.pop(name, None)
+        if rows is not None:
+            self._alive[rows] = False
+
+    # -------- search --------
+    def search(self, probe, k=1):
+        probe = np.asarray(probe, dtype=np.float32).ravel()
+        if probe.shape[0] != self.dim or len(self.centroids) == 0:
+            return []
+        probe = self._normalize(probe[None, :])[0]
+
+        centroid_dist = np.einsum("ij,ij->i", self.centroids, self.centroids) - 2.0 * self.centroids @ probe
+        nprobe = min(self.nprobe, len(self.centroids))
+        probed = np.argpartition(centroid_dist, nprobe - 1)[:nprobe]
+        rows = np.concatenate([self._lists[c] for c in probed])
+        rows = rows[self._alive[rows]]
+        if rows.size == 0:
+            return []
+
+        sq_dist = np.maximum(probe @ probe + self._sq_norms[rows] - 2.0 * self._vectors[rows] @ probe, 0.0)
+        owners = self._owners[rows]
+        order = np.argsort(owners, kind="stable")
+        owners, sq_dist = owners[order], sq_dist[order]
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        if self.metric == "cosine":
+            # Every row of a candidate counts, not just those in the probed buckets
+            scores = self._means[owners[starts]] @ probe
+        else:
+            min_sq_dist = np.minimum.reduceat(sq_dist, starts)
+            scores = np.maximum(0.0, 1.0 - np.sqrt(min_sq_dist) / MAX_DISTANCE)
+        names = [self.users[uid] for uid in owners[starts]]
+        return top_k(names, scores, k)
+
+    def search_batch(self, probes, k=1):
+        probes = np.asarray(probes, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        return [self.search(probe, k) for probe in probes]
+
+    # -------- persistence --------
+    def save(self, path, stamp=None):
+        """Write the index next to the DB (atomic rename)"""
+        live = np.flatnonzero(self._alive[:self._size])
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            users=np.asarray(self.users, dtype=str),
+            centroids=self.centroids,
+            vectors=self._vectors[live],
+            owners=self._owners[live],
+            assign=self._assign[live],
+            meta=np.asarray([self.nprobe, self.trained_size, self.dim]),
+            metric=np.asarray(self.metric),
+            stamp=np.asarray(stamp if stamp else (0, 0), dtype=np.int64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, stamp=None, metric=None):
+        """Load a saved index, or None if missing or built from another DB state"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            if stamp is not None and tuple(data["stamp"]) != tuple(stamp):
+                return None
+            try:
+                users = data["users"].tolist()
+            except ValueError:
+                # Names pickled by an older version are never unpickled: rebuild instead
+                return None
+            saved_metric = str(data["metric"]) if "metric" in data.files else "euclidean"
+            if metric is not None and saved_metric != metric:
+                return None
+            nprobe, trained_size, dim = (int(v) for v in data["meta"])
+            index = cls(nlist=len(data["centroids"]), nprobe=nprobe, metric=saved_metric)
+            index.dim = dim
+            index.users = users
+            index._user_ids = {name: i for i, name in enumerate(index.users)}
+            index.centroids = data["centroids"]
+            index.trained_size = trained_size
+            vectors, owners, assign = data["vectors"], data["owners"], data["assign"]
+
+        index._vectors = np.ascontiguousarray(vectors)
+        index._sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        index._owners = owners.astype(np.int32)
+        index._assign = assign.astype(np.int32)
+        index._alive = np.ones(len(vectors), dtype=bool)
+        index._size = len(vectors)
+        rows = np.arange(len(vectors))
+        for uid, block in _group_rows(index._owners, rows):
+            index._user_rows[index.users[uid]] = block
+        index._lists = [np.zeros(0, dtype=np.int64) for _ in range(len(index.centroids))]
+        for c, block in _group_rows(index._assign, rows):
+            index._lists[c] = block
+        index._means = np.zeros((0, dim), dtype=np.float32)
+        index._update_means(index._owners, rows)
+        return index
+
+
+# ------------------ Quantized Index ------------------
+class QuantizedIndex:
+    """
+    Compact scan over quantized copies of the gallery, then exact re-rank.
+
+    Each vector is stored as int8 codes with a per-vector scale, or as
+    float16, so the scanned matrix is 4x (2x) smaller than the float32
+    rows; with metric="cosine" vectors are L2-normalized first. With
+    `centroids=True` every user is collapsed to the mean of their vectors
+    and a scan costs one dot product per user. The `rerank` best users
+    are re-scored exactly against their raw rows, so returned scores are
+    the same as the flat index's whenever the true best user is among them.
+    """
+
+    kind = "quantized"
+    incremental = True
+
+    def __init__(self, dtype=QUANT_DTYPE, centroids=QUANT_CENTROIDS, rerank=QUANT_RERANK, metric="euclidean"):
+        if dtype not in ("int8", "float16"):
+            raise ValueError(f"Unknown quantization '{dtype}', expected 'int8' or 'float16'")
+        self.metric = metric
+        self.dtype = dtype
+        self.centroids = centroids
+        self.rerank = rerank
+        self.dim = 0
+        self.users = []
+        self._user_ids = {}
+        self._user_rows = {}
+        # Raw rows (usually memory-mapped store slices) used for re-ranking
+        self._raw = {}
+        self._codes = np.zeros((0, 0), dtype=dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._owners = np.zeros(0, dtype=np.int32)
+        self._size = 0
+        self._dead = 0
+        self._runs = None
+
+    def __len__(self):
+        return len(self._user_rows)
+
+    @property
+    def nbytes(self):
+        """Memory scanned per query (codes, scales, norms and owners)"""
+        size = self._size
+        return int(self._codes[:size].nbytes + self._scales[:size].nbytes
+                   + self._sq_norms[:size].nbytes + self._owners[:size].nbytes)
+
+    # -------- encoding --------
+    def _block(self, embeddings):
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        block = np.asarray(embeddings, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[None, :]
+        if self.dim == 0:
+            self.dim = block.shape[1]
+        if block.shape[1] != self.dim:
+            return None
+        return block
+
+    def _encode(self, block):
+        """Return (codes, scales, squared norms) of the vectors to scan for one user"""
+        if self.metric == "cosine":
+            block = block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        if self.centroids:
+            # Mean cosine over a user's vectors is the dot product with their mean
+            block = block.mean(axis=0, keepdims=True)
+        sq_norms = np.einsum("ij,ij->i", block, block)
+        if self.dtype == "float16":
+            return block.astype(np.float16), np.ones(len(block), dtype=np.float32), sq_norms
+        scales = np.abs(block).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(block / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32), sq_norms
+
+    def _user_id(self, name):
+        uid = self._user_ids.get(name)
+        if uid is None:
+            uid = len(self.users)
+            self.users.append(name)
+            self._user_ids[name] = uid
+        return uid
+
+    # -------- updates --------
+    def build(self, db):
+        self.dim = 0
+        self.users, self._user_ids, self._user_rows, self._raw = [], {}, {}, {}
+        encoded = []
+        for name, embeddings in db.items():
+            block = self._block(embeddings)
+            if block is None:
+                continue
+            self._raw[name] = embeddings
+            encoded.append((self._user_id(name),) + self._encode(block))
+        self._size = self._dead = 0
+        self._codes = np.zeros((0, self.dim), dtype=self.dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._owners = np.zeros(0, dtype=np.int32)
+        if encoded:
+            self._reserve(sum(len(codes) for _, codes, _, _ in encoded))
+            for uid, codes, scales, sq_norms in encoded:
+                self._append(uid, codes, scales, sq_norms)
+        self._runs = None
+        return self
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._codes):
+            return
+        capacity = max(needed, 2 * len(self._codes), 64)
+        grow = lambda a, *shape: np.concatenate([a[:self._size], np.zeros((capacity - self._size,) + shape, dtype=a.dtype)])
+        self._codes = grow(self._codes, self.dim)
+        self._scales = grow(self._scales)
+        self._sq_norms = grow(self._sq_norms)
+        self._owners = grow(self._owners)
+
+    def _append(self, uid, codes, scales, sq_norms):
+        # A user's rows stay contiguous, which the per-user reduction relies on
+        start, stop = self._size, self._size + len(codes)
+        self._codes[start:stop] = codes
+        self._scales[start:stop] = scales
+        self._sq_norms[start:stop] = sq_norms
+        self._owners[start:stop] = uid
+        self._user_rows[self.users[uid]] = np.arange(start, stop)
+        self._size = stop
+
+    def add(self, name, embeddings, span=None):
+        """Insert or replace one user (only their rows are encoded)"""
+        self.remove(name)
+        block = self._block(embeddings)
+        if block is None:
+            return
+        codes, scales, sq_norms = self._encode(block)
+        self._reserve(len(codes))
+        self._append(self._user_id(name), codes, scales, sq_norms)
+        self._raw[name] = embeddings
+        self._runs = None
+
+    def remove(self, name):
+        rows = self._user_rows.pop(name, None)
+        if rows is None:
+            return
+        self._raw.pop(name, None)
+        self._owners[rows] = -1
+        self._dead += len(rows)
+        self._runs = None
+        if self._dead > self._size // 2:
+            self.build(self._raw)
+
+    def _layout(self):
+        """Start row and size of every run of rows with one owner, which runs are live and their users"""
+        runs = self._runs
+        if runs is None:
+            owners = self._owners[:self._size]
+            starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if len(owners) else np.zeros(0, dtype=np.int64)
+            run_owners = owners[starts]
+            counts = np.diff(np.r_[starts, len(owners)])
+            live = run_owners >= 0
+            runs = self._runs = (starts, counts, live, [self.users[uid] for uid in run_owners[live]])
+        return runs
+
+    # -------- search --------
+    def _scan(self, probes):
+        """Approximate dot products of F probes with every stored row (F x rows)"""
+        size = self._size
+        dots = np.empty((len(probes), size), dtype=np.float32)
+        buffer = np.empty((min(SCAN_BLOCK, size), self.dim), dtype=np.float32)
+        for start in range(0, size, SCAN_BLOCK):
+            stop = min(start + SCAN_BLOCK, size)
+            block = buffer[:stop - start]
+            np.copyto(block, self._codes[start:stop], casting="unsafe")
+            dots[:, start:stop] = probes @ block.T
+        dots *= self._scales[:size]
+        return dots
+
+    def approximate_scores(self, probes):
+        """Per-user scores from the compact scan: (user names, F x U scores)"""
+        probes = np.asarray(probes, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        starts, counts, live, names = self._layout()
+        if probes.shape[1] != self.dim or len(starts) == 0:
+            return [], np.zeros((len(probes), 0), dtype=np.float32)
+
+        if self.metric == "cosine":
+            probes = probes / np.maximum(np.linalg.norm(probes, axis=1, keepdims=True), 1e-12)
+            scores = np.add.reduceat(self._scan(probes), starts, axis=1) / counts
+        else:
+            probe_sq = np.einsum("ij,ij->i", probes, probes)[:, None]
+            sq_dist = np.maximum(probe_sq + self._sq_norms[:self._size] - 2.0 * self._scan(probes), 0.0)
+            scores = np.maximum(0.0, 1.0 - np.sqrt(np.minimum.reduceat(sq_dist, starts, axis=1)) / MAX_DISTANCE)
+        return names, scores[:, live]
+
+    def search(self, probe, k=1):
+        return self.search_batch(probe, k)[0]
+
+    def search_batch(self, probes, k=1):
+        probes = np.asarray(probes, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        names, scores = self.approximate_scores(probes)
+        if self.rerank <= 0 or len(names) == 0:
+            return [top_k(names, row, k) for row in scores]
+
+        results = []
+        depth = min(max(k, self.rerank), len(names))
+        for probe, row in zip(probes, scores):
+            candidates = [names[i] for i in np.argpartition(-row, depth - 1)[:depth]]
+            exact = EmbeddingMatcher({name: self._raw[name] for name in candidates}, self.metric)
+            results.append(top_k(exact.users, exact.user_scores(probe), k))
+        return results
+
+    def save(self, path, stamp=None):
+        """Nothing to persist: encoding the DB is a single pass"""
+
+    @classmethod
+    def load(cls, path, stamp=None, metric=None):
+        return None
+
+
+# Incremental indexes (incremental = True) take add(name, embeddings, span)
+# and remove(name) for each write; span = (offset, count) of the rows in
+# the store file, which only the tiered index reads. The others are
+# rebuilt from the new snapshot.
+INDEX_TYPES = {FlatIndex.kind: FlatIndex, IVFIndex.kind: IVFIndex, QuantizedIndex.kind: QuantizedIndex,
+               ShardedIndex.kind: ShardedIndex, TieredIndex.kind: TieredIndex}
+
+
+def create_index(kind=INDEX_KIND, metric="euclidean"):
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown face index '{kind}', expected one of {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](metric=metric)
+
+
+# ------------------ Recall / Latency Report ------------------
+def evaluate(index, db, queries, k=1):
+    """
+    Compare an index against exact search on the same DB.
+    Returns recall@k of the exact best match plus per-query latency.
+    """
+    exact = FlatIndex(metric=index.metric).build(db)
+    hits, exact_times, index_times, score_errors = 0, [], [], []
+    for probe in queries:
+        started = time.perf_counter()
+        truth = exact.search(probe, 1)
+        exact_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        found = index.search(probe, k)
+        index_times.append(time.perf_counter() - started)
+
+        if not truth or truth[0][0] in {name for name, _ in found}:
+            hits += 1
+        if truth:
+            # How far the reported confidence is from the exact one
+            score_errors.append(abs(truth[0][1] - (found[0][1] if found else 0.0)))
+
+    ms = lambda times, q: float(np.percentile(times, q) * 1000) if times else 0.0
+    return {
+        "index": index.kind,
+        "users": len(db),
+        "queries": len(queries),
+        f"recall@{k}": hits / max(1, len(queries)),
+        "mean_score_error": float(np.mean(score_errors)) if score_errors else 0.0,
+        "max_score_error": float(np.max(score_errors)) if score_errors else 0.0,
+        "index_mb": round(getattr(index, "nbytes", exact.matcher().matrix.nbytes) / 2**20, 2),
+        "exact_mb": round(exact.matcher().matrix.nbytes / 2**20, 2),
+        "exact_p50_ms": ms(exact_times, 50),
+        "exact_p95_ms": ms(exact_times, 95),
+        "index_p50_ms": ms(index_times, 50),
+        "index_p95_ms": ms(index_times, 95),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report recall/latency of a face index on a synthetic gallery")
+    parser.add_argument("--kind", default="ivf", choices=sorted(INDEX_TYPES))
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--per-user", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=IVF_NPROBE)
+    parser.add_argument("--metric", default="euclidean", choices=["euclidean", "cosine"])
+    parser.add_argument("--dtype", default=QUANT_DTYPE, choices=["int8", "float16"], help="quantized index codes")
+    parser.add_argument("--centroids", action="store_true", help="quantized index: one mean vector per user")
+    parser.add_argument("--rerank", type=int, default=QUANT_RERANK, help="quantized index: users re-scored exactly")
+    parser.add_argument("--budget-mb", type=float, default=None, help="tiered index: RAM for hot users")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(0, 40, (args.users, args.dim)).astype(np.float32)
+    db = {f"user{i}": (centers[i] + rng.normal(0, 5, (args.per_user, args.dim))).astype(np.float32)
+          for i in range(args.users)}
+    picks = rng.integers(0, args.users, args.queries)
+    queries = centers[picks] + rng.normal(0, 5, (args.queries, args.dim)).astype(np.float32)
+
+    started = time.perf_counter()
+    if args.kind == QuantizedIndex.kind:
+        index = QuantizedIndex(args.dtype, args.centroids, args.rerank, metric=args.metric)
+    else:
+        index = create_index(args.kind, args.metric)
+    if isinstance(index, IVFIndex):
+        index.nprobe = args.nprobe
+    if isinstance(index, TieredIndex) and args.budget_mb is not None:
+        index.budget_mb = args.budget_mb
+    index.build(db)
+    print(f"[INFO] Built {args.kind} index over {args.users} users in {time.perf_counter() - started:.2f} s")
+    for key, value in evaluate(index, db, queries).items():
+        print(f"{key}: {value}")
+    if hasattr(index, "stats"):
+        for key, value in index.stats().items():
+            print(f"{key}: {value}")
@@ -1,11 +1,11 @@
 import cv2
 import os
 import pickle
-import numpy as np
 import sys
 # Add parent directory to path to import from project root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from deepface import DeepFace
+from face_auth.embedders import get_embedder
+from face_auth.matcher import EmbeddingMatcher
 from text_sound.tts import speak   # import TTS function
 
 DB_FILE = "face_db.pkl"
@@ -17,11 +17,6 @@ def load_db():
             return pickle.load(f)
     return {}
 
-# ------------------ Face Matching ------------------
-def verify_face(embedding, embeddings):
-    sims = [np.dot(embedding, e) / (np.linalg.norm(embedding) * np.linalg.norm(e)) for e in embeddings]
-    return np.mean(sims)
-
 # ------------------ Login ------------------
 def login():
     db = load_db()
@@ -38,6 +33,10 @@ def login():
 
     speak("Please look at the camera to login.")
 
+    matcher = EmbeddingMatcher(db)
+    # Facenet is loaded once here instead of on every DeepFace.represent call
+    embedder = get_embedder("facenet")
+
     authenticated_user = None
 
     while True:
@@ -48,14 +47,11 @@ def login():
         cv2.imshow("Login - Press Q to quit", frame)
 
         try:
-            embedding = DeepFace.represent(frame, model_name="Facenet", enforce_detection=False)
-            embedding = embedding[0]["embedding"]
-
-            for name, embeddings in db.items():
-                score = verify_face(embedding, embeddings)
+            embedding = embedder.embed(frame)
+            if embedding is not None:
+                name, score = matcher.best_match(embedding, metric="cosine")
                 if score > 0.7:  # similarity threshold
                     authenticated_user = name
-                    break
         except:
             pass
 
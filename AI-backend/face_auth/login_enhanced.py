@@ -1,23 +1,23 @@
 import cv2
 import os
-import pickle
 import numpy as np
 import sys
 import time
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.detector import FaceTracker, face_cascade  # noqa: F401 - face_cascade re-exported
+from face_auth.embedders import get_embedder
+from face_auth.gallery import get_gallery
+from face_auth.matcher import MAX_DISTANCE
+from face_auth.metrics import get_logger, timed
+from face_auth.session import LoginSession, VERIFICATION_FRAMES
 
-# Simple face detection without DeepFace
-# Use absolute path to ensure database is in AI-backend root directory
-DB_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "face_db.pkl")
-
-# Load Haar cascade for face detection
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+logger = get_logger("detect")
 
 # ------------------ Database Utils ------------------
 def load_db():
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, "rb") as f:
-            return pickle.load(f)
-    return {}
+    """Return the in-memory gallery mapping (loaded from disk once per process)"""
+    return get_gallery().snapshot()
 
 # ------------------ Simple Face Matching ------------------
 def verify_face(embedding, embeddings, threshold=0.8):
@@ -27,34 +27,45 @@ def verify_face(embedding, embeddings, threshold=0.8):
     if embedding is None or len(embeddings) == 0:
         return 0.0
 
-    min_distance = float('inf')
-    for stored_embedding in embeddings:
-        # Euclidean distance
-        distance = np.linalg.norm(embedding - stored_embedding)
-        min_distance = min(min_distance, distance)
+    # Euclidean distance to every stored embedding at once
+    distances = np.linalg.norm(np.asarray(embeddings, dtype=np.float64) - embedding, axis=1)
+    min_distance = distances.min()
 
     # Convert distance to similarity score (higher is better)
     # Normalize distance (assuming max reasonable distance is around 1000)
-    similarity = max(0, 1 - (min_distance / 1000))
+    similarity = max(0, 1 - (min_distance / MAX_DISTANCE))
     return similarity
 
+def find_best_match(embedding):
+    """
+    Search the gallery index for the closest registered user.
+    Returns (username, score), or (None, 0.0) when nobody matches.
+    """
+    results = get_gallery().index().search(embedding, k=1)
+    return results[0] if results else (None, 0.0)
+
 # ------------------ Simple Face Detection ------------------
-def detect_face(frame):
+def detect_face(frame, tracker=None):
     """Simple face detection using Haar cascades"""
     try:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-
-        if len(faces) > 0:
-            # Return a simple feature vector based on face position and size
-            x, y, w, h = faces[0]  # Use first detected face
-            # Create a simple embedding based on face characteristics
-            embedding = np.array([x, y, w, h, w/h, gray[y:y+h, x:x+w].mean(), gray[y:y+h, x:x+w].std()])
-            return embedding
-        else:
-            return None
+        with timed("color_convert"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    except Exception as e:
+        logger.warning("Face detection failed", extra={"error": str(e)})
+        return None
+    return detect_face_gray(gray, tracker)
+
+def detect_face_gray(gray, tracker=None):
+    """
+    Face detection on an already grayscale frame (skips the color conversion).
+    With a FaceTracker, frames after the first only search near the last face.
+    """
+    try:
+        # A simple feature vector from the face position and size and the
+        # crop's mean/std (the haar-stats embedder, shared with the API)
+        return get_embedder("haar-stats").embed(gray, tracker)
     except Exception as e:
-        print(f"[WARNING] Face detection failed: {e}")
+        logger.warning("Face detection failed", extra={"error": str(e)})
         return None
 
 # ------------------ Enhanced Login ------------------
@@ -62,10 +73,11 @@ def login(max_attempts=50, confidence_threshold=0.65):
     """
     Enhanced login with more frames and better verification
     """
-    db = load_db()
-    if not db:
+    gallery = get_gallery()
+    if len(gallery) == 0:
         print("[ERROR] No users found in database. Please register first.")
         return None
+    matcher = gallery.matcher()
 
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
@@ -81,59 +93,38 @@ def login(max_attempts=50, confidence_threshold=0.65):
         cap.read()
         time.sleep(0.1)
 
-    authenticated_user = None
-    attempt_count = 0
-    best_match_score = 0
-    best_match_user = None
-
     # Collect multiple frames for verification
-    verification_frames = 15
+    session = LoginSession(matcher, max_attempts, confidence_threshold, VERIFICATION_FRAMES,
+                           calibrator=gallery.calibrator())
+    tracker = FaceTracker()
+    verification_frames = session.verification_frames
 
-    while attempt_count < max_attempts:
+    while not session.done:
         ret, frame = cap.read()
         if not ret:
             print("[WARNING] Failed to capture frame")
-            attempt_count += 1
+            session.add_missed_frame()
             continue
 
         # Flip frame horizontally for mirror effect
         frame = cv2.flip(frame, 1)
 
         # Display status
-        status_text = f"Verifying... Frame {min(attempt_count + 1, verification_frames)}/{verification_frames}"
+        status_text = f"Verifying... Frame {min(session.attempt_count + 1, verification_frames)}/{verification_frames}"
         cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
 
-        if best_match_user:
-            cv2.putText(frame, f"Best match: {best_match_user} ({best_match_score:.2f})", (10, 60),
+        if session.best_match_user:
+            cv2.putText(frame, f"Best match: {session.best_match_user} ({session.best_match_score:.2f})", (10, 60),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
         cv2.imshow("Enhanced Login - Press Q to quit", frame)
 
         # Try to detect face
-        embedding = detect_face(frame)
+        embedding = detect_face(frame, tracker)
 
         if embedding is not None:
-            attempt_count += 1
-
-            # Check against all users
-            for name, embeddings in db.items():
-                score = verify_face(embedding, embeddings)
-
-                if score > best_match_score:
-                    best_match_score = score
-                    best_match_user = name
-
-                if score > confidence_threshold:
-                    authenticated_user = name
-                    print(f"[INFO] High confidence match found for {name} (score: {score:.3f})")
-                    break
-
-            print(f"[INFO] Frame {attempt_count}/{verification_frames} processed. Best match: {best_match_user} (score: {best_match_score:.3f})")
-
-            # Check if we have enough frames and high confidence
-            if attempt_count >= verification_frames and best_match_score > confidence_threshold:
-                authenticated_user = best_match_user
-                break
+            session.add_embedding(embedding)
+            print(f"[INFO] Frame {session.attempt_count}/{verification_frames} processed. Best match: {session.best_match_user} (score: {session.best_match_score:.3f})")
 
         if cv2.waitKey(1) & 0xFF == ord("q"):
             break
@@ -141,12 +132,12 @@ def login(max_attempts=50, confidence_threshold=0.65):
     cap.release()
     cv2.destroyAllWindows()
 
-    if authenticated_user and best_match_score > confidence_threshold:
-        print(f"[SUCCESS] Logged in as {authenticated_user} (confidence: {best_match_score:.3f})")
-        return authenticated_user
+    if session.authenticated:
+        print(f"[SUCCESS] Logged in as {session.authenticated_user} (confidence: {session.best_match_score:.3f})")
+        return session.authenticated_user
     else:
-        if best_match_user:
-            print(f"[INFO] Best match was {best_match_user} with score {best_match_score:.3f}, but below threshold")
+        if session.best_match_user:
+            print(f"[INFO] Best match was {session.best_match_user} with score {session.best_match_score:.3f}, but below threshold")
         print("[ERROR] Login failed - user not recognized or confidence too low")
         return None
 
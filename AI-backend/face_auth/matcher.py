@@ -0,0 +1,175 @@
+import numpy as np
+from face_auth.metrics import get_logger
+
+logger = get_logger("matcher")
+
+# Distance at which the Euclidean similarity reaches 0 (see verify_face)
+MAX_DISTANCE = 1000.0
+
+
+# ------------------ Vectorized 1:N Matching ------------------
+class EmbeddingMatcher:
+    """
+    All enrolled embeddings packed into one contiguous float32 matrix.
+
+    Rows are grouped per user so a probe is scored against the whole
+    gallery with a single matrix product followed by a per-user
+    reduction (min distance or mean cosine) via `reduceat`. A store
+    snapshot is used as-is, without copying its memory-mapped rows.
+    """
+
+    def __init__(self, db, metric="euclidean"):
+        self.metric = metric
+        # Store snapshots already hold one contiguous (memory-mapped) matrix
+        if getattr(db, "matrix", None) is not None:
+            self._init_from_snapshot(db)
+            return
+
+        users, blocks, counts = [], [], []
+        dim = None
+        for name, embeddings in db.items():
+            if embeddings is None or len(embeddings) == 0:
+                continue
+            block = np.asarray(embeddings, dtype=np.float32)
+            if block.ndim == 1:
+                block = block[None, :]
+            if dim is None:
+                dim = block.shape[1]
+            if block.shape[1] != dim:
+                logger.warning("Skipping user with mismatched embedding size",
+                               extra={"user": name, "size": block.shape[1], "gallery_size": dim})
+                continue
+            users.append(name)
+            blocks.append(block)
+            counts.append(len(block))
+
+        counts = np.asarray(counts, dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64) if len(counts) else counts
+        matrix = np.ascontiguousarray(np.vstack(blocks)) if blocks else np.zeros((0, dim or 0), dtype=np.float32)
+        self._setup(users, matrix, offsets, counts)
+
+    @classmethod
+    def from_arrays(cls, users, matrix, offsets, counts, metric="euclidean"):
+        """Matcher over rows already laid out in `matrix` (e.g. a slice of the store)"""
+        matcher = cls.__new__(cls)
+        matcher.metric = metric
+        matcher._setup(users, matrix, offsets, counts)
+        return matcher
+
+    def _init_from_snapshot(self, snapshot):
+        """Score the snapshot's rows in place; garbage rows between users are skipped"""
+        self._setup(list(snapshot.users), snapshot.matrix, snapshot.offsets, snapshot.counts)
+
+    def _setup(self, users, matrix, offsets, counts):
+        self.users = users
+        self.dim = matrix.shape[1]
+        self.matrix = matrix
+        self.offsets = offsets
+        self.counts = counts
+        self.owners = np.repeat(np.arange(len(users), dtype=np.int32), counts)
+        self.sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        self.norms = np.sqrt(self.sq_norms)
+        # name -> position, built on first user_rows() (chunk scans never need it)
+        self._index = None
+
+        # reduceat reduces [bounds[j], bounds[j + 1]); add the end of every
+        # user block as a boundary so rows that belong to nobody form their
+        # own segments, then keep only the segments that start a user block.
+        ends = offsets + counts
+        bounds = np.union1d(offsets, ends[ends < len(matrix)])
+        self._bounds = bounds
+        self._columns = np.searchsorted(bounds, offsets)
+        self._contiguous = len(bounds) == len(offsets)
+
+    def _reduce(self, ufunc, values):
+        reduced = ufunc.reduceat(values, self._bounds, axis=1)
+        return reduced if self._contiguous else reduced[:, self._columns]
+
+    def __len__(self):
+        return len(self.users)
+
+    def _probes(self, probes):
+        probes = np.asarray(probes, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        return probes
+
+    def score_matrix(self, probes, metric=None, rows=None):
+        """
+        Score probes (F x D) against every user, returning an F x U array.
+
+        metric="euclidean": 1 - min distance / MAX_DISTANCE, clipped at 0
+        metric="cosine":    mean cosine similarity over the user's embeddings
+        Defaults to the metric the matcher was built with. `rows` replaces
+        the matrix with the same rows read into another buffer (the layout
+        and norms computed at construction are reused).
+        """
+        metric = metric or self.metric
+        probes = self._probes(probes)
+        if probes.shape[1] != self.dim or len(self.users) == 0:
+            return np.zeros((len(probes), len(self.users)), dtype=np.float32)
+
+        dots = probes @ (self.matrix if rows is None else rows).T
+        if metric == "cosine":
+            probe_norms = np.linalg.norm(probes, axis=1)[:, None]
+            sims = dots / np.maximum(probe_norms * self.norms[None, :], 1e-12)
+            return self._reduce(np.add, sims) / self.counts[None, :]
+
+        probe_sq = np.einsum("ij,ij->i", probes, probes)[:, None]
+        sq_dist = np.maximum(probe_sq + self.sq_norms[None, :] - 2.0 * dots, 0.0)
+        min_dist = np.sqrt(self._reduce(np.minimum, sq_dist))
+        return np.maximum(0.0, 1.0 - min_dist / MAX_DISTANCE)
+
+    def user_scores(self, probe, metric=None):
+        """Per-user scores for a single probe, aligned with self.users"""
+        return self.score_matrix(probe, metric)[0]
+
+    def best_match(self, probe, metric=None):
+        """Return (username, score) of the best user, or (None, 0.0)"""
+        scores = self.user_scores(probe, metric)
+        if scores.size == 0:
+            return None, 0.0
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            return None, 0.0
+        return self.users[best], float(scores[best])
+
+    def user_rows(self, name):
+        """Return the embedding rows enrolled for one user (empty if unknown)"""
+        if self._index is None:
+            self._index = {name: i for i, name in enumerate(self.users)}
+        i = self._index.get(name)
+        if i is None:
+            return self.matrix[:0]
+        start = self.offsets[i]
+        return self.matrix[start:start + self.counts[i]]
+
+
+# ------------------ Top-K ------------------
+def top_k(names, scores, k):
+    """Return the k best (name, score) pairs, best first, ignoring zero scores"""
+    if len(scores) == 0:
+        return []
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(names[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+# ------------------ 1:1 Matching ------------------
+def score_rows(probe, rows, metric="euclidean"):
+    """
+    Score one probe against a single user's rows on the same scale as
+    EmbeddingMatcher.score_matrix, without touching the rest of the gallery.
+    """
+    probe = np.asarray(probe, dtype=np.float32).ravel()
+    rows = np.asarray(rows, dtype=np.float32)
+    if rows.ndim == 1:
+        rows = rows[None, :]
+    if len(rows) == 0 or rows.shape[1] != probe.shape[0]:
+        return 0.0
+    if metric == "cosine":
+        norms = np.linalg.norm(rows, axis=1) * np.linalg.norm(probe)
+        return float(np.mean(rows @ probe / np.maximum(norms, 1e-12)))
+    min_dist = np.sqrt(np.min(np.sum((rows - probe) ** 2, axis=1)))
+    return float(max(0.0, 1.0 - min_dist / MAX_DISTANCE))
@@ -0,0 +1,245 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process metrics for the face API, exposed in the Prometheus text format
+# at /metrics. Each pre-fork worker keeps its own values and a scrape is
+# answered by whichever worker accepts it; only face_process_info carries
+# that worker's `pid`, so other series are per-worker snapshots that can't
+# be summed across workers. Run one worker (FACE_AUTH_WORKERS=1) when exact
+# totals matter.
+
+# Log level and format ("text" key=value lines or "json") for the face_auth loggers
+LOG_LEVEL = os.environ.get("FACE_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("FACE_LOG_FORMAT", "text")
+
+# Send a Server-Timing header on every response (otherwise only on request,
+# when the client sends "X-Face-Timing: 1")
+SERVER_TIMING = os.environ.get("FACE_SERVER_TIMING", "0") == "1"
+
+# Seconds; covers a ~0.1 ms index lookup up to a multi-second model load
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    # Label values escape backslash, double quote and newline (text format 0.0.4)
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# ------------------ Metric Types ------------------
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_labels(self.label_names, key)} {value}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][slot] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), key + (le,))} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    # Set at scrape time: pre-fork workers inherit the master's values
+    with PROCESS_INFO._lock:
+        PROCESS_INFO._values = {(str(os.getpid()),): 1}
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ------------------ Face Auth Metrics ------------------
+STAGE_SECONDS = Histogram("face_stage_seconds", "Time spent per processing stage", ["stage"])
+REQUEST_SECONDS = Histogram("face_request_seconds", "Request latency by endpoint", ["endpoint", "method"])
+REQUESTS = Counter("face_requests_total", "Requests by endpoint and status", ["endpoint", "method", "status"])
+FRAMES = Counter("face_frames_total", "Frames processed, by outcome", ["result"])
+MATCHES = Counter("face_matches_total", "Frames whose best match was a registered user")
+THRESHOLD_HITS = Counter("face_threshold_hits_total", "Matches above the confidence threshold")
+GALLERY_USERS = Gauge("face_gallery_users", "Users in the loaded gallery")
+GALLERY_LOAD_SECONDS = Gauge("face_gallery_load_seconds", "Duration of the last gallery load")
+GALLERY_VERSION = Gauge("face_gallery_version", "Gallery version (bumped on every reload or write)")
+CACHE_LOOKUPS = Counter("face_cache_lookups_total", "Result cache lookups by cache and outcome", ["cache", "result"])
+CACHE_ENTRIES = Gauge("face_cache_entries", "Entries held by each result cache", ["cache"])
+PROCESS_INFO = Gauge("face_process_info", "Serving process", ["pid"])
+STARTUP_SECONDS = Gauge("face_startup_seconds", "Duration of each startup step (imports, gallery, embedder)", ["step"])
+TIER_LOOKUPS = Counter("face_tier_lookups_total", "Tiered index lookups by kind and the tier that answered", ["kind", "tier"])
+TIER_HOT_USERS = Gauge("face_tier_hot_users", "Users held in the tiered index's in-RAM block")
+TIER_HOT_BYTES = Gauge("face_tier_hot_bytes", "Memory held by the tiered index (hot block and chunk buffers)")
+TIER_CHUNKS = Counter("face_tier_chunks_total", "Cold chunks read and scored, or skipped as all hot", ["result"])
+TIER_CHUNK_SECONDS = Histogram("face_tier_chunk_seconds", "Time to read and score one cold chunk")
+REPLICA_SEQ = Gauge("face_replica_seq", "Leader store seq applied by this replica")
+REPLICA_PULLS = Counter("face_replica_pulls_total", "Replica pulls from the leader, by kind and outcome", ["kind", "result"])
+PROFILED_REQUESTS = Counter("face_profiled_requests_total", "Requests followed by the profiler, by mode", ["mode"])
+SLOW_REQUESTS = Counter("face_slow_requests_total", "Requests slower than FACE_SLOW_REQUEST_MS", ["endpoint"])
+
+
+# ------------------ Request Timings ------------------
+_timings = contextvars.ContextVar("face_request_timings", default=None)
+_timings_lock = threading.Lock()
+
+
+def start_request():
+    """Begin collecting stage timings for the current request"""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def request_timings():
+    return _timings.get() or {}
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of the block as `stage` (histogram + Server-Timing)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def server_timing_header(timings):
+    """Server-Timing value, e.g. "decode;dur=1.20, detect;dur=5.31" (milliseconds)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+
+
+# ------------------ Logging ------------------
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    One line per record: the message followed by the fields passed via
+    `extra=` as key=value pairs, or a JSON object with FACE_LOG_FORMAT=json.
+    """
+
+    def __init__(self, fmt_json=False):
+        super().__init__()
+        self.fmt_json = fmt_json
+
+    def format(self, record):
+        fields = {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS}
+        if self.fmt_json:
+            entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                     "pid": record.process, "msg": record.getMessage(), **fields}
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        line = f"[{record.levelname}] {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging():
+    """Attach the structured handler to the face_auth logger (idempotent)"""
+    logger = logging.getLogger("face_auth")
+    if not any(getattr(h, "_face_auth", False) for h in logger.handlers):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(StructuredFormatter(fmt_json=LOG_FORMAT == "json"))
+        handler._face_auth = True
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(LOG_LEVEL)
+    return logger
+
+
+def get_logger(name):
+    """Logger under the face_auth namespace, e.g. get_logger("gallery")"""
+    configure_logging()
+    return logging.getLogger(f"face_auth.{name}")
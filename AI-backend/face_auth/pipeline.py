@@ -0,0 +1,268 @@
+import base64
+import binascii
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import cv2
+import numpy as np
+from face_auth.cache import NO_FACE, embedding_key, frame_cache, frame_key, match_cache
+from face_auth.embedders import get_embedder
+from face_auth.metrics import FRAMES, get_logger, timed
+from face_auth.profiling import note_image, run_in_request
+
+logger = get_logger("pipeline")
+
+# Worker threads per stage. OpenCV decode/detect and the BLAS match
+# release the GIL, so threads give real parallelism here.
+DECODE_WORKERS = int(os.environ.get("FACE_PIPELINE_DECODE_WORKERS", "2"))
+DETECT_WORKERS = int(os.environ.get("FACE_PIPELINE_DETECT_WORKERS", str(min(8, os.cpu_count() or 1))))
+EMBED_WORKERS = int(os.environ.get("FACE_PIPELINE_EMBED_WORKERS", "2"))
+MATCH_WORKERS = int(os.environ.get("FACE_PIPELINE_MATCH_WORKERS", "2"))
+
+# Frames admitted into the pipeline at once; beyond this callers get 429
+MAX_PENDING = int(os.environ.get("FACE_PIPELINE_MAX_PENDING", "64"))
+
+
+class PipelineSaturated(Exception):
+    """Raised when the pipeline has no free slot for another frame"""
+
+
+class ImageDecodeError(ValueError):
+    """Raised when uploaded image data is not valid base64 or a decodable JPEG/PNG"""
+
+
+# ------------------ Decoding ------------------
+def image_bytes(image_data):
+    """
+    Return the raw bytes of an uploaded image.
+    Accepts raw bytes or a base64 string (optionally a data URL).
+    """
+    if isinstance(image_data, str):
+        # Strip data URL prefix if present (e.g., 'data:image/jpeg;base64,')
+        if ',' in image_data:
+            image_data = image_data.split(',', 1)[1]
+        try:
+            image_data = base64.b64decode(image_data)
+        except (binascii.Error, ValueError):
+            raise ImageDecodeError("Invalid base64 image data")
+    return image_data
+
+
+def decode_gray(image_data):
+    """Decode JPEG/PNG data straight to a grayscale frame (no PIL, no BGR step)"""
+    return _imdecode(image_data, cv2.IMREAD_GRAYSCALE)
+
+
+def decode_bgr(image_data):
+    """Decode JPEG/PNG data to a BGR frame (for colour embedders)"""
+    return _imdecode(image_data, cv2.IMREAD_COLOR)
+
+
+def _imdecode(image_data, flags):
+    buffer = np.frombuffer(image_bytes(image_data), dtype=np.uint8)
+    frame = cv2.imdecode(buffer, flags)
+    if frame is None:
+        raise ImageDecodeError("Unsupported or corrupt image data")
+    return frame
+
+
+# ------------------ Staged Pipeline ------------------
+class FramePipeline:
+    """
+    decode -> detect -> embed -> match, each stage on its own thread pool.
+
+    A frame holds one slot from admission until its last stage finishes,
+    which bounds the work queued across all stages. A stage returning
+    None (e.g. no face found) ends the frame early with a None result.
+    Stages are called as fn(value, context), where `context` is per-session
+    state passed to submit() (e.g. a FaceTracker), None by default.
+    """
+
+    def __init__(self, stages, max_pending=MAX_PENDING):
+        self._stages = [
+            (name, ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"face-{name}"), fn)
+            for name, workers, fn in stages
+        ]
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.max_pending = max_pending
+
+    def _acquire(self, count):
+        taken = 0
+        while taken < count and self._slots.acquire(blocking=False):
+            taken += 1
+        if taken < count:
+            for _ in range(taken):
+                self._slots.release()
+            raise PipelineSaturated(f"No room for {count} more frames ({self.max_pending} max in flight)")
+
+    def submit(self, value, stop_after=None, context=None, _reserved=False):
+        """
+        Queue one frame and return a Future for its final stage result.
+        `stop_after` names a stage to end at (e.g. "embed" to skip matching).
+        `context` is handed to every stage along with the value.
+        Raises PipelineSaturated instead of queueing when all slots are taken.
+        """
+        if not _reserved:
+            self._acquire(1)
+        last = len(self._stages) - 1
+        if stop_after is not None:
+            last = [name for name, _, _ in self._stages].index(stop_after)
+        result = Future()
+        # Stages run in the caller's context so their timings land in its request,
+        # and the profiler follows them when that request is profiled
+        self._run(0, last, value, context, result, contextvars.copy_context())
+        return result
+
+    def _run(self, stage, last, value, context, result, ctx):
+        _, pool, fn = self._stages[stage]
+        try:
+            future = pool.submit(ctx.run, run_in_request, fn, value, context)
+        except Exception as e:
+            self._finish(result, error=e)
+            return
+        future.add_done_callback(lambda f: self._advance(f, stage, last, context, result, ctx))
+
+    def _advance(self, future, stage, last, context, result, ctx):
+        error = future.exception()
+        if error is not None:
+            self._finish(result, error=error)
+            return
+        value = future.result()
+        if value is None or stage == last:
+            self._finish(result, value=value)
+        else:
+            self._run(stage + 1, last, value, context, result, ctx)
+
+    def _finish(self, result, value=None, error=None):
+        self._slots.release()
+        if error is not None:
+            FRAMES.inc(result="error")
+            result.set_exception(error)
+        else:
+            result.set_result(value)
+
+    def process(self, value, stop_after=None, timeout=None, context=None):
+        """Run one frame through the pipeline and wait for its result"""
+        return self.submit(value, stop_after, context).result(timeout)
+
+    def process_many(self, values, stop_after=None, timeout=None, skip_errors=False, context=None):
+        """
+        Run several frames concurrently; results keep the input order.
+        Either all frames are admitted or none are. With skip_errors a
+        frame that fails in any stage yields None instead of raising.
+        """
+        values = list(values)
+        self._acquire(len(values))
+        futures = [self.submit(value, stop_after, context, _reserved=True) for value in values]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout))
+            except Exception as e:
+                if not skip_errors:
+                    raise
+                logger.debug("Skipping frame", extra={"error": str(e)})
+                results.append(None)
+        return results
+
+
+def _decode(image_data, tracker=None):
+    with timed("decode"):
+        frame = decode_bgr(image_data) if get_embedder().color else decode_gray(image_data)
+    note_image(frame, len(image_data))
+    return frame
+
+
+def _detect(frame, tracker=None):
+    box = get_embedder().detect(frame, tracker)
+    if box is None:
+        FRAMES.inc(result="no_face")
+        return None
+    return frame, box
+
+
+def _embed(found, tracker=None):
+    frame, box = found
+    with timed("embed"):
+        embedding = get_embedder().embed_crops([frame], [box])[0]
+    FRAMES.inc(result="no_face" if embedding is None else "detected")
+    return embedding
+
+
+def embed_frames(values, tracker=None):
+    """
+    Embeddings of several frames of one person, None where no face was
+    found. Frames are decoded and searched concurrently on the pipeline
+    (the first one alone, so `tracker` then narrows the search for the
+    rest), and the faces found are embedded as one batch.
+    """
+    pipeline = get_pipeline()
+    found = pipeline.process_many(values[:1], stop_after="detect", skip_errors=True, context=tracker)
+    found += pipeline.process_many(values[1:], stop_after="detect", skip_errors=True, context=tracker)
+    hits = [i for i, item in enumerate(found) if item is not None]
+    embeddings = [None] * len(found)
+    if hits:
+        with timed("embed"):
+            vectors = get_embedder().embed_crops([found[i][0] for i in hits], [found[i][1] for i in hits])
+        for i, vector in zip(hits, vectors):
+            embeddings[i] = vector
+            FRAMES.inc(result="no_face" if vector is None else "detected")
+    return embeddings
+
+
+def _gallery_version():
+    from face_auth.gallery import get_gallery
+    gallery = get_gallery()
+    # Cached results must not outlive writes made by other processes either
+    gallery.refresh()
+    return gallery.version
+
+
+def _match(embedding, tracker=None):
+    from face_auth.login_enhanced import find_best_match
+    with timed("match"):
+        version = _gallery_version()
+        key = embedding_key(embedding)
+        cached = match_cache.get(key, version)
+        if cached is None:
+            cached = find_best_match(embedding)
+            match_cache.put(key, version, cached)
+    name, score = cached
+    return embedding, name, score
+
+
+def process_frame(image_data, context=None):
+    """
+    decode -> embed -> match for one uploaded frame, answered from the frame
+    cache when the same image bytes were processed against this gallery
+    version recently. Returns (embedding, name, score), or None without a face.
+    """
+    data = image_bytes(image_data)
+    version = _gallery_version()
+    key = frame_key(data)
+    cached = frame_cache.get(key, version)
+    if cached is not None:
+        return None if cached is NO_FACE else cached
+    result = get_pipeline().process(data, context=context)
+    frame_cache.put(key, version, NO_FACE if result is None else result)
+    return result
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """Return the process-wide frame pipeline: decode -> detect -> embed (FACE_EMBEDDER) -> match"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = FramePipeline([
+                    ("decode", DECODE_WORKERS, _decode),
+                    ("detect", DETECT_WORKERS, _detect),
+                    ("embed", EMBED_WORKERS, _embed),
+                    ("match", MATCH_WORKERS, _match),
+                ])
+    return _pipeline
@@ -0,0 +1,396 @@
+import contextvars
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from functools import lru_cache
+from face_auth.metrics import PROFILED_REQUESTS, SLOW_REQUESTS, get_logger
+
+logger = get_logger("profiling")
+
+# Opt-in profiling of the request path. A request is profiled when it sends
+# "X-Face-Profile: <FACE_PROFILE_TOKEN>", or at random with
+# FACE_PROFILE_SAMPLE_RATE. Its request thread, and the pipeline stages it
+# runs on the decode/detect/embed/match pools, are followed by a wall-clock
+# stack sampler (FACE_PROFILE_MODE=sample) or by cProfile
+# (FACE_PROFILE_MODE=cprofile, one request at a time per process; others
+# fall back to sampling). Profiles add up per serving process and are served
+# by GET /api/face/profile with the same token, like /metrics per worker.
+#
+# Requests slower than FACE_SLOW_REQUEST_MS are logged with their stage
+# timings and image sizes whether profiled or not. With profiling off a
+# request costs two context variable writes and a lookup per pipeline stage.
+
+# Admin secret: header-triggered profiling and the report need it
+TOKEN = os.environ.get("FACE_PROFILE_TOKEN", "")
+
+# Fraction of all requests profiled without the header (0 = only on request)
+SAMPLE_RATE = float(os.environ.get("FACE_PROFILE_SAMPLE_RATE", "0"))
+
+# "sample" (stack sampler, low overhead) or "cprofile" (every call, exact counts);
+# a profiled request may pick one with the X-Face-Profile-Mode header
+MODE = os.environ.get("FACE_PROFILE_MODE", "sample")
+MODES = ("sample", "cprofile")
+
+# Milliseconds between stack samples of a profiled request's threads
+INTERVAL = float(os.environ.get("FACE_PROFILE_INTERVAL_MS", "5")) / 1000
+
+# Requests at least this slow are logged (0 = off), and the last few kept for the report
+SLOW_REQUEST_MS = float(os.environ.get("FACE_SLOW_REQUEST_MS", "1000"))
+SLOW_REQUEST_KEEP = int(os.environ.get("FACE_SLOW_REQUEST_KEEP", "50"))
+
+# Bounds on what a sample records and on the stacks the report keeps
+MAX_DEPTH = 64
+MAX_STACKS = 20000
+
+# Images listed per slow request (a batch lists the first few and counts the rest)
+MAX_NOTED_IMAGES = 8
+
+AI_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB_DIR = os.path.dirname(os.__file__)
+
+_notes = contextvars.ContextVar("face_request_notes", default=None)
+_profile = contextvars.ContextVar("face_request_profile", default=None)
+_cprofile_lock = threading.Lock()
+
+
+def authorized(sent):
+    """True if `sent` is the profiling token (never without one)"""
+    return bool(TOKEN) and sent is not None and hmac.compare_digest(sent.encode(), TOKEN.encode())
+
+
+# ------------------ Stack Labels ------------------
+@lru_cache(maxsize=4096)
+def _short_path(filename):
+    """Path relative to AI-backend, site-packages or the standard library, else as is"""
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    for root in (AI_BACKEND_DIR, STDLIB_DIR):
+        if filename.startswith(root + os.sep):
+            return filename[len(root) + 1:]
+    return filename
+
+
+def _label(filename, line, function):
+    if filename == "~":
+        # A C function as cProfile names it, e.g. "<method 'acquire' of '_thread.lock' objects>"
+        return function
+    return f"{_short_path(filename)}:{line}({function})"
+
+
+def _waiting(label):
+    """A thread blocked on a lock or future (the request thread waiting for its pipeline stages)"""
+    return label.startswith("threading.py:") or "_thread.lock" in label
+
+
+def _stack(frame):
+    """A thread's stack as a tuple of labels, outermost first (innermost MAX_DEPTH frames)"""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        code = frame.f_code
+        labels.append(_label(code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+# ------------------ Stack Sampler ------------------
+class StackSampler:
+    """
+    Every `interval` seconds, records the stack of each thread currently
+    working for a profiled request. The sampling thread is started on first
+    use (so every pre-fork worker starts its own) and idles while no
+    request is attached.
+    """
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self._threads = {}                     # thread ident -> RequestProfile
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def attach(self, ident, profile):
+        with self._lock:
+            self._threads[ident] = profile
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="face-profiler", daemon=True)
+                self._thread.start()
+            self._wake.set()
+
+    def detach(self, ident):
+        with self._lock:
+            self._threads.pop(ident, None)
+            if not self._threads:
+                self._wake.clear()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                threads = list(self._threads.items())
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident, profile in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    profile.add_sample(_stack(frame))
+            del frames
+
+
+_sampler = StackSampler()
+
+
+# ------------------ Request Profile ------------------
+class RequestProfile:
+    """The samples or cProfile stats of one request, over every thread it ran on"""
+
+    def __init__(self, mode=MODE):
+        if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+            mode = "sample"
+        self.mode = mode
+        self.stacks = Counter()
+        self.stats = None
+        self._depth = {}                       # thread ident -> nested enter() calls
+        self._profilers = {}                   # thread ident -> running cProfile.Profile
+        self._finished = []
+        self._lock = threading.Lock()
+
+    def enter(self):
+        """Start following the calling thread"""
+        ident = threading.get_ident()
+        with self._lock:
+            depth = self._depth.get(ident, 0)
+            self._depth[ident] = depth + 1
+        if depth:
+            return
+        if self.mode == "sample":
+            _sampler.attach(ident, self)
+            return
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler already owns the interpreter (Python 3.12+ monitoring)
+            return
+        with self._lock:
+            self._profilers[ident] = profiler
+
+    def exit(self):
+        """Stop following the calling thread"""
+        ident = threading.get_ident()
+        with self._lock:
+            depth = self._depth.get(ident, 0) - 1
+            if depth > 0:
+                self._depth[ident] = depth
+                return
+            self._depth.pop(ident, None)
+            profiler = self._profilers.pop(ident, None)
+        if self.mode == "sample":
+            _sampler.detach(ident)
+        elif profiler is not None:
+            profiler.disable()
+            with self._lock:
+                self._finished.append(profiler)
+
+    def add_sample(self, stack):
+        with self._lock:
+            self.stacks[stack] += 1
+
+    def finish(self):
+        """Stop following the request thread and collect the results"""
+        self.exit()
+        if self.mode == "cprofile":
+            _cprofile_lock.release()
+            if self._finished:
+                import pstats
+
+                self.stats = pstats.Stats(*self._finished)
+        PROFILED_REQUESTS.inc(mode=self.mode)
+
+    def hot(self, top=3):
+        """The functions that took the most time of their own in this request, waits left out"""
+        own = Counter()
+        if self.stats is not None:
+            for key, (cc, nc, tt, ct, callers) in self.stats.stats.items():
+                own[_label(*key)] += tt
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+        return [label for label, _ in own.most_common() if not _waiting(label)][:top]
+
+
+def run_in_request(fn, *args):
+    """fn(*args) on a pool thread, followed by the profiler if its request is profiled"""
+    profile = _profile.get()
+    if profile is None:
+        return fn(*args)
+    profile.enter()
+    try:
+        return fn(*args)
+    finally:
+        profile.exit()
+
+
+# ------------------ Process Report ------------------
+class ProfileReport:
+    """Profiles of every request this process followed, added up"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.since = time.time()
+            self.requests = Counter()
+            self.stacks = Counter()
+            self.dropped = 0
+            self.stats = None
+
+    def add(self, profile):
+        with self._lock:
+            self.requests[profile.mode] += 1
+            for stack, count in profile.stacks.items():
+                if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+                    self.stacks[stack] += count
+                else:
+                    self.dropped += count
+            if profile.stats is not None:
+                if self.stats is None:
+                    self.stats = profile.stats
+                else:
+                    self.stats.add(profile.stats)
+
+    def sampled_functions(self, top=30):
+        """Functions by samples as the innermost frame (self), with samples anywhere on the stack (total)"""
+        with self._lock:
+            stacks = list(self.stacks.items())
+        own, total = Counter(), Counter()
+        for stack, count in stacks:
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        ms = INTERVAL * 1000
+        return [{"function": label, "self_ms": round(count * ms, 1), "total_ms": round(total[label] * ms, 1),
+                 "samples": total[label]} for label, count in own.most_common(top)]
+
+    def cprofile_functions(self, top=30):
+        """Functions by time of their own under cProfile, with cumulative time and calls"""
+        with self._lock:
+            rows = list(self.stats.stats.items()) if self.stats is not None else []
+        rows.sort(key=lambda item: -item[1][2])
+        return [{"function": _label(*key), "self_ms": round(tt * 1000, 2), "total_ms": round(ct * 1000, 2),
+                 "calls": nc} for key, (cc, nc, tt, ct, callers) in rows[:top]]
+
+    def folded(self):
+        """Sampled stacks in the folded format ("a;b;c 12") read by flame graph tools"""
+        with self._lock:
+            stacks = list(self.stacks.items())
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks)
+
+    def pstats_dump(self):
+        """The cProfile stats as written by pstats.Stats.dump_stats (None before any)"""
+        import marshal
+
+        with self._lock:
+            return marshal.dumps(self.stats.stats) if self.stats is not None else None
+
+    def summary(self, top=30):
+        with self._lock:
+            samples = sum(self.stacks.values())
+            requests = dict(self.requests)
+            dropped = self.dropped
+        return {
+            "pid": os.getpid(),
+            "since": round(self.since, 3),
+            "requests": requests,
+            "sampled": {"interval_ms": INTERVAL * 1000, "samples": samples, "dropped": dropped,
+                        "functions": self.sampled_functions(top)},
+            "cprofile": {"functions": self.cprofile_functions(top)},
+            "slow_requests": list(_slow_requests),
+            "slow_request_ms": SLOW_REQUEST_MS
+        }
+
+
+report = ProfileReport()
+_slow_requests = deque(maxlen=SLOW_REQUEST_KEEP)
+
+
+# ------------------ Request Hooks ------------------
+def start_request(header=None, mode=None):
+    """
+    Begin a request: reset its notes, and profile it when `header` (the
+    X-Face-Profile value) is the token or it falls in the sample rate
+    """
+    _notes.set({})
+    if not (authorized(header) or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)):
+        _profile.set(None)
+        return None
+    profile = RequestProfile(mode if mode in MODES else MODE)
+    _profile.set(profile)
+    profile.enter()
+    return profile
+
+
+def note_image(frame, size=None):
+    """Record a decoded frame's dimensions (and upload size) for the slow-request log"""
+    notes = _notes.get()
+    if notes is not None:
+        notes.setdefault("images", []).append((frame.shape[1], frame.shape[0], size))
+
+
+def discard():
+    """Stop a profile the request never finished (e.g. the response failed)"""
+    profile = _profile.get()
+    if profile is not None:
+        _profile.set(None)
+        profile.finish()
+
+
+def finish_request(endpoint, method, status, elapsed, timings):
+    """
+    End the request: add its profile to the report, and log it with its
+    stage timings and images if it took FACE_SLOW_REQUEST_MS or longer.
+    Returns the profiling mode, or None if it was not profiled.
+    """
+    profile = _profile.get()
+    if profile is not None:
+        _profile.set(None)
+        profile.finish()
+        report.add(profile)
+    ms = elapsed * 1000
+    if SLOW_REQUEST_MS <= 0 or ms < SLOW_REQUEST_MS:
+        return profile.mode if profile is not None else None
+
+    images = (_notes.get() or {}).get("images", [])
+    entry = {
+        "at": round(time.time(), 3),
+        "endpoint": endpoint,
+        "method": method,
+        "status": status,
+        "ms": round(ms, 1),
+        "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()},
+        "frames": len(images),
+        "images": [f"{width}x{height}" for width, height, _ in images[:MAX_NOTED_IMAGES]],
+        "image_bytes": sum(size or 0 for _, _, size in images),
+        "profiled": profile.mode if profile is not None else None,
+        "hot": profile.hot() if profile is not None else None
+    }
+    _slow_requests.append(entry)
+    SLOW_REQUESTS.inc(endpoint=endpoint)
+    fields = {key: entry[key] for key in ("endpoint", "method", "status", "ms", "frames", "image_bytes")}
+    fields.update({f"{stage}_ms": value for stage, value in entry["stages_ms"].items()})
+    if entry["images"]:
+        fields["images"] = ",".join(entry["images"])
+    if entry["hot"]:
+        fields["hot"] = " | ".join(entry["hot"])
+    logger.warning("Slow request", extra=fields)
+    return entry["profiled"]
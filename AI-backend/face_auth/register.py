@@ -4,7 +4,7 @@ import pickle
 import sys
 # Add parent directory to path to import from project root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from deepface import DeepFace
+from face_auth.embedders import get_embedder
 from text_sound.tts import speak   # import TTS function
 
 DB_FILE = "face_db.pkl"
@@ -32,6 +32,9 @@ def register_user(name):
 
     speak("Welcome to the app. It's time to register, " + name)
 
+    # Facenet is loaded once here instead of on every DeepFace.represent call
+    embedder = get_embedder("facenet")
+
     embeddings = []
     count = 0
 
@@ -44,8 +47,10 @@ def register_user(name):
 
         if count < 10:
             try:
-                embedding = DeepFace.represent(frame, model_name="Facenet", enforce_detection=False)
-                embeddings.append(embedding[0]["embedding"])
+                embedding = embedder.embed(frame)
+                if embedding is None:
+                    raise ValueError("no face detected")
+                embeddings.append(embedding.tolist())
                 count += 1
                 print(f"[INFO] Captured {count}/10 frames for {name}")
             except Exception as e:
@@ -1,61 +1,70 @@
 import cv2
 import os
-import pickle
-import numpy as np
 import sys
 import time
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.gallery import get_gallery
+from face_auth.metrics import get_logger
 
-# Simple face detection without DeepFace
-# Use absolute path to ensure database is in AI-backend root directory
-DB_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "face_db.pkl")
-
-# Load Haar cascade for face detection
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+logger = get_logger("register")
 
 # ------------------ Database Utils ------------------
 def load_db():
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, "rb") as f:
-            return pickle.load(f)
-    return {}
-
-def save_db(db):
-    with open(DB_FILE, "wb") as f:
-        pickle.dump(db, f)
-
-# ------------------ Simple Face Detection ------------------
-def detect_face(frame):
-    """Simple face detection using Haar cascades"""
-    try:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-
-        if len(faces) > 0:
-            # Return a simple feature vector based on face position and size
-            x, y, w, h = faces[0]  # Use first detected face
-            # Create a simple embedding based on face characteristics
-            embedding = np.array([x, y, w, h, w/h, gray[y:y+h, x:x+w].mean(), gray[y:y+h, x:x+w].std()])
-            return embedding
-        else:
-            return None
-    except Exception as e:
-        print(f"[WARNING] Face detection failed: {e}")
-        return None
+    return get_gallery().snapshot()
 
 # ------------------ Enhanced Registration ------------------
-def save_user_embeddings(name, embeddings):
+def save_user_embeddings(name, embeddings, embedder=None):
     """
-    Save user embeddings directly (for API use)
+    Save user embeddings directly (for API use).
+    `embedder` names the backend that produced them (default: FACE_EMBEDDER).
     """
     try:
-        db = load_db()
-        db[name] = embeddings
-        save_db(db)
-        print(f"[SUCCESS] {name} registered successfully with {len(embeddings)} face embeddings")
+        get_gallery().set_user(name, embeddings, embedder=embedder)
+        logger.info("Registered user", extra={"user": name, "embeddings": len(embeddings)})
         return True
     except Exception as e:
-        print(f"[ERROR] Failed to save embeddings for {name}: {e}")
+        logger.error("Failed to save embeddings", extra={"user": name, "error": str(e)})
+        return False
+
+def register_user(name, num_frames=30):
+    """
+    Register a user from the local camera: capture a burst of `num_frames`
+    frames, then keep and embed the best of them (see face_auth.enroll)
+    """
+    from face_auth.enroll import EnrollmentError, enroll
+
+    cap = cv2.VideoCapture(0)
+    if not cap.isOpened():
+        logger.error("Cannot access the camera", extra={"user": name})
+        return False
+
+    print(f"Registering {name}. Please look at the camera and turn your head slightly.")
+    # Warmup period
+    for _ in range(10):
+        cap.read()
+        time.sleep(0.1)
+
+    frames = []
+    for _ in range(2 * num_frames):
+        if len(frames) == num_frames:
+            break
+        ret, frame = cap.read()
+        if not ret:
+            logger.warning("Failed to capture frame", extra={"user": name})
+            continue
+        frames.append(cv2.flip(frame, 1))
+        time.sleep(0.05)
+    cap.release()
+
+    try:
+        report = enroll(name, frames)
+    except EnrollmentError as e:
+        logger.error("Enrollment failed", extra={"user": name, "error": str(e)})
         return False
+    logger.info("Kept enrollment frames", extra={"user": name, "kept": report["frames_used"],
+                                                 "frames": report["frames_received"]})
+    return True
 
 if __name__ == "__main__":
     user_name = input("Enter your name for registration: ")
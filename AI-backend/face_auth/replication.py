@@ -0,0 +1,283 @@
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import numpy as np
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.metrics import REPLICA_PULLS, REPLICA_SEQ, get_logger
+from face_auth.store import BULK_CHUNK, EmbedderMismatchError
+
+logger = get_logger("replication")
+
+# Leader/follower replication of the gallery between face auth nodes.
+# Every write to a store gets a sequence number in its WAL; the leader
+# serves the net changes after a follower's seq (GET .../replication/changes)
+# and a full snapshot (GET .../replication/snapshot) for followers that are
+# new, or further behind than the leader's WAL reaches (the WAL is folded
+# into the checkpoint every FACE_WAL_CHECKPOINT_RECORDS writes). Followers
+# write what they pull into their own store, so every worker of the
+# follower picks it up like a local registration, and keep the leader's
+# store id and seq next to it in <store>.replica.json.
+#
+# Both responses are one feed: a 4-byte little-endian header length, a JSON
+# header {"store_id", "seq", "embedder", "dim", "full", "users": [[name,
+# rows], ...]} (rows is null for a removed user), then the float32 rows of
+# the listed users, in order.
+
+# Leader URL (e.g. http://10.0.0.5:5002); set on followers only
+REPLICA_OF = os.environ.get("FACE_REPLICA_OF", "").rstrip("/")
+
+# Shared secret between the nodes; the leader serves no feed without one
+TOKEN = os.environ.get("FACE_REPLICATION_TOKEN", "")
+
+# Seconds between pulls from the leader, and per-request timeout
+INTERVAL = float(os.environ.get("FACE_REPLICA_INTERVAL", "1.0"))
+TIMEOUT = float(os.environ.get("FACE_REPLICA_TIMEOUT", "10"))
+
+FEED_TYPE = "application/x-face-feed"
+_HEADER = struct.Struct("<I")
+
+
+class ResyncRequired(Exception):
+    """The leader cannot serve changes after the follower's seq: pull a snapshot"""
+
+
+# ------------------ Feed Encoding ------------------
+def encode_feed(store_id, seq, embedder, dim, users, full=False):
+    """
+    Yield a feed as byte chunks from (name, rows or None) pairs; rows are
+    written straight from the store's mapped file, a user at a time
+    """
+    users = list(users)
+    header = json.dumps({
+        "store_id": store_id, "seq": seq, "embedder": embedder, "dim": dim, "full": full,
+        "users": [[name, None if rows is None else len(rows)] for name, rows in users]
+    }).encode("utf-8")
+    yield _HEADER.pack(len(header)) + header
+    for _, rows in users:
+        if rows is not None and len(rows):
+            yield np.ascontiguousarray(rows, dtype=np.float32).tobytes()
+
+
+def snapshot_feed(store):
+    """The whole store as a feed"""
+    store.refresh()
+    snapshot = store.snapshot()
+    return encode_feed(store.store_id, snapshot.seq, store.embedder, store.dim,
+                       ((name, snapshot[name]) for name in snapshot), full=True)
+
+
+def changes_feed(store, since, store_id=None):
+    """
+    Net changes after `since` as a feed. Raises ResyncRequired when they are
+    no longer in the WAL, or `store_id` names another store than this one.
+    """
+    if store_id != store.store_id:
+        raise ResyncRequired(f"Leader store is {store.store_id}, not {store_id}")
+    changes = store.changes_since(since)
+    if changes is None:
+        raise ResyncRequired(f"Changes after seq {since} are no longer in the leader's WAL")
+    seq, users = changes
+    return encode_feed(store.store_id, seq, store.embedder, store.dim, users)
+
+
+def _read_exact(stream, size):
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            raise ConnectionError("Feed ended early")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_feed(stream):
+    """(header, iterator of (name, rows or None)) from a feed stream"""
+    (length,) = _HEADER.unpack(_read_exact(stream, _HEADER.size))
+    header = json.loads(_read_exact(stream, length).decode("utf-8"))
+    dim = header["dim"]
+
+    def users():
+        for name, count in header["users"]:
+            if count is None:
+                yield name, None
+            else:
+                yield name, np.frombuffer(_read_exact(stream, count * dim * 4), dtype=np.float32).reshape(count, dim)
+
+    return header, users()
+
+
+# ------------------ Follower ------------------
+class Replicator:
+    """
+    Keeps a gallery in step with a leader node: pulls the changes after the
+    last applied leader seq and writes them as one commit, or resyncs from a
+    snapshot when the leader asks for it (410) or the leader store changed.
+    """
+
+    def __init__(self, gallery, leader=REPLICA_OF, token=TOKEN, interval=INTERVAL, timeout=TIMEOUT):
+        self.gallery = gallery
+        self.leader = leader.rstrip("/")
+        self.token = token
+        self.interval = interval
+        self.timeout = timeout
+        self.state_path = gallery.store.base_path + ".replica.json"
+        self.state = self._load_state()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        return state if state.get("leader") == self.leader else None
+
+    def _save_state(self, store_id, seq):
+        state = {"leader": self.leader, "store_id": store_id, "seq": seq, "applied_at": time.time()}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+        self.state = state
+        REPLICA_SEQ.set(seq)
+
+    def _open(self, path, **params):
+        url = f"{self.leader}/api/face/replication/{path}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        request = urllib.request.Request(url, headers={"Authorization": f"Bearer {self.token}"})
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _check_embedder(self, header):
+        if header["embedder"] and header["users"] and header["embedder"] != self.gallery.embedder:
+            raise EmbedderMismatchError(
+                f"Leader stores '{header['embedder']}' embeddings but FACE_EMBEDDER is '{self.gallery.embedder}'")
+
+    def pull(self):
+        """Pull and apply the leader's changes (or a snapshot); returns the users written"""
+        if self.state is None:
+            return self.resync()
+        try:
+            response = self._open("changes", since=self.state["seq"], store_id=self.state["store_id"] or "")
+        except urllib.error.HTTPError as e:
+            if e.code != 410:
+                raise
+            logger.info("Leader asked for a resync", extra={"leader": self.leader, "seq": self.state["seq"]})
+            return self.resync()
+        with response:
+            header, users = read_feed(response)
+            self._check_embedder(header)
+            items = list(users)
+        if items:
+            self._apply(items)
+        if items or header["seq"] != self.state["seq"]:
+            self._save_state(header["store_id"], header["seq"])
+        REPLICA_PULLS.inc(kind="changes", result="ok")
+        return len(items)
+
+    def resync(self):
+        """Replace the local gallery with a snapshot of the leader's"""
+        started = time.perf_counter()
+        with self._open("snapshot") as response:
+            header, users = read_feed(response)
+            self._check_embedder(header)
+            stale = set(self.gallery.store.snapshot())
+            written = 0
+            # Written in bulk-sized commits so the snapshot is never held in memory whole
+            chunk = []
+            for name, rows in users:
+                stale.discard(name)
+                chunk.append((name, rows))
+                if len(chunk) == BULK_CHUNK:
+                    written += self._apply(chunk)
+                    chunk = []
+            chunk.extend((name, None) for name in stale)
+            written += self._apply(chunk)
+        self._save_state(header["store_id"], header["seq"])
+        REPLICA_PULLS.inc(kind="snapshot", result="ok")
+        logger.info("Resynced from leader snapshot", extra={
+            "leader": self.leader, "users": len(header["users"]), "seq": header["seq"],
+            "ms": round((time.perf_counter() - started) * 1000, 1)})
+        return written
+
+    def _apply(self, items):
+        if not items:
+            return 0
+        failed = self.gallery.apply_changes(items)
+        for name, error in failed:
+            logger.warning("Replicated write rejected", extra={"user": name, "error": str(error)})
+        return len(items) - len(failed)
+
+    def poll(self):
+        """pull(), logging instead of raising; for callers that poll on their own loop"""
+        try:
+            return self.pull()
+        except Exception as e:
+            REPLICA_PULLS.inc(kind="changes", result="error")
+            logger.warning("Replication pull failed", extra={"leader": self.leader, "error": str(e)})
+            return None
+
+    def status(self):
+        """Leader, and its store id and seq last applied (by whichever process pulls)"""
+        state = self._load_state() or {}
+        return {"leader": self.leader, "store_id": state.get("store_id"), "seq": state.get("seq"),
+                "applied_at": state.get("applied_at")}
+
+    def start(self):
+        """Poll the leader every `interval` seconds on a background thread"""
+        def run():
+            while not self._stop.is_set():
+                self.poll()
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=run, name="face-replica", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_replicator = None
+
+
+def get_replicator():
+    """The process-wide Replicator when FACE_REPLICA_OF is set, else None"""
+    global _replicator
+    if _replicator is None and REPLICA_OF:
+        from face_auth.gallery import get_gallery
+        _replicator = Replicator(get_gallery())
+    return _replicator
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pull the face gallery from a leader node")
+    parser.add_argument("command", choices=["sync", "resync", "status"])
+    parser.add_argument("--leader", default=REPLICA_OF, help="leader URL (default: FACE_REPLICA_OF)")
+    args = parser.parse_args()
+    if not args.leader:
+        parser.error("--leader or FACE_REPLICA_OF is required")
+
+    from face_auth.gallery import get_gallery
+    replicator = Replicator(get_gallery(), leader=args.leader)
+    if args.command == "sync":
+        print(f"users written: {replicator.pull()}")
+    elif args.command == "resync":
+        print(f"users written: {replicator.resync()}")
+    for key, value in replicator.status().items():
+        print(f"{key}: {value}")
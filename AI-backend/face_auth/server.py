@@ -0,0 +1,206 @@
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+# Add parent directory to path so face_auth_api resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_auth import startup
+from face_auth.metrics import get_logger
+
+logger = get_logger("server")
+
+# Production serving mode for the face auth API:
+#   python -m face_auth.server
+# A master process binds the socket, imports OpenCV, the Haar cascade and
+# the gallery once (answering health probes meanwhile), then forks worker
+# processes that share those pages copy-on-write. Workers pick up new registrations by tailing the store's
+# WAL; the master rolls them only when the store is checkpointed or
+# compacted, so every worker serves the new gallery from shared memory.
+# On a replica (FACE_REPLICA_OF) the master also pulls the leader's changes,
+# on its main thread so no pull is ever in flight when it forks.
+
+HOST = os.environ.get("FACE_AUTH_HOST", "127.0.0.1")
+PORT = int(os.environ.get("FACE_AUTH_PORT", "5002"))
+WORKERS = int(os.environ.get("FACE_AUTH_WORKERS", str(os.cpu_count() or 1)))
+
+# Seconds between checks of the store for changes made by any process
+RELOAD_INTERVAL = float(os.environ.get("FACE_AUTH_RELOAD_INTERVAL", "2.0"))
+
+
+# ------------------ Pre-fork Server ------------------
+class PreforkServer:
+    """Bind once, preload once, fork `workers` WSGI servers on the same socket"""
+
+    def __init__(self, app, host=HOST, port=PORT, workers=WORKERS, reload_interval=RELOAD_INTERVAL):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.num_workers = max(1, workers)
+        self.reload_interval = reload_interval
+        self.workers = set()
+        self.sock = None
+        self.gallery = None
+        self._stopping = False
+        self._reload_requested = False
+
+    def bind(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(128)
+        self.sock.set_inheritable(True)
+
+    def preload(self, warm_up):
+        """
+        Run warm_up() in the master while a temporary server thread answers
+        on the bound socket (probes get their answer, other requests a 503),
+        so a caller polling /api/face/health sees the service within the
+        time it takes to import Flask. The thread is stopped before forking.
+        """
+        from werkzeug.serving import BaseWSGIServer
+
+        started = time.perf_counter()
+        probe_server = BaseWSGIServer(self.host, self.port, self.app, fd=self.sock.fileno())
+        thread = threading.Thread(target=probe_server.serve_forever, name="face-probes", daemon=True)
+        thread.start()
+        try:
+            self.gallery = warm_up()
+        finally:
+            probe_server.shutdown()
+            thread.join()
+            probe_server.server_close()
+        logger.info("Preloaded gallery and detector",
+                    extra={"users": len(self.gallery), "ms": round((time.perf_counter() - started) * 1000)})
+
+    # -------- workers --------
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker()
+            except Exception as e:
+                logger.exception("Worker crashed", extra={"worker": os.getpid()})
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers.add(pid)
+        return pid
+
+    def _run_worker(self):
+        from werkzeug.serving import BaseWSGIServer
+
+        server = BaseWSGIServer(self.host, self.port, self.app, fd=self.sock.fileno())
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever, so it must run on another thread;
+            # the request in flight is finished first
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        logger.info("Worker serving", extra={"worker": os.getpid(), "url": f"http://{self.host}:{self.port}"})
+        server.serve_forever()
+
+    def _reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if not self._stopping:
+                    logger.warning("Worker exited unexpectedly, respawning", extra={"worker": pid, "status": status})
+                    self.spawn()
+
+    def reload(self):
+        """Reload the gallery in the master, then replace workers one at a time"""
+        self.gallery.index()
+        for pid in list(self.workers):
+            self.spawn()
+            self.workers.discard(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        logger.info("Reloaded workers", extra={"workers": len(self.workers), "gallery_version": self.gallery.version})
+
+    # -------- master loop --------
+    def run(self):
+        def stop(signum, frame):
+            self._stopping = True
+
+        def request_reload(signum, frame):
+            self._reload_requested = True
+
+        for _ in range(self.num_workers):
+            self.spawn()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, request_reload)
+        logger.info("Master running", extra={"master": os.getpid(), "workers": self.num_workers,
+                                             "url": f"http://{self.host}:{self.port}"})
+        startup.log_report()
+        if startup.PROFILE_IMPORTS:
+            startup.log_import_profile()
+
+        from face_auth.replication import get_replicator
+
+        replicator = get_replicator()
+        next_check = time.monotonic() + self.reload_interval
+        next_pull = time.monotonic()
+        loads = self.gallery.loads
+        while not self._stopping:
+            self._reap()
+            if replicator is not None and time.monotonic() >= next_pull:
+                replicator.poll()
+                next_pull = time.monotonic() + replicator.interval
+            if self._reload_requested or time.monotonic() >= next_check:
+                self.gallery.refresh(force=True)
+                if self.gallery.loads != loads or self._reload_requested:
+                    self.reload()
+                loads = self.gallery.loads
+                self._reload_requested = False
+                next_check = time.monotonic() + self.reload_interval
+            time.sleep(0.2)
+
+        logger.info("Shutting down workers")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.sock.close()
+
+
+def main():
+    from face_auth_api import app, start_warm_up, warm_up
+
+    if not hasattr(os, "fork"):
+        logger.warning("os.fork is unavailable on this platform, using a single process")
+        start_warm_up()
+        app.run(host=HOST, port=PORT, debug=False, threaded=True)
+        return
+
+    server = PreforkServer(app)
+    server.bind()
+    startup.mark("socket_bound")
+    server.preload(warm_up)
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
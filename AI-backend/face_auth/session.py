@@ -0,0 +1,112 @@
+from face_auth.aggregation import ACCEPT, CANDIDATES, EvidenceAggregator
+from face_auth.matcher import top_k
+from face_auth.metrics import timed
+
+# Defaults shared by the camera login and the streaming API
+MAX_ATTEMPTS = 50
+CONFIDENCE_THRESHOLD = 0.65
+VERIFICATION_FRAMES = 15
+
+
+# ------------------ Login Session ------------------
+class LoginSession:
+    """
+    Accumulate-and-early-exit login over a stream of frames.
+
+    This is the loop from login_enhanced.login without the camera: the
+    first `warmup_frames` frames are ignored and frames with a face or a
+    capture error count as attempts up to `max_attempts`. Every scored
+    frame adds evidence per user (see EvidenceAggregator); the session
+    finishes as soon as the sequential test accepts or rejects, or, if it
+    is still undecided after `verification_frames` faces, on whether the
+    leading user's median score crossed `confidence_threshold` with no
+    other user close behind.
+    """
+
+    def __init__(self, matcher, max_attempts=MAX_ATTEMPTS, confidence_threshold=CONFIDENCE_THRESHOLD,
+                 verification_frames=VERIFICATION_FRAMES, warmup_frames=0, calibrator=None):
+        self.matcher = matcher
+        self.max_attempts = max_attempts
+        self.confidence_threshold = confidence_threshold
+        self.verification_frames = verification_frames
+        self.warmup_frames = warmup_frames
+        self.evidence = EvidenceAggregator(calibrator)
+        self.frames_seen = 0
+        self.attempt_count = 0
+        self.faces_scored = 0
+        self.best_match_user = None
+        self.best_match_score = 0.0
+        self.authenticated_user = None
+        self.decided_by = None
+        self.done = False
+
+    def add_missed_frame(self):
+        """Count a frame that could not be captured/decoded as an attempt"""
+        self.frames_seen += 1
+        if self.frames_seen > self.warmup_frames:
+            self.attempt_count += 1
+        self._check_exhausted()
+        return self.done
+
+    def add_embedding(self, embedding):
+        """
+        Score one frame's embedding (None when no face was found).
+        Returns True once the session has reached a decision.
+        """
+        self.frames_seen += 1
+        if self.done or self.frames_seen <= self.warmup_frames or embedding is None:
+            return self.done
+
+        self.attempt_count += 1
+        self.faces_scored += 1
+
+        # Score against all users in one pass, keep the best few as this frame's evidence
+        with timed("match"):
+            scores = self.matcher.user_scores(embedding)
+            candidates = top_k(self.matcher.users, scores, CANDIDATES)
+        decision = self.evidence.add(candidates, truncated=len(scores) > CANDIDATES)
+
+        # The user with the most evidence so far, and their median score
+        self.best_match_user = self.evidence.leader
+        if self.best_match_user is not None:
+            self.best_match_score = self.evidence.stats(self.best_match_user)["median"]
+
+        if decision is not None:
+            self._finish(decision == ACCEPT, "sequential")
+        elif self.faces_scored >= self.verification_frames:
+            self._finish(self._median_accepts(), "median")
+        self._check_exhausted()
+        return self.done
+
+    def _median_accepts(self):
+        """Fallback rule: the leader's median score crossed the threshold and no other user comes close"""
+        return (self.best_match_score > self.confidence_threshold
+                and self.evidence.margin() >= self.evidence.accept_at)
+
+    def _finish(self, accepted, decided_by):
+        self.authenticated_user = self.best_match_user if accepted else None
+        self.decided_by = decided_by
+        self.done = True
+
+    def _check_exhausted(self):
+        if self.attempt_count >= self.max_attempts and not self.done:
+            # Out of attempts: decide on what was seen, if enough faces were
+            accepted = self.faces_scored >= self.evidence.min_frames and self._median_accepts()
+            self._finish(accepted, "exhausted")
+
+    @property
+    def authenticated(self):
+        return self.authenticated_user is not None
+
+    def decision(self):
+        return {
+            'done': self.done,
+            'authenticated': self.authenticated,
+            'username': self.authenticated_user if self.authenticated else None,
+            'best_match': self.best_match_user,
+            'confidence': self.best_match_score,
+            'decided_by': self.decided_by,
+            'evidence': self.evidence.evidence(self.best_match_user) if self.best_match_user else 0.0,
+            'frames_seen': self.frames_seen,
+            'faces_scored': self.faces_scored
+        }
@@ -0,0 +1,238 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import numpy as np
+from face_auth.matcher import EmbeddingMatcher, top_k
+from face_auth.metrics import get_logger, timed
+
+logger = get_logger("shards")
+
+# Multi-core 1:N matching (FACE_INDEX=sharded). The gallery's rows are split
+# into contiguous row ranges, one per shard process; each shard maps the
+# store file itself (the page cache is shared, nothing is copied), scores
+# probes against its range and returns its top-K, and the caller merges them.
+# Every process that searches owns its own shard processes, so with the
+# pre-fork server prefer FACE_SHARDS x FACE_AUTH_WORKERS <= cores.
+
+SHARDS = int(os.environ.get("FACE_SHARDS", str(os.cpu_count() or 1)))
+
+# Each shard runs single-threaded BLAS; the shards are the parallelism
+_SINGLE_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+class StaleShard(Exception):
+    """A shard has already moved to a newer store generation than the caller"""
+
+
+# ------------------ Shard Process ------------------
+def _serve(conn, base_path, metric):
+    """Shard loop: (stamp, lo, hi, probes, k) in, per-probe top-k lists out"""
+    from face_auth.store import EmbeddingStore
+
+    store = EmbeddingStore(base_path).open()
+    matcher, built_for = None, None
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        stamp, lo, hi, probes, k = request
+        try:
+            if store.stamp != stamp:
+                store.refresh()
+            if store.stamp[0] != stamp[0]:
+                conn.send(("stale", store.stamp))
+                continue
+            key = (store.stamp, lo, hi)
+            if key != built_for:
+                matcher, built_for = _shard_matcher(store.snapshot(), lo, hi, metric), key
+            scores = matcher.score_matrix(probes)
+            conn.send(("ok", [top_k(matcher.users, row, k) for row in scores]))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+def _shard_matcher(snapshot, lo, hi, metric):
+    """Matcher over the users whose rows start in [lo, hi), as a view of the mapped file"""
+    first = int(np.searchsorted(snapshot.offsets, lo))
+    last = len(snapshot.offsets) if hi is None else int(np.searchsorted(snapshot.offsets, hi))
+    offsets, counts = snapshot.offsets[first:last], snapshot.counts[first:last]
+    if len(offsets) == 0:
+        return EmbeddingMatcher({}, metric)
+    row_lo, row_hi = int(offsets[0]), int(offsets[-1] + counts[-1])
+    return EmbeddingMatcher.from_arrays(snapshot.users[first:last], snapshot.matrix[row_lo:row_hi],
+                                        offsets - row_lo, counts, metric)
+
+
+# ------------------ Shard Pool ------------------
+class ShardPool:
+    """N shard processes with one pipe each, owned by the process that started them"""
+
+    def __init__(self, base_path, shards=SHARDS, metric="euclidean"):
+        self.base_path = base_path
+        self.metric = metric
+        self.pid = os.getpid()
+        context = multiprocessing.get_context("spawn")
+        self._conns, self._procs = [], []
+        saved = {name: os.environ.get(name) for name in _SINGLE_THREAD_ENV}
+        os.environ.update({name: "1" for name in _SINGLE_THREAD_ENV})
+        try:
+            for i in range(shards):
+                parent, child = context.Pipe()
+                proc = context.Process(target=_serve, args=(child, base_path, metric),
+                                       name=f"face-shard-{i}", daemon=True)
+                proc.start()
+                child.close()
+                self._conns.append(parent)
+                self._procs.append(proc)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self._locks = [threading.Lock() for _ in self._conns]
+        self.broken = False
+        logger.info("Started shard processes", extra={"shards": shards, "store": base_path})
+
+    def __len__(self):
+        return len(self._conns)
+
+    def search(self, stamp, rows, probes, k):
+        """Scatter probes to every shard, gather and merge their top-k lists"""
+        # Equal row ranges; the last one is open so rows appended since are covered
+        bounds = [i * rows // len(self) for i in range(len(self))] + [None]
+        # Each shard's lock is held from send to receive; taking them in
+        # order lets concurrent searches pipeline through the shards
+        replies, held = [], []
+        try:
+            for i, conn in enumerate(self._conns):
+                self._locks[i].acquire()
+                held.append(i)
+                conn.send((stamp, bounds[i], bounds[i + 1], probes, k))
+            for i, conn in enumerate(self._conns):
+                replies.append(conn.recv())
+                self._locks[i].release()
+                held.remove(i)
+        except (EOFError, OSError) as e:
+            self.broken = True
+            raise RuntimeError(f"Shard process failed: {e}")
+        finally:
+            for i in held:
+                self._locks[i].release()
+
+        merged = [[] for _ in range(len(probes))]
+        for status, payload in replies:
+            if status == "stale":
+                raise StaleShard(f"Shard is at {payload}, caller at {stamp}")
+            if status != "ok":
+                raise RuntimeError(f"Shard search failed: {payload}")
+            for results, found in zip(merged, payload):
+                results.extend(found)
+        return [sorted(results, key=lambda item: -item[1])[:k] for results in merged]
+
+    def close(self):
+        if os.getpid() != self.pid:
+            return
+        for conn in self._conns:
+            try:
+                conn.send(None)
+                conn.close()
+            except OSError:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=1)
+            if proc.is_alive():
+                proc.terminate()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(base_path, metric, shards=SHARDS):
+    """This process's shard pool for a store (processes forked later start their own)"""
+    key = (base_path, metric, shards)
+    pool = _pools.get(key)
+    if pool is None or pool.pid != os.getpid() or pool.broken:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.pid != os.getpid() or pool.broken:
+                if pool is not None and pool.pid == os.getpid():
+                    pool.close()
+                pool = _pools[key] = ShardPool(base_path, shards, metric)
+    return pool
+
+
+@atexit.register
+def _close_pools():
+    for pool in list(_pools.values()):
+        pool.close()
+
+
+# ------------------ Sharded Index ------------------
+class ShardedIndex:
+    """
+    Exact search scattered over shard processes (same results as FlatIndex).
+
+    Built from a store snapshot, it only records the snapshot: shards
+    follow the store's WAL on their own and rebuild their range when the
+    stamp they are asked for changes. A rebuild per write is therefore
+    O(1), so the index is not incremental and has no add/remove: the
+    gallery builds a new one from each snapshot. Anything that is not a
+    store snapshot, or a shard that is ahead of this process, is searched
+    in-process instead.
+    """
+
+    kind = "sharded"
+    incremental = False
+
+    def __init__(self, shards=SHARDS, metric="euclidean"):
+        self.shards = shards
+        self.metric = metric
+        self._db = {}
+        self._local = None
+
+    def __len__(self):
+        return len(self._db)
+
+    def build(self, db):
+        self._db = db
+        self._local = None
+        return self
+
+    def _local_matcher(self):
+        if self._local is None:
+            self._local = EmbeddingMatcher(self._db, self.metric)
+        return self._local
+
+    def matcher(self):
+        return self._local_matcher()
+
+    def search(self, probe, k=1):
+        return self.search_batch(probe, k)[0]
+
+    def search_batch(self, probes, k=1):
+        probes = np.ascontiguousarray(probes, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        db = self._db
+        if getattr(db, "path", None) is not None and self.shards > 1 and len(db):
+            pool = get_pool(db.path, self.metric, self.shards)
+            try:
+                with timed("shard_search"):
+                    return pool.search((db.generation, db.seq), len(db.matrix), probes, k)
+            except StaleShard as e:
+                logger.info("Shards are ahead of this process, searching locally", extra={"reason": str(e)})
+        matcher = self._local_matcher()
+        return [top_k(matcher.users, row, k) for row in matcher.score_matrix(probes)]
+
+    def save(self, path, stamp=None):
+        """Nothing to persist: shards map the store directly"""
+
+    @classmethod
+    def load(cls, path, stamp=None, metric=None):
+        return None
@@ -0,0 +1,195 @@
+import importlib
+import os
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.metrics import STARTUP_SECONDS, get_logger
+
+logger = get_logger("startup")
+
+# Startup budget of the face service. The API module imports only Flask and
+# the standard library; numpy, OpenCV, the pipeline and the gallery are
+# imported by warm_up() after the socket is bound, so probes answer early.
+# Each step is timed here, logged once at boot and served by
+# /api/face/health. For a per-module breakdown (python -X importtime):
+#   python face_auth/startup.py imports
+# and to time a cold start up to the first liveness and readiness answers:
+#   python face_auth/startup.py boot
+
+# Set FACE_STARTUP_PROFILE=1 to also log the import profile at boot
+PROFILE_IMPORTS = os.environ.get("FACE_STARTUP_PROFILE", "0") == "1"
+
+AI_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _process_started():
+    """Wall-clock start of this process (from /proc on Linux, else now)"""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        # fields[0] is field 3 (state); starttime is field 22, in clock ticks since boot
+        return time.time() - uptime + int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_STARTED = _process_started()
+
+# step -> seconds it took, and milestone -> seconds since the process started
+_steps = {}
+_milestones = {}
+
+
+# ------------------ Startup Report ------------------
+def uptime():
+    return time.time() - PROCESS_STARTED
+
+
+def mark(milestone):
+    """Record that `milestone` was reached (seconds since the process started)"""
+    _milestones[milestone] = uptime()
+
+
+@contextmanager
+def step(name):
+    """Time one startup step"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps[name] = time.perf_counter() - started
+        STARTUP_SECONDS.set(round(_steps[name], 6), step=name)
+
+
+def import_module(name):
+    """Import a module, timed as the step "import <name>" (cheap if already imported)"""
+    if name in sys.modules:
+        return sys.modules[name]
+    with step(f"import {name}"):
+        return importlib.import_module(name)
+
+
+def report():
+    """Milliseconds per step and per milestone, in the order they happened"""
+    return {
+        "steps_ms": {name: round(seconds * 1000, 1) for name, seconds in _steps.items()},
+        "milestones_ms": {name: round(seconds * 1000, 1) for name, seconds in _milestones.items()}
+    }
+
+
+def log_report():
+    data = report()
+    logger.info("Startup report", extra=dict(
+        {f"at_{name}_ms": ms for name, ms in data["milestones_ms"].items()},
+        **{name.replace(" ", "_") + "_ms": ms for name, ms in data["steps_ms"].items()}))
+
+
+# ------------------ Import Profile ------------------
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile_imports(statement="import face_auth_api; face_auth_api.load_dependencies()", top=15):
+    """
+    Run `statement` in a fresh interpreter under -X importtime and return
+    the `top` modules by cumulative import time as (module, cumulative_ms, self_ms)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=AI_BACKEND_DIR, capture_output=True, text=True, timeout=300)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            self_us, cumulative_us, _, module = match.groups()
+            rows.append((module, int(cumulative_us) / 1000, int(self_us) / 1000))
+    return sorted(rows, key=lambda row: -row[1])[:top]
+
+
+def log_import_profile(top=15):
+    """Log the import profile of the API (FACE_STARTUP_PROFILE=1); costs one extra interpreter"""
+    try:
+        rows = profile_imports(top=top)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning("Import profile failed", extra={"error": str(e)})
+        return
+    for module, cumulative_ms, self_ms in rows:
+        logger.info("Import time", extra={"import": module, "cumulative_ms": round(cumulative_ms, 1),
+                                          "self_ms": round(self_ms, 1)})
+
+
+# ------------------ Cold Start Measurement ------------------
+def _get_json(url, timeout):
+    import json
+    import urllib.request
+
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def measure_boot(command, url, timeout=60.0, interval=0.02):
+    """
+    Start the service with `command` and poll it; returns seconds until
+    /api/face/health first answered and until it reported ready
+    """
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=AI_BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    alive = ready = None
+    health = None
+    try:
+        while time.perf_counter() - started < timeout and proc.poll() is None:
+            try:
+                health = _get_json(url + "/api/face/health", timeout=1)
+            except OSError:
+                time.sleep(interval)
+                continue
+            alive = alive or time.perf_counter() - started
+            if health.get("ready"):
+                ready = time.perf_counter() - started
+                break
+            time.sleep(interval)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return alive, ready, health
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure the startup budget of the face auth service")
+    parser.add_argument("command", choices=["imports", "boot"])
+    parser.add_argument("--top", type=int, default=20, help="modules listed by 'imports'")
+    parser.add_argument("--port", type=int, default=5092, help="port the service is started on by 'boot'")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="exit with status 1 if liveness ('boot') or the imports take longer")
+    args = parser.parse_args()
+
+    if args.command == "imports":
+        rows = profile_imports(top=args.top)
+        print(f"{'module':50s} {'cumulative ms':>14s} {'self ms':>10s}")
+        for module, cumulative_ms, self_ms in rows:
+            print(f"{module:50s} {cumulative_ms:14.1f} {self_ms:10.1f}")
+        elapsed_ms = rows[0][1] if rows else 0.0
+    else:
+        os.environ["FACE_AUTH_PORT"] = str(args.port)
+        alive, ready, health = measure_boot([sys.executable, "-m", "face_auth.server"],
+                                            f"http://127.0.0.1:{args.port}")
+        if alive is None:
+            print("The service did not answer /api/face/health")
+            sys.exit(1)
+        print(f"liveness: {alive * 1000:.0f} ms after spawn")
+        print(f"ready: {ready * 1000:.0f} ms after spawn" if ready else "ready: not within the timeout")
+        for name, ms in (health or {}).get("startup", {}).get("steps_ms", {}).items():
+            print(f"  {name}: {ms:.1f} ms")
+        elapsed_ms = alive * 1000
+    if args.budget_ms is not None and elapsed_ms > args.budget_ms:
+        print(f"Over budget: {elapsed_ms:.0f} ms > {args.budget_ms:.0f} ms")
+        sys.exit(1)
@@ -0,0 +1,691 @@
+import json
+import os
+import pickle
+import struct
+import sys
+import threading
+import uuid
+import zlib
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import Future
+from contextlib import contextmanager
+from itertools import islice
+import numpy as np
+# Add parent directory to path so the face_auth package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_auth.metrics import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process writer lock, run a single process
+    fcntl = None
+
+logger = get_logger("store")
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+# Binary embedding store:
+#   <base>.idx.json   checkpoint: user -> (offset, count) index, dim, embedder, last WAL seq
+#   <base>.<gen>.f32  float32 rows, append-only within a generation
+#   <base>.wal        write-ahead log of put/delete records since the checkpoint
+#   <base>.lock       writer lock shared by every process
+# The checkpoint also holds a random store id, so replicas following this
+# store (face_auth/replication.py) notice when it is replaced by another.
+# FACE_STORE_PATH moves the store (e.g. to run two nodes side by side).
+DEFAULT_STORE_FILE = os.path.join(BASE_DIR, "face_db")
+STORE_FILE = os.environ.get("FACE_STORE_PATH", DEFAULT_STORE_FILE)
+
+# Legacy pickle DB migrated into the default store on first use
+PICKLE_FILE = os.path.join(BASE_DIR, "face_db.pkl")
+
+# Compact once garbage rows (replaced/removed users) exceed this fraction
+COMPACT_RATIO = float(os.environ.get("FACE_STORE_COMPACT_RATIO", "0.5"))
+
+# Fold the WAL into the checkpoint once it holds this many records
+CHECKPOINT_RECORDS = int(os.environ.get("FACE_WAL_CHECKPOINT_RECORDS", "1000"))
+
+# Bulk imports commit this many users per WAL group
+BULK_CHUNK = 10000
+
+# Version 2 adds the WAL and the "seq" field
+FORMAT_VERSION = 2
+
+# WAL record: header, name, embedder name, crc32 of all three
+WAL_MAGIC = b"FWAL"
+OP_PUT = 1
+OP_DELETE = 2
+_RECORD = struct.Struct("<4sQBQIIHB")  # magic, seq, op, offset, count, dim, name len, embedder len
+_CRC = struct.Struct("<I")
+
+_Op = namedtuple("_Op", "kind name embeddings embedder adopt")
+
+# A write applied from the WAL; span is (offset, count) for puts, None for deletes
+Change = namedtuple("Change", "op name span seq")
+
+
+class StoreMismatchError(ValueError):
+    """Raised when embeddings do not fit the store (e.g. wrong dimension)"""
+
+
+class EmbedderMismatchError(StoreMismatchError):
+    """Raised when embeddings from one embedder meet a store built by another"""
+
+
+class _WalGap(Exception):
+    """The WAL no longer continues from the last applied record (checkpointed meanwhile)"""
+
+
+def data_file(base_path, generation):
+    """Row file of one store generation"""
+    return f"{base_path}.{generation}.f32"
+
+
+# ------------------ Store Snapshot ------------------
+class StoreSnapshot(Mapping):
+    """
+    Read-only {username: embeddings} view over the memory-mapped rows.
+
+    Values are slices of `matrix`, so building the view costs O(users)
+    and nothing is copied out of the page cache.
+    """
+
+    def __init__(self, matrix, users, names=None, offsets=None, counts=None, seq=0, generation=0, path=None):
+        self.matrix = matrix
+        self._users = users
+        if names is None:
+            names = sorted(users, key=lambda name: users[name][0])
+            offsets = np.asarray([users[n][0] for n in names], dtype=np.int64)
+            counts = np.asarray([users[n][1] for n in names], dtype=np.int64)
+        self.users = names
+        self.offsets = offsets
+        self.counts = counts
+        self.seq = seq
+        # Where the rows live: store base path and data file generation
+        self.generation = generation
+        self.path = path
+
+    @property
+    def data_path(self):
+        """File holding the rows of `matrix` (None when not backed by a store)"""
+        return data_file(self.path, self.generation) if self.path else None
+
+    def apply(self, matrix, changes):
+        """
+        New snapshot with WAL changes applied. Rows of new users always sit
+        after all existing rows, so the offset order holds without a re-sort.
+        """
+        users = dict(self._users)
+        touched = set()
+        for change in changes:
+            touched.add(change.name)
+            if change.op == OP_PUT:
+                users[change.name] = tuple(change.span)
+            else:
+                users.pop(change.name, None)
+
+        gone = sorted(int(np.searchsorted(self.offsets, self._users[name][0]))
+                      for name in touched if name in self._users)
+        names = list(self.users)
+        for pos in reversed(gone):
+            del names[pos]
+        offsets = np.delete(self.offsets, gone)
+        counts = np.delete(self.counts, gone)
+
+        added = sorted((users[name][0], name) for name in touched if name in users)
+        if added:
+            names.extend(name for _, name in added)
+            offsets = np.concatenate([offsets, np.asarray([users[n][0] for _, n in added], dtype=np.int64)])
+            counts = np.concatenate([counts, np.asarray([users[n][1] for _, n in added], dtype=np.int64)])
+        return StoreSnapshot(matrix, users, names, offsets, counts, seq=changes[-1].seq,
+                             generation=self.generation, path=self.path)
+
+    def __getitem__(self, name):
+        offset, count = self._users[name]
+        return self.matrix[offset:offset + count]
+
+    def __iter__(self):
+        return iter(self.users)
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, name):
+        return name in self._users
+
+
+# ------------------ Write-Ahead Log ------------------
+def _encode_record(seq, op, name, offset=0, count=0, dim=0, embedder=None):
+    name_bytes = name.encode("utf-8")
+    embedder_bytes = (embedder or "").encode("utf-8")
+    body = _RECORD.pack(WAL_MAGIC, seq, op, offset, count, dim, len(name_bytes), len(embedder_bytes))
+    body += name_bytes + embedder_bytes
+    return body + _CRC.pack(zlib.crc32(body))
+
+
+def _decode_records(buffer):
+    """Yield (end, seq, op, name, offset, count, dim, embedder) for each complete record"""
+    pos = 0
+    while pos + _RECORD.size <= len(buffer):
+        magic, seq, op, offset, count, dim, name_len, embedder_len = _RECORD.unpack_from(buffer, pos)
+        end = pos + _RECORD.size + name_len + embedder_len
+        if magic != WAL_MAGIC or end + _CRC.size > len(buffer):
+            return
+        (crc,) = _CRC.unpack_from(buffer, end)
+        if crc != zlib.crc32(buffer[pos:end]):
+            # Torn write from a crashed writer: the next writer truncates it
+            return
+        name = bytes(buffer[pos + _RECORD.size:end - embedder_len]).decode("utf-8")
+        embedder = bytes(buffer[end - embedder_len:end]).decode("utf-8") or None
+        pos = end + _CRC.size
+        yield pos, seq, op, name, offset, count, dim, embedder
+
+
+# ------------------ Embedding Store ------------------
+class EmbeddingStore:
+    """
+    Append-only float32 embedding file, a JSON checkpoint and a write-ahead log.
+
+    A registration appends its rows to the data file and a small put record
+    to the WAL, so a write costs O(its own rows) however large the store is.
+    Concurrent writers are batched into one group commit (one fsync of each
+    file) under a writer lock shared across processes. Readers tail the WAL
+    to see new users; every CHECKPOINT_RECORDS records the WAL is folded into
+    the checkpoint, and replaced users leave garbage rows behind until
+    `compact()` rewrites the live rows into a new generation file.
+    """
+
+    def __init__(self, base_path=STORE_FILE):
+        self.base_path = base_path
+        self.index_path = base_path + ".idx.json"
+        self.wal_path = base_path + ".wal"
+        self.lock_path = base_path + ".lock"
+        self.meta = None
+        self.matrix = None
+        self.wal_records = 0
+        # Seq folded into the checkpoint; the WAL holds every write after it
+        self.checkpoint_seq = 0
+        # Rows still referenced by a user, kept current so writes stay O(1)
+        self.live_rows = 0
+        self._snapshot = None
+        self._wal_offset = 0
+        self._checkpoint_stamp = None
+        self._changes = []
+        # Every change in the WAL (writes since the checkpoint), for the change feed
+        self._history = []
+        self._reloaded = False
+        # Guards the in-memory state; also the in-process half of the writer lock
+        self._state_lock = threading.RLock()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.index_path) or os.path.exists(self.wal_path)
+
+    def _data_path(self, generation):
+        return data_file(self.base_path, generation)
+
+    @property
+    def data_path(self):
+        return self._data_path(self.meta["generation"])
+
+    @property
+    def dim(self):
+        return self.meta["dim"] if self.meta else 0
+
+    @property
+    def seq(self):
+        """Sequence number of the last applied write"""
+        return self.meta["seq"] if self.meta else 0
+
+    @property
+    def stamp(self):
+        """Identifies the store contents: (generation, seq)"""
+        return (self.meta["generation"], self.meta["seq"]) if self.meta else None
+
+    @property
+    def store_id(self):
+        """Random id given to the store by its first write (None for an older, untouched store)"""
+        return self.meta.get("store_id") if self.meta else None
+
+    @property
+    def embedder(self):
+        """Name of the embedder that produced the stored vectors (None if unknown)"""
+        return self.meta.get("embedder") if self.meta else None
+
+    def check_embedder(self, embedder, adopt_untagged=False):
+        """Reject writing `embedder` vectors into a store holding another embedder's"""
+        _check_embedder(bool(self.meta["users"]), self.embedder, embedder, adopt_untagged)
+
+    # -------- reading --------
+    def open(self):
+        """Load the checkpoint, replay the WAL and map the row file (no rows are read)"""
+        with self._state_lock:
+            while True:
+                self._load_checkpoint()
+                self._wal_offset = 0
+                self.wal_records = 0
+                self._history = []
+                try:
+                    self._read_wal()
+                    break
+                except _WalGap:
+                    # Checkpointed between reading the two files: start over
+                    continue
+            self._map()
+            users = {name: tuple(span) for name, span in self.meta["users"].items()}
+            self._snapshot = StoreSnapshot(self.matrix, users, seq=self.meta["seq"],
+                                           generation=self.meta["generation"], path=self.base_path)
+            self._changes = []
+            self._reloaded = True
+        return self
+
+    def _file_stamp(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load_checkpoint(self):
+        self._checkpoint_stamp = self._file_stamp(self.index_path)
+        if self._checkpoint_stamp is None:
+            self.meta = {"format": FORMAT_VERSION, "generation": 0, "dim": 0, "rows": 0, "seq": 0,
+                         "embedder": None, "users": {}}
+            self.live_rows = 0
+            self.checkpoint_seq = 0
+            return
+        with open(self.index_path, "r") as f:
+            self.meta = json.load(f)
+        self.meta.setdefault("seq", 0)
+        self.meta.setdefault("embedder", None)
+        self.checkpoint_seq = self.meta["seq"]
+        self.live_rows = sum(count for _, count in self.meta["users"].values())
+
+    def _read_wal(self):
+        """Apply the WAL records written since the last read; returns them as Changes"""
+        try:
+            with open(self.wal_path, "rb") as f:
+                f.seek(self._wal_offset)
+                buffer = f.read()
+        except FileNotFoundError:
+            return []
+
+        meta = self.meta
+        changes = []
+        consumed = 0
+        for end, seq, op, name, offset, count, dim, embedder in _decode_records(memoryview(buffer)):
+            consumed = end
+            self.wal_records += 1
+            if seq <= meta["seq"]:
+                # Already part of the checkpoint
+                continue
+            if seq != meta["seq"] + 1:
+                raise _WalGap(f"WAL jumps from {meta['seq']} to {seq}")
+            previous = meta["users"].get(name)
+            if previous is not None:
+                self.live_rows -= previous[1]
+            if op == OP_PUT:
+                self.live_rows += count
+                meta["users"][name] = [offset, count]
+                meta["rows"] = max(meta["rows"], offset + count)
+                meta["dim"] = meta["dim"] or dim
+                meta["embedder"] = embedder
+                changes.append(Change(OP_PUT, name, (offset, count), seq))
+            else:
+                meta["users"].pop(name, None)
+                changes.append(Change(OP_DELETE, name, None, seq))
+            meta["seq"] = seq
+        self._wal_offset += consumed
+        self._changes.extend(changes)
+        self._history.extend(changes)
+        return changes
+
+    def _map(self):
+        rows, dim = self.meta["rows"], self.meta["dim"]
+        if rows == 0:
+            self.matrix = np.zeros((0, dim), dtype=np.float32)
+        else:
+            self.matrix = np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(rows, dim))
+
+    def refresh(self):
+        """
+        Catch up with writes made by other processes: tail the WAL, or reopen
+        after a checkpoint/compaction. Returns True if anything changed.
+        """
+        with self._state_lock:
+            if self.meta is None or self._file_stamp(self.index_path) != self._checkpoint_stamp:
+                self.open()
+                return True
+            try:
+                size = os.path.getsize(self.wal_path)
+            except FileNotFoundError:
+                size = 0
+            if size == self._wal_offset:
+                return False
+            try:
+                if size < self._wal_offset:
+                    raise _WalGap("WAL was truncated")
+                changes = self._read_wal()
+            except _WalGap:
+                self.open()
+                return True
+            if not changes:
+                return False
+            self._map()
+            self._snapshot = self._snapshot.apply(self.matrix, changes)
+            return True
+
+    def snapshot(self):
+        return self._snapshot
+
+    def take_changes(self):
+        """
+        Return (reloaded, changes) since the last call. `reloaded` is True
+        when the store was reopened, in which case changes are not incremental.
+        """
+        with self._state_lock:
+            reloaded, changes = self._reloaded, self._changes
+            self._reloaded, self._changes = False, []
+        return reloaded, changes
+
+    def changes_since(self, seq):
+        """
+        Net writes after `seq` as (seq, [(name, rows or None if removed)]),
+        read from the WAL, so the cost follows the number of changed users.
+        None when `seq` is older than the checkpoint (or newer than the
+        store): those changes are gone and the caller needs a snapshot.
+        """
+        with self._state_lock:
+            self.refresh()
+            if seq < self.checkpoint_seq or seq > self.seq:
+                return None
+            snapshot = self._snapshot
+            names = dict.fromkeys(change.name for change in self._history if change.seq > seq)
+            return snapshot.seq, [(name, snapshot.get(name)) for name in names]
+
+    @property
+    def garbage_rows(self):
+        return self.meta["rows"] - self.live_rows
+
+    # -------- writing --------
+    @contextmanager
+    def _writer_lock(self):
+        """Single writer: the in-process lock, then an exclusive flock across processes"""
+        with self._state_lock:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    def _write_meta(self, meta):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(meta, format=FORMAT_VERSION), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+        self.meta = meta
+        self.checkpoint_seq = meta["seq"]
+        self._history = []
+        self._checkpoint_stamp = self._file_stamp(self.index_path)
+
+    def _as_rows(self, embeddings, dim=None):
+        dim = self.dim if dim is None else dim
+        block = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[None, :]
+        if block.ndim != 2 or len(block) == 0:
+            raise StoreMismatchError("Embeddings must be a non-empty 2D array")
+        if dim and block.shape[1] != dim:
+            raise StoreMismatchError(f"Embedding size {block.shape[1]} does not match store size {dim}")
+        return block
+
+    def _submit(self, op):
+        """
+        Group commit: queue the write, then whoever gets the writer lock
+        commits everything queued so far with one fsync per file.
+        """
+        future = Future()
+        with self._pending_lock:
+            self._pending.append((op, future))
+        with self._writer_lock():
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                try:
+                    self._commit(batch)
+                except BaseException as e:
+                    # Every writer in the batch waits on its future: fail them all
+                    _fail_batch(batch, e)
+                    raise
+        return future.result()
+
+    def _commit(self, batch):
+        """Write a batch of (op, future) pairs; call with the writer lock held"""
+        self.refresh()
+        if self.store_id is None:
+            # First write to this store (or to one from before store ids): checkpoint it with a new id
+            self.meta["store_id"] = uuid.uuid4().hex
+            self._write_meta(self.meta)
+            self._truncate_wal()
+        meta = self.meta
+        has_users, tag = bool(meta["users"]), meta["embedder"]
+        present, deleted = set(), set()
+        dim, row = meta["dim"], meta["rows"]
+        blocks, records, results = [], [], []
+
+        for op, future in batch:
+            try:
+                if op.kind == OP_PUT:
+                    _check_embedder(has_users, tag, op.embedder, op.adopt)
+                    block = self._as_rows(op.embeddings, dim)
+                    dim = block.shape[1]
+                    records.append((OP_PUT, op.name, row, len(block), dim, op.embedder))
+                    blocks.append(block)
+                    row += len(block)
+                    has_users, tag = True, op.embedder
+                    present.add(op.name)
+                    deleted.discard(op.name)
+                    results.append((future, True))
+                else:
+                    exists = (op.name in meta["users"] or op.name in present) and op.name not in deleted
+                    if exists:
+                        records.append((OP_DELETE, op.name))
+                        present.discard(op.name)
+                        deleted.add(op.name)
+                    results.append((future, exists))
+            except Exception as e:
+                future.set_exception(e)
+
+        if records:
+            if blocks:
+                # Rows beyond meta["rows"] are leftovers from an interrupted commit
+                with open(self._data_path(meta["generation"]), "ab") as f:
+                    f.truncate(meta["rows"] * meta["dim"] * 4)
+                    f.seek(0, os.SEEK_END)
+                    for block in blocks:
+                        f.write(block.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            seq = meta["seq"]
+            payload = b"".join(_encode_record(seq + i + 1, *record) for i, record in enumerate(records))
+            with open(self.wal_path, "ab") as f:
+                # Drop a torn record left by a crashed writer before appending
+                f.truncate(self._wal_offset)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # The WAL write is the commit point; apply it like any reader would
+            changes = self._read_wal()
+            self._map()
+            self._snapshot = self._snapshot.apply(self.matrix, changes)
+
+        for future, result in results:
+            future.set_result(result)
+
+    def append(self, name, embeddings, embedder=None, adopt_untagged=False):
+        """
+        Append one user's rows (replacing any previous ones); durable on return.
+        adopt_untagged lets a tagged write claim a legacy untagged store.
+        """
+        return self._submit(_Op(OP_PUT, name, embeddings, embedder, adopt_untagged))
+
+    def remove(self, name):
+        return self._submit(_Op(OP_DELETE, name, None, None, False))
+
+    def append_many(self, items, embedder=None):
+        """
+        Bulk import: commit (name, embeddings) pairs in large groups, then
+        checkpoint. Returns [(name, error)] for the users that were rejected.
+        """
+        failed = []
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, BULK_CHUNK))
+            if not chunk:
+                break
+            failed.extend(self.write_many(chunk, embedder))
+        self.checkpoint()
+        return failed
+
+    def write_many(self, items, embedder=None, adopt_untagged=False):
+        """
+        Commit (name, embeddings) puts and (name, None) removals as one
+        group. Returns [(name, error)] for the writes that were rejected.
+        """
+        batch = [(_Op(OP_DELETE, name, None, None, False) if embeddings is None
+                  else _Op(OP_PUT, name, embeddings, embedder, adopt_untagged), Future())
+                 for name, embeddings in items]
+        if batch:
+            with self._writer_lock():
+                try:
+                    self._commit(batch)
+                except BaseException as e:
+                    _fail_batch(batch, e)
+                    raise
+        return [(op.name, future.exception()) for op, future in batch if future.exception()]
+
+    # -------- maintenance --------
+    def needs_checkpoint(self):
+        return self.wal_records >= CHECKPOINT_RECORDS
+
+    def checkpoint(self):
+        """Fold the WAL into the checkpoint and empty it (other readers reopen once)"""
+        with self._writer_lock():
+            self.refresh()
+            self._write_meta(self.meta)
+            self._truncate_wal()
+
+    def _truncate_wal(self):
+        with open(self.wal_path, "ab") as f:
+            f.truncate(0)
+            f.flush()
+            os.fsync(f.fileno())
+        self._wal_offset = 0
+        self.wal_records = 0
+
+    def needs_compaction(self):
+        rows = self.meta["rows"]
+        return rows > 0 and self.garbage_rows / rows > COMPACT_RATIO
+
+    def compact(self):
+        """Rewrite live rows into a new generation file and switch atomically"""
+        with self._writer_lock():
+            self.refresh()
+            old_path = self.data_path
+            meta = dict(self.meta, users={})
+            meta["generation"] = self.meta["generation"] + 1
+            new_path = self._data_path(meta["generation"])
+
+            offset = 0
+            with open(new_path, "wb") as f:
+                for name, (start, count) in sorted(self.meta["users"].items(), key=lambda item: item[1][0]):
+                    f.write(np.ascontiguousarray(self.matrix[start:start + count]).tobytes())
+                    meta["users"][name] = [offset, count]
+                    offset += count
+                f.flush()
+                os.fsync(f.fileno())
+            meta["rows"] = offset
+
+            self._write_meta(meta)
+            self._truncate_wal()
+            self.open()
+            # Readers that still map the old file keep their pages until they reload
+            if os.path.exists(old_path):
+                os.remove(old_path)
+
+
+def _fail_batch(batch, error):
+    """Resolve the futures of a batch whose commit failed"""
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+def _check_embedder(has_users, tag, embedder, adopt_untagged=False):
+    if not has_users or embedder == tag or (adopt_untagged and tag is None):
+        return
+    raise EmbedderMismatchError(f"Store holds '{tag or 'untagged'}' embeddings, got '{embedder or 'untagged'}'")
+
+
+# ------------------ Migration ------------------
+def migrate_from_pickle(pickle_path=PICKLE_FILE, base_path=STORE_FILE, embedder=None, dim=None):
+    """
+    Copy every user from the legacy pickle DB into a new binary store,
+    tagged with `embedder`. Raises StoreMismatchError, writing nothing, when
+    the pickle's vectors are not `dim` long (the embedder's size, if known).
+    """
+    store = EmbeddingStore(base_path)
+    if store.exists():
+        raise FileExistsError(f"Store already exists at {store.index_path}")
+
+    with open(pickle_path, "rb") as f:
+        db = pickle.load(f)
+
+    sizes = {np.asarray(embeddings).shape[-1] for embeddings in db.values() if len(embeddings)}
+    if dim and sizes and dim not in sizes:
+        raise StoreMismatchError(f"{pickle_path} holds {'/'.join(map(str, sorted(sizes)))}-d embeddings, "
+                                 f"'{embedder or 'the embedder'}' produces {dim}-d ones")
+
+    store.open()
+    skipped = store.append_many(db.items(), embedder)
+    for name, error in skipped:
+        logger.warning("Not migrating user", extra={"user": name, "error": str(error)})
+    logger.info("Migrated pickle DB", extra={"users": len(db) - len(skipped), "pickle": pickle_path,
+                                             "store": store.index_path})
+    return store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the binary face embedding store")
+    parser.add_argument("command", choices=["migrate", "compact", "checkpoint", "info"])
+    parser.add_argument("--pickle", default=PICKLE_FILE, help="legacy pickle DB to migrate")
+    parser.add_argument("--embedder", default=None, help="embedder that produced the pickle's vectors (tags the store)")
+    parser.add_argument("--store", default=STORE_FILE, help="store base path (without extension)")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        from face_auth.embedders import embedder_dim
+
+        migrate_from_pickle(args.pickle, args.store, args.embedder, embedder_dim(args.embedder) if args.embedder else None)
+    else:
+        store = EmbeddingStore(args.store).open()
+        if args.command == "compact":
+            store.compact()
+        elif args.command == "checkpoint":
+            store.checkpoint()
+        print(f"users: {len(store.meta['users'])}")
+        print(f"rows: {store.meta['rows']} ({store.garbage_rows} garbage)")
+        print(f"dim: {store.dim}")
+        print(f"embedder: {store.embedder or 'untagged'}")
+        print(f"store id: {store.store_id or 'none yet'}")
+        print(f"seq: {store.seq} ({store.wal_records} WAL records since the checkpoint)")
+        print(f"data file: {store.data_path}")
@@ -0,0 +1,505 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from face_auth.matcher import EmbeddingMatcher, MAX_DISTANCE, top_k
+from face_auth.metrics import (TIER_CHUNK_SECONDS, TIER_CHUNKS, TIER_HOT_BYTES, TIER_HOT_USERS, TIER_LOOKUPS,
+                               get_logger, timed)
+
+logger = get_logger("tiered")
+
+# Bounded-memory 1:N matching (FACE_INDEX=tiered). Users who authenticated
+# recently sit in a fixed-size in-RAM block (LRU eviction); everyone else is
+# scored from the store file, read a chunk at a time into one reused buffer
+# (pread, so cold rows never stay mapped in the process). A 1:1 check of a
+# claimed user reads just that user's rows and promotes them.
+
+# RAM for the hot block; on top of it each searching thread holds one chunk
+# buffer, and the per-chunk norms and layout take 12 bytes per stored row
+MEMORY_BUDGET_MB = float(os.environ.get("FACE_MEMORY_BUDGET_MB", "64"))
+
+# Rows reserved per hot user; users enrolled with more are always scanned cold
+SLOT_ROWS = int(os.environ.get("FACE_TIER_SLOT_ROWS", "10"))
+
+# Rows read and scored per cold chunk (8 MB at 128-d)
+CHUNK_ROWS = int(os.environ.get("FACE_TIER_CHUNK_ROWS", "16384"))
+
+# Skip the cold scan when a hot user already scores this much (0 = always
+# scan, exact results); lets regular users' logins stay in RAM
+EARLY_ACCEPT = float(os.environ.get("FACE_TIER_EARLY_ACCEPT", "0"))
+
+# Last index built per store, so a rebuilt index starts with the same hot users
+_previous = {}
+
+
+# ------------------ Tiered Index ------------------
+class TieredIndex:
+    """
+    Exact search (same results as FlatIndex unless EARLY_ACCEPT is set)
+    with a memory bound: the hot block holds at most
+    FACE_MEMORY_BUDGET_MB of embeddings, cold users are streamed from disk.
+
+    Hot users live in slots of SLOT_ROWS rows; a search scores the used
+    slots with one matrix product, then reads and scores only the chunks
+    that hold at least one cold user. The best match of every probe, and
+    every user fetched with user_rows(), moves to the front of the LRU.
+
+    Writes are applied in place: a new user is appended to the last chunk
+    and goes straight into the hot block, a removed one is masked out
+    until the next build. Positions only ever grow, and searches work on
+    the arrays they found under the lock, which writes replace rather
+    than resize.
+    """
+
+    kind = "tiered"
+    incremental = True
+
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB, slot_rows=SLOT_ROWS, chunk_rows=CHUNK_ROWS,
+                 early_accept=EARLY_ACCEPT, metric="euclidean"):
+        self.budget_mb = budget_mb
+        self.slot_rows = slot_rows
+        self.chunk_rows = chunk_rows
+        self.early_accept = early_accept
+        self.metric = metric
+        self.users = []
+        self.hot_hits = 0
+        self.cold_hits = 0
+        self._positions = None
+        # Store file the rows are read from (None: read from self._matrix)
+        self._path = None
+        self._fd = None
+        self._fd_users = 0
+        self._closed = False
+        self._fd_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._layout([], np.zeros((0, 0), dtype=np.float32), np.zeros(0, np.int64), np.zeros(0, np.int64))
+
+    def __len__(self):
+        return len(self.users) - self._removed
+
+    def __del__(self):
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+
+    def close(self):
+        """Release the store file once in-flight reads finish (a late search reopens it per read)"""
+        with self._fd_lock:
+            self._closed = True
+            if self._fd_users == 0:
+                self._close_fd()
+
+    def _close_fd(self):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+
+    # -------- layout --------
+    def build(self, db):
+        path = getattr(db, "data_path", None)
+        if getattr(db, "matrix", None) is not None:
+            users, matrix, offsets, counts = list(db.users), db.matrix, db.offsets, db.counts
+        else:
+            # A plain mapping: its packed matrix stands in for the store file
+            packed = EmbeddingMatcher(db, self.metric)
+            users, matrix, offsets, counts = packed.users, packed.matrix, packed.offsets, packed.counts
+        with self._fd_lock:
+            self._close_fd()
+            self._closed = False
+            self._path = path if path is not None and hasattr(os, "preadv") else None
+            if self._path is not None and os.path.exists(self._path):
+                # Rows a compaction moves to a new file stay readable here until the next build
+                self._fd = os.open(self._path, os.O_RDONLY)
+        self._layout(users, matrix, offsets, counts)
+
+        key = getattr(db, "path", None)
+        previous = _previous.get(key)
+        previous = previous() if previous is not None else None
+        if previous is not None:
+            self._adopt_hot(previous)
+        _previous[key] = weakref.ref(self)
+        return self
+
+    def _layout(self, users, matrix, offsets, counts):
+        self.users = users
+        self.dim = matrix.shape[1]
+        self._matrix = matrix
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._counts = np.asarray(counts, dtype=np.int64)
+        self._ends = self._offsets + self._counts
+        self._positions = None
+
+        # Removed users keep their position, masked out of every search
+        self._dead = np.zeros(len(users), dtype=bool)
+        self._removed = 0
+
+        # Chunks: runs of users whose rows start in the same CHUNK_ROWS window
+        if len(users):
+            window = self._offsets // self.chunk_rows
+            starts = np.flatnonzero(np.r_[True, window[1:] != window[:-1]])
+            self._chunks = np.r_[starts, len(users)]
+            self._chunk_span = int(np.max(self._ends[self._chunks[1:] - 1] - self._offsets[starts]))
+        else:
+            self._chunks = np.zeros(1, dtype=np.int64)
+            self._chunk_span = 0
+        self._chunk_layouts = self._layout_chunks()
+
+        # Hot block, sized by the budget but never beyond the users that fit
+        # a slot (it grows up to the budget as users are added)
+        slot_bytes = self.slot_rows * max(self.dim, 1) * 4 + self.slot_rows * 8
+        self._max_capacity = int(self.budget_mb * 2**20) // slot_bytes
+        capacity = min(self._max_capacity, int(np.count_nonzero(self._counts <= self.slot_rows)))
+        self.capacity = capacity
+        self._hot = np.zeros((capacity, self.slot_rows, self.dim), dtype=np.float32)
+        self._hot_sq = np.zeros((capacity, self.slot_rows), dtype=np.float32)
+        self._hot_norms = np.zeros((capacity, self.slot_rows), dtype=np.float32)
+        self._hot_counts = np.zeros(capacity, dtype=np.int64)
+        self._slot_user = np.full(capacity, -1, dtype=np.int64)
+        self._hot_mask = np.zeros(len(users), dtype=bool)
+        self._lru = OrderedDict()              # user position -> slot, least recent first
+        self._free = list(range(capacity - 1, -1, -1))
+        self._used = 0                         # slots [0, _used) have been handed out
+        self._publish()
+
+    def _layout_chunks(self):
+        """
+        One pass over the store: a matcher per chunk holding its reduction
+        layout and row norms (12 bytes a row) but not its rows, which are
+        streamed into score_matrix(rows=...) on every search
+        """
+        buffer = self._buffer()
+        return [self._chunk_layout(a, b, buffer) for a, b in zip(self._chunks[:-1], self._chunks[1:])]
+
+    def _chunk_layout(self, a, b, buffer):
+        """(lo, hi, layout) of the chunk holding users [a, b)"""
+        lo, hi = int(self._offsets[a]), int(self._ends[b - 1])
+        layout = EmbeddingMatcher.from_arrays(range(b - a), self._read(lo, hi, buffer), self._offsets[a:b] - lo,
+                                              self._counts[a:b], self.metric)
+        layout.matrix = None
+        return lo, hi, layout
+
+    def _position(self, name):
+        if self._positions is None:
+            self._positions = {user: i for i, user in enumerate(self.users) if not self._dead[i]}
+        return self._positions.get(name)
+
+    def _adopt_hot(self, previous):
+        """Promote the users that were hot in `previous`, least recent first"""
+        with previous._lock:
+            names = [previous.users[i] for i in previous._lru]
+        for name in names:
+            i = self._position(name)
+            if i is not None:
+                rows = self._read_user(i)
+                with self._lock:
+                    self._promote(i, rows)
+
+    @property
+    def nbytes(self):
+        buffers = self._chunk_span * self.dim * 4
+        layouts = sum(layout.sq_norms.nbytes + layout.norms.nbytes + layout.owners.nbytes
+                      for _, _, layout in self._chunk_layouts)
+        return self._hot.nbytes + self._hot_sq.nbytes + self._hot_norms.nbytes + buffers + layouts
+
+    def _publish(self):
+        TIER_HOT_USERS.set(len(self._lru))
+        TIER_HOT_BYTES.set(self.nbytes)
+
+    # -------- reading rows --------
+    @contextmanager
+    def _file(self):
+        """The store file's descriptor for one read; after close() it is opened for that read only"""
+        with self._fd_lock:
+            if self._fd is None and not self._closed:
+                self._fd = os.open(self._path, os.O_RDONLY)
+            fd = self._fd
+            if fd is not None:
+                self._fd_users += 1
+        if fd is None:
+            fd = os.open(self._path, os.O_RDONLY)
+            try:
+                yield fd
+            finally:
+                os.close(fd)
+            return
+        try:
+            yield fd
+        finally:
+            with self._fd_lock:
+                self._fd_users -= 1
+                if self._closed and self._fd_users == 0:
+                    self._close_fd()
+
+    def _read(self, lo, hi, out):
+        """Copy store rows [lo, hi) into `out` (a reused buffer)"""
+        block = out[:hi - lo]
+        if self._path is None:
+            np.copyto(block, self._matrix[lo:hi])
+            return block
+        size = block.nbytes
+        with self._file() as fd:
+            got = os.preadv(fd, [memoryview(block).cast("B")], lo * self.dim * 4)
+        if got != size:
+            raise IOError(f"Short read from the face store: {got} of {size} bytes")
+        return block
+
+    def _read_user(self, i):
+        return self._read(int(self._offsets[i]), int(self._ends[i]),
+                          np.empty((int(self._counts[i]), self.dim), dtype=np.float32))
+
+    def _buffer(self):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) < self._chunk_span or buffer.shape[1] != self.dim:
+            buffer = self._local.buffer = np.empty((self._chunk_span, self.dim), dtype=np.float32)
+        return buffer
+
+    # -------- hot tier --------
+    def _promote(self, i, rows):
+        """Put user `i` at the front of the LRU, evicting the least recent; call with the lock held"""
+        slot = self._lru.get(i)
+        if slot is not None:
+            self._lru.move_to_end(i)
+            return
+        count = len(rows)
+        if self.capacity == 0 or count > self.slot_rows or self._dead[i]:
+            return
+        if self._free:
+            slot = self._free.pop()
+        else:
+            evicted, slot = self._lru.popitem(last=False)
+            self._hot_mask[evicted] = False
+        self._hot[slot, :count] = rows
+        self._hot_sq[slot, :count] = np.einsum("ij,ij->i", rows, rows)
+        self._hot_norms[slot, :count] = np.sqrt(self._hot_sq[slot, :count])
+        self._hot_counts[slot] = count
+        self._slot_user[slot] = i
+        self._lru[i] = slot
+        self._hot_mask[i] = True
+        self._used = max(self._used, slot + 1)
+        self._publish()
+
+    def _score_hot(self, probes):
+        """(F x used slots) scores of the hot users, and each slot's user; call with the lock held"""
+        used = self._used
+        if used == 0:
+            return np.zeros((len(probes), 0), dtype=np.float32), self._slot_user[:0].copy()
+        dots = (probes @ self._hot[:used].reshape(used * self.slot_rows, self.dim).T)
+        dots = dots.reshape(len(probes), used, self.slot_rows)
+        valid = np.arange(self.slot_rows)[None, :] < self._hot_counts[:used, None]
+        if self.metric == "cosine":
+            probe_norms = np.linalg.norm(probes, axis=1)[:, None, None]
+            sims = np.where(valid, dots / np.maximum(probe_norms * self._hot_norms[None, :used], 1e-12), 0.0)
+            scores = sims.sum(axis=2) / np.maximum(self._hot_counts[:used], 1)
+        else:
+            probe_sq = np.einsum("ij,ij->i", probes, probes)[:, None, None]
+            sq_dist = np.maximum(probe_sq + self._hot_sq[None, :used] - 2.0 * dots, 0.0)
+            min_dist = np.sqrt(np.where(valid, sq_dist, np.inf).min(axis=2))
+            scores = np.maximum(0.0, 1.0 - min_dist / MAX_DISTANCE)
+        return scores, self._slot_user[:used].copy()
+
+    def _grow_hot(self):
+        """Add slots while the budget allows, so a new user evicts no one; call with the lock held"""
+        if self._free or self.capacity >= self._max_capacity:
+            return
+        old = self.capacity
+        capacity = min(self._max_capacity, max(2 * old, 16))
+        extra = capacity - old
+        self._hot = np.concatenate([self._hot, np.zeros((extra, self.slot_rows, self.dim), dtype=np.float32)])
+        self._hot_sq = np.concatenate([self._hot_sq, np.zeros((extra, self.slot_rows), dtype=np.float32)])
+        self._hot_norms = np.concatenate([self._hot_norms, np.zeros((extra, self.slot_rows), dtype=np.float32)])
+        self._hot_counts = np.concatenate([self._hot_counts, np.zeros(extra, dtype=np.int64)])
+        self._slot_user = np.concatenate([self._slot_user, np.full(extra, -1, dtype=np.int64)])
+        self._free = list(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    # -------- cold tier --------
+    def _scan_cold(self, probes, cold, scores, chunks, layouts):
+        """Score the chunks holding a cold user into `scores`, straight from the store file"""
+        buffer = self._buffer()
+        for a, b, (lo, hi, layout) in zip(chunks[:-1], chunks[1:], layouts):
+            if not cold[a:b].any():
+                TIER_CHUNKS.inc(result="skipped")
+                continue
+            started = time.perf_counter()
+            # Hot users in the chunk get the same score they had from RAM
+            scores[:, a:b] = layout.score_matrix(probes, rows=self._read(lo, hi, buffer))
+            TIER_CHUNKS.inc(result="scanned")
+            TIER_CHUNK_SECONDS.observe(time.perf_counter() - started)
+
+    # -------- search --------
+    def score_matrix(self, probes, metric=None):
+        """
+        Score probes (F x D) against every user (F x U, aligned with
+        self.users) and promote each probe's best user to the hot block
+        """
+        probes = np.ascontiguousarray(probes, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        with self._lock:
+            # The layout as of now; writes meanwhile replace these arrays
+            users, dead, chunks, layouts = self.users, self._dead, self._chunks, self._chunk_layouts
+            scores = np.zeros((len(probes), len(users)), dtype=np.float32)
+            if probes.shape[1] != self.dim or len(users) == 0:
+                return scores
+            with timed("hot_scan"):
+                hot, owners = self._score_hot(probes)
+            # Copied with the scores, so users promoted meanwhile are still scanned
+            cold = ~(self._hot_mask | dead)
+        live = owners >= 0
+        scores[:, owners[live]] = hot[:, live]
+
+        accepted = self.early_accept > 0 and hot.size and bool((hot.max(axis=1) >= self.early_accept).all())
+        if not accepted:
+            with timed("cold_scan"):
+                self._scan_cold(probes, cold, scores, chunks, layouts)
+                # Removed users still sit in their chunk until the next build
+                scores[:, dead] = 0.0
+
+        for row in scores:
+            best = int(np.argmax(row))
+            if row[best] <= 0:
+                continue
+            if cold[best]:
+                self.cold_hits += 1
+                TIER_LOOKUPS.inc(kind="search", tier="cold")
+                rows = self._read_user(best)
+                with self._lock:
+                    self._promote(best, rows)
+            else:
+                self.hot_hits += 1
+                TIER_LOOKUPS.inc(kind="search", tier="hot")
+                with self._lock:
+                    if best in self._lru:
+                        self._lru.move_to_end(best)
+        return scores
+
+    def user_scores(self, probe, metric=None):
+        return self.score_matrix(probe, metric)[0]
+
+    def matcher(self):
+        """The index itself: it scores like an EmbeddingMatcher without holding every row"""
+        return self
+
+    def search(self, probe, k=1):
+        return self.search_batch(probe, k)[0]
+
+    def search_batch(self, probes, k=1):
+        return [top_k(self.users, row, k) for row in self.score_matrix(probes)]
+
+    def user_rows(self, name):
+        """One user's rows (None if not enrolled): from RAM when hot, else read and promoted"""
+        with self._lock:
+            i = self._position(name)
+            if i is None:
+                return None
+            slot = self._lru.get(i)
+            if slot is not None:
+                self._lru.move_to_end(i)
+                self.hot_hits += 1
+                TIER_LOOKUPS.inc(kind="verify", tier="hot")
+                return self._hot[slot, :self._hot_counts[slot]].copy()
+        rows = self._read_user(i)
+        self.cold_hits += 1
+        TIER_LOOKUPS.inc(kind="verify", tier="cold")
+        with self._lock:
+            self._promote(i, rows)
+        return rows
+
+    def stats(self):
+        lookups = self.hot_hits + self.cold_hits
+        return {
+            "kind": self.kind,
+            "users": len(self),
+            "hot_users": len(self._lru),
+            "hot_capacity": self.capacity,
+            "hot_hit_rate": round(self.hot_hits / lookups, 4) if lookups else None,
+            "memory_mb": round(self.nbytes / 2**20, 2),
+            "chunks": len(self._chunks) - 1
+        }
+
+    # -------- incremental updates --------
+    def add(self, name, embeddings, span=None):
+        """
+        Insert or replace one user. `span` = (offset, count) locates the
+        rows in the store file; only the last chunk's layout is redone.
+        """
+        rows = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows[None, :]
+        if len(rows) == 0:
+            self.remove(name)
+            return
+        if self._path is not None and span is None:
+            raise ValueError("Rows added to a store-backed tiered index need their span in the store")
+        with self._lock:
+            self._remove(name)
+            if self._path is None:
+                # Rows live in the packed matrix: append them
+                offset = len(self._matrix)
+                self._matrix = np.concatenate([self._matrix, rows]) if offset else rows
+            else:
+                offset = int(span[0])
+            if len(self.users) == 0:
+                # First user of an empty index sets the dimension
+                self._layout([name], rows if self._path is not None else self._matrix,
+                             [offset], [len(rows)])
+            else:
+                self._append(name, offset, len(rows))
+            self._grow_hot()
+            self._promote(len(self.users) - 1, rows)
+
+    def _append(self, name, offset, count):
+        """Put a new user after the last position and in the last chunk; call with the lock held"""
+        i = len(self.users)
+        self.users = self.users + [name]
+        self._offsets = np.append(self._offsets, offset)
+        self._counts = np.append(self._counts, count)
+        self._ends = np.append(self._ends, offset + count)
+        self._dead = np.append(self._dead, False)
+        self._hot_mask = np.append(self._hot_mask, False)
+        if self._positions is not None:
+            self._positions[name] = i
+
+        # Join the last chunk if the rows start in its window, else open a new one
+        chunks, layouts = self._chunks, list(self._chunk_layouts)
+        if len(chunks) > 1 and self._offsets[chunks[-2]] // self.chunk_rows == offset // self.chunk_rows:
+            first = int(chunks[-2])
+            chunks = np.r_[chunks[:-1], i + 1]
+            layouts.pop()
+        else:
+            first = i
+            chunks = np.r_[chunks, i + 1]
+        self._chunk_span = max(self._chunk_span, offset + count - int(self._offsets[first]))
+        layouts.append(self._chunk_layout(first, i + 1, self._buffer()))
+        self._chunks, self._chunk_layouts = chunks, layouts
+        self._publish()
+
+    def remove(self, name):
+        with self._lock:
+            self._remove(name)
+
+    def _remove(self, name):
+        """Mask a user out and free its hot slot; call with the lock held"""
+        i = self._position(name)
+        if i is None:
+            return
+        del self._positions[name]
+        self._dead[i] = True
+        self._removed += 1
+        slot = self._lru.pop(i, None)
+        if slot is not None:
+            self._hot_mask[i] = False
+            self._slot_user[slot] = -1
+            self._hot_counts[slot] = 0
+            self._free.append(slot)
+        self._publish()
+
+    def save(self, path, stamp=None):
+        """Nothing to persist: cold rows are read from the store, the hot set is rebuilt by use"""
+
+    @classmethod
+    def load(cls, path, stamp=None, metric=None):
+        return None
@@ -0,0 +1,113 @@
+import os
+import cv2
+import numpy as np
+from face_auth.metrics import timed
+
+# Shared preprocessing between face detection and the embedding backends:
+# decoded frames and face boxes in, aligned crops out. Crops are resized
+# straight into preallocated buffers and normalized as one contiguous
+# batch, so a backend can embed several frames with a single model call.
+
+# Side of the crops handed to crop-based embedders (ONNX models)
+CROP_SIZE = int(os.environ.get("FACE_CROP_SIZE", "112"))
+
+# Extra context around the detected box, as a fraction of its side
+CROP_MARGIN = float(os.environ.get("FACE_CROP_MARGIN", "0.0"))
+
+
+# ------------------ Alignment ------------------
+def square_box(box, margin=CROP_MARGIN):
+    """(x0, y0, x1, y1) of the square centred on an (x, y, w, h) box, grown by `margin`"""
+    x, y, w, h = box
+    side = max(w, h) * (1.0 + 2.0 * margin)
+    cx, cy = x + w / 2.0, y + h / 2.0
+    x0, y0 = int(round(cx - side / 2.0)), int(round(cy - side / 2.0))
+    side = int(round(side))
+    return x0, y0, x0 + side, y0 + side
+
+
+def crop_view(frame, box, margin=CROP_MARGIN):
+    """
+    The aligned crop of `box` as a view of `frame` (no copy); only crops
+    running off the frame edge are copied, padded by edge replication
+    """
+    x0, y0, x1, y1 = square_box(box, margin)
+    height, width = frame.shape[:2]
+    view = frame[max(y0, 0):min(y1, height), max(x0, 0):min(x1, width)]
+    if x0 >= 0 and y0 >= 0 and x1 <= width and y1 <= height:
+        return view
+    return cv2.copyMakeBorder(view, max(-y0, 0), max(y1 - height, 0), max(-x0, 0), max(x1 - width, 0),
+                              cv2.BORDER_REPLICATE)
+
+
+# ------------------ Crop Statistics ------------------
+def crop_stats(gray, boxes):
+    """
+    (N, 2) mean and standard deviation of each (x, y, w, h) box of a
+    grayscale frame, one pass per box over a view of the frame
+    """
+    stats = np.empty((len(boxes), 2), dtype=np.float64)
+    for i, (x, y, w, h) in enumerate(boxes):
+        mean, std = cv2.meanStdDev(gray[y:y + h, x:x + w])
+        stats[i] = mean[0, 0], std[0, 0]
+    return stats
+
+
+# ------------------ Crop Batches ------------------
+class CropBatcher:
+    """
+    Aligned, resized and normalized face crops as one contiguous float32
+    array: (N, size, size, C), or (N, C, size, size) with layout="nchw".
+    Pixels become (value - mean) * scale; swap_rb turns BGR frames into
+    RGB crops. Buffers grow to the largest batch seen and are reused, so
+    the returned array is only valid until the next call: use one batcher
+    per thread.
+    """
+
+    def __init__(self, size=CROP_SIZE, channels=3, layout="nhwc", mean=0.0, scale=1.0, swap_rb=False,
+                 margin=CROP_MARGIN):
+        self.size = size
+        self.channels = channels
+        self.layout = layout
+        self.mean = mean
+        self.scale = scale
+        self.swap_rb = swap_rb
+        self.margin = margin
+        self._pixels = np.empty((0, size, size, channels), dtype=np.uint8)
+        self._out = np.empty(0, dtype=np.float32)
+
+    def _reserve(self, count):
+        if count > len(self._pixels):
+            capacity = max(count, 2 * len(self._pixels))
+            self._pixels = np.empty((capacity, self.size, self.size, self.channels), dtype=np.uint8)
+            shape = ((capacity, self.channels, self.size, self.size) if self.layout == "nchw"
+                     else (capacity, self.size, self.size, self.channels))
+            self._out = np.empty(shape, dtype=np.float32)
+
+    def _resize_into(self, crop, dst):
+        """Resize `crop` into the preallocated `dst`, converting gray <-> colour after the resize"""
+        size = (self.size, self.size)
+        # Bilinear like cv2.dnn.blobFromImage, so embeddings match those stored before
+        if (crop.ndim == 2) == (self.channels == 1):
+            cv2.resize(crop, size, dst=dst, interpolation=cv2.INTER_LINEAR)
+            return
+        resized = cv2.resize(crop, size, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY if self.channels == 1 else cv2.COLOR_GRAY2BGR, dst=dst)
+
+    def __call__(self, frames, boxes):
+        count = len(boxes)
+        self._reserve(count)
+        pixels = self._pixels[:count]
+        with timed("preprocess"):
+            for i, (frame, box) in enumerate(zip(frames, boxes)):
+                dst = pixels[i] if self.channels > 1 else pixels[i, :, :, 0]
+                self._resize_into(crop_view(frame, box, self.margin), dst)
+            # One vectorized pass over the batch: BGR -> RGB, layout, mean and scale
+            source = pixels[..., ::-1] if self.swap_rb else pixels
+            if self.layout == "nchw":
+                source = source.transpose(0, 3, 1, 2)
+            out = self._out[:count]
+            np.subtract(source, self.mean, out=out, dtype=np.float32)
+            if self.scale != 1.0:
+                np.multiply(out, self.scale, out=out)
+        return out
@@ -1,22 +1,263 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
-import sys
-import base64
-import numpy as np
+import hmac
+import json
+import struct
+import threading
+import time
+from face_auth import metrics, profiling, startup
+from face_auth.metrics import MATCHES, THRESHOLD_HITS, get_logger, timed
+
+logger = get_logger("api")
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Try to import optional dependencies
-try:
-    import cv2
-    from PIL import Image
-    import io
-    DEPENDENCIES_AVAILABLE = True
-except ImportError:
-    print("[WARNING] Some dependencies not available. Running in mock mode.")
-    DEPENDENCIES_AVAILABLE = False
+# numpy, OpenCV, the frame pipeline and the gallery are imported by
+# load_dependencies() during warm_up(), which the servers run after binding
+# the socket: /api/face/health answers while they load. The names below
+# are bound there.
+np = get_gallery = score_rows = FaceTracker = get_pipeline = process_frame = embed_frames = warm_up_embedder = None
+EvidenceAggregator = enroll = replication = None
+CONFIDENCE_THRESHOLD = 0.65
+CANDIDATES = 5
+DEPENDENCIES_AVAILABLE = False
+
+class PipelineSaturated(Exception):
+    pass
+
+class ImageDecodeError(ValueError):
+    pass
+
+class EnrollmentError(Exception):
+    pass
+
+# Upper bound on frames accepted by /api/face/verify-batch
+MAX_BATCH_FRAMES = int(os.environ.get('FACE_MAX_BATCH_FRAMES', '30'))
+
+# Largest single frame accepted on /api/face/login-stream
+MAX_STREAM_FRAME_BYTES = int(os.environ.get('FACE_MAX_STREAM_FRAME_BYTES', str(5 * 1024 * 1024)))
+
+# Candidates returned by /api/face/identify (default and upper bound of "k")
+DEFAULT_TOP_K = int(os.environ.get('FACE_DEFAULT_TOP_K', '5'))
+MAX_TOP_K = int(os.environ.get('FACE_MAX_TOP_K', '50'))
+
+# Largest request body accepted (JSON, multipart or raw image); beyond this 413.
+# /api/face/login-stream sets its own limit from its frame cap.
+MAX_UPLOAD_BYTES = int(os.environ.get('FACE_MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+# Endpoints answered before warm_up() has finished; anything else gets a 503
+# while it runs (or runs it, if nothing has started it)
+PROBE_ENDPOINTS = {'get_face_auth_health', 'get_face_auth_ready', 'get_face_auth_status', 'get_metrics'}
+
+# Endpoints that write to the gallery; a replica (FACE_REPLICA_OF) refuses them
+WRITE_ENDPOINTS = {'register_face', 'enroll_face', 'register_face_embeddings'}
+
+# Set once the gallery, index and face detector are loaded (see warm_up)
+READY = False
+_warm_up_lock = threading.Lock()
+
+def load_dependencies():
+    """Import the request path's heavy modules, each timed in the startup report"""
+    global np, get_gallery, score_rows, CONFIDENCE_THRESHOLD, DEPENDENCIES_AVAILABLE, EvidenceAggregator, CANDIDATES
+    global PipelineSaturated, ImageDecodeError, get_pipeline, process_frame, embed_frames, warm_up_embedder, FaceTracker
+    global enroll, EnrollmentError, replication
+
+    np = startup.import_module('numpy')
+    # The face database is loaded once per process and kept in memory;
+    # writes and changes from other processes are picked up by the gallery.
+    get_gallery = startup.import_module('face_auth.gallery').get_gallery
+    score_rows = startup.import_module('face_auth.matcher').score_rows
+    CONFIDENCE_THRESHOLD = startup.import_module('face_auth.session').CONFIDENCE_THRESHOLD
+    aggregation = startup.import_module('face_auth.aggregation')
+    EvidenceAggregator, CANDIDATES = aggregation.EvidenceAggregator, aggregation.CANDIDATES
+    replication = startup.import_module('face_auth.replication')
+    try:
+        startup.import_module('cv2')
+        pipeline = startup.import_module('face_auth.pipeline')
+        PipelineSaturated, get_pipeline = pipeline.PipelineSaturated, pipeline.get_pipeline
+        ImageDecodeError = pipeline.ImageDecodeError
+        process_frame, embed_frames = pipeline.process_frame, pipeline.embed_frames
+        warm_up_embedder = startup.import_module('face_auth.embedders').warm_up_embedder
+        FaceTracker = startup.import_module('face_auth.detector').FaceTracker
+        enroll = startup.import_module('face_auth.enroll')
+        EnrollmentError = enroll.EnrollmentError
+        DEPENDENCIES_AVAILABLE = True
+    except ImportError:
+        logger.warning("Some dependencies not available. Running in mock mode.")
+        DEPENDENCIES_AVAILABLE = False
+
+def warm_up():
+    """
+    Load everything the request path needs before serving traffic.
+    The pre-fork server calls this in the master so workers share it.
+    """
+    global READY
+    with _warm_up_lock:
+        startup.mark('warm_up_started')
+        load_dependencies()
+        with startup.step('gallery'):
+            gallery = get_gallery()
+            gallery.index()
+        if DEPENDENCIES_AVAILABLE:
+            # Loads the configured embedder (and its model) once, then runs it on a dummy frame
+            with startup.step('embedder'):
+                warm_up_embedder()
+        READY = True
+        startup.mark('ready')
+    return gallery
+
+def start_warm_up():
+    """Run warm_up() on a background thread (single-process serving)"""
+    def run():
+        warm_up()
+        replicator = replication.get_replicator()
+        if replicator is not None:
+            replicator.start()
+        startup.log_report()
+        if startup.PROFILE_IMPORTS:
+            startup.log_import_profile()
+
+    thread = threading.Thread(target=run, name='face-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+startup.mark('api_imported')
+
+# ------------------ Instrumentation ------------------
+
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+    # Opt-in: the header must carry FACE_PROFILE_TOKEN (or FACE_PROFILE_SAMPLE_RATE picks the request)
+    profiling.start_request(request.headers.get('X-Face-Profile'), request.headers.get('X-Face-Profile-Mode'))
+
+@app.before_request
+def require_warm_up():
+    if READY or request.endpoint in PROBE_ENDPOINTS:
+        return None
+    if _warm_up_lock.locked():
+        return starting_response()
+    warm_up()
+    return None
+
+@app.before_request
+def refuse_writes_on_replica():
+    if request.endpoint in WRITE_ENDPOINTS and replication.REPLICA_OF:
+        return jsonify({
+            'success': False,
+            'error': f'This node is a read replica; register users on {replication.REPLICA_OF}'
+        }), 409
+    return None
+
+@app.after_request
+def record_request_timing(response):
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method)
+    metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if metrics.SERVER_TIMING or request.headers.get('X-Face-Timing') == '1':
+        timings = dict(metrics.request_timings(), total=elapsed)
+        response.headers['Server-Timing'] = metrics.server_timing_header(timings)
+    profiled = profiling.finish_request(endpoint, request.method, response.status_code, elapsed,
+                                        metrics.request_timings())
+    if profiled:
+        response.headers['X-Face-Profiled'] = profiled
+    return response
+
+@app.teardown_request
+def discard_request_profile(error):
+    profiling.discard()
+
+# ------------------ Helpers ------------------
+
+def busy_response():
+    """429 returned when the frame pipeline has no free slots"""
+    response = jsonify({
+        'success': False,
+        'error': 'Face service is busy, please retry shortly'
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+def starting_response():
+    """503 returned while warm_up() is still loading the service"""
+    response = jsonify({
+        'success': False,
+        'error': 'Face service is starting, please retry shortly'
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def invalid_image_response():
+    """400 returned when an uploaded frame cannot be decoded"""
+    return jsonify({
+        'success': False,
+        'error': 'Unsupported or corrupt image data'
+    }), 400
+
+@app.errorhandler(RequestEntityTooLarge)
+def too_large_response(e):
+    # The limit enforced for this request (login-stream sets its own)
+    return jsonify({
+        'success': False,
+        'error': f'Request body larger than {request.max_content_length} bytes'
+    }), 413
+
+def upload_bytes(upload):
+    """Contents of an uploaded file, without a copy when werkzeug kept it in memory"""
+    stream = upload.stream
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+    return upload.read()
+
+def uploaded_image():
+    """
+    The frame sent to a single-image endpoint, in any of the accepted forms:
+    a raw image body (Content-Type: image/jpeg, image/png or
+    application/octet-stream), a multipart/form-data "image" file, or JSON
+    {"image": "<base64 or data URL>"}. Binary bodies are handed to
+    cv2.imdecode as-is; only JSON pays for base64. None if no image was sent.
+    """
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        return request.get_data(cache=False) or None
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        return upload_bytes(upload) if upload else None
+    data = request.get_json(silent=True)
+    return data.get('image') if isinstance(data, dict) else None
+
+def request_options():
+    """Per-request options from the query string, then form fields or the JSON body"""
+    options = dict(request.args)
+    if request.mimetype == 'multipart/form-data':
+        options.update(request.form)
+    elif request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            options.update(data)
+    return options
+
+def frame_embedding(image):
+    """Embedding of the face in an uploaded frame, or None when no face is found"""
+    if DEPENDENCIES_AVAILABLE:
+        return get_pipeline().process(image, stop_after='embed')
+    return [0.1 + i * 0.01 for i in range(128)]  # Mock embedding
+
+def read_exact(stream, size):
+    """Read exactly `size` bytes from a request stream (None at end of stream)"""
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
 
 # ------------------ Face Authentication API ------------------
 
@@ -38,8 +279,6 @@ def register_face():
         username = data['username']
         num_frames = data.get('num_frames', 30)
 
-        # Lazy import to avoid TensorFlow loading at startup
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'face_auth'))
         from face_auth.register_enhanced import register_user as face_register
 
         # Call the enhanced registration function
@@ -57,7 +296,7 @@ def register_face():
             }), 400
 
     except Exception as e:
-        print(f"[ERROR] Face registration API error: {e}")
+        logger.error("Face registration API error", extra={'error': str(e)})
         return jsonify({
             'success': False,
             'error': 'Internal server error during registration'
@@ -74,8 +313,6 @@ def login_face():
         max_attempts = data.get('max_attempts', 50)
         confidence_threshold = data.get('confidence_threshold', 0.65)
 
-        # Lazy import to avoid TensorFlow loading at startup
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'face_auth'))
         from face_auth.login_enhanced import login as face_login
 
         # Call the enhanced login function
@@ -94,7 +331,7 @@ def login_face():
             }), 401
 
     except Exception as e:
-        print(f"[ERROR] Face login API error: {e}")
+        logger.error("Face login API error", extra={'error': str(e)})
         return jsonify({
             'success': False,
             'error': 'Internal server error during authentication'
@@ -104,7 +341,8 @@ def login_face():
 def register_face_embeddings():
     """
     Register a user with face embeddings
-    Expected JSON: {"username": "user_name", "embeddings": [[...], [...], ...]}
+    Expected JSON: {"username": "user_name", "embeddings": [[...], [...], ...], "embedder": "haar-stats"}
+    "embedder" is optional and must match the service's FACE_EMBEDDER
     """
     try:
         data = request.get_json()
@@ -124,12 +362,18 @@ def register_face_embeddings():
                 'error': 'Embeddings must be a non-empty array'
             }), 400
 
-        # Lazy import to avoid TensorFlow loading at startup
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'face_auth'))
+        embedder = data.get('embedder')
+        gallery = get_gallery()
+        if embedder and embedder != gallery.embedder:
+            return jsonify({
+                'success': False,
+                'error': f"Embeddings from '{embedder}' cannot be mixed with this service's '{gallery.embedder}' embeddings"
+            }), 400
+
         from face_auth.register_enhanced import save_user_embeddings
 
         # Save the embeddings for the user
-        success = save_user_embeddings(username, embeddings)
+        success = save_user_embeddings(username, embeddings, embedder)
 
         if success:
             return jsonify({
@@ -143,113 +387,694 @@ def register_face_embeddings():
             }), 400
 
     except Exception as e:
-        print(f"[ERROR] Face embeddings registration API error: {e}")
+        logger.error("Face embeddings registration API error", extra={'error': str(e)})
         return jsonify({
             'success': False,
             'error': 'Internal server error during registration'
         }), 500
+@app.route('/api/face/enroll', methods=['POST'])
+def enroll_face():
+    """
+    Register a user from a burst of frames or a short video, in one request.
+    Accepts multipart/form-data with one or more "frames" files or one
+    "video" file, a raw video body (Content-Type: video/*, username in the
+    query string), or JSON {"username": "...", "images": ["base64", ...]}.
+    Optional "keep": frames kept for the user (default FACE_ENROLL_KEEP,
+    at least FACE_ENROLL_MIN_FRAMES).
+    The frames are scored in parallel (face found, size, sharpness,
+    exposure) and the best, most varied ones are embedded as one batch.
+    """
+    try:
+        options = request_options()
+        username = options.get('username')
+        if not username:
+            return jsonify({
+                'success': False,
+                'error': 'Username is required'
+            }), 400
+
+        if not DEPENDENCIES_AVAILABLE:
+            return jsonify({
+                'success': False,
+                'error': 'Face enrollment is not available in mock mode'
+            }), 503
+
+        video = None
+        if request.mimetype.startswith('video/'):
+            video = request.get_data(cache=False)
+        elif request.files.get('video'):
+            video = upload_bytes(request.files['video'])
+        if video:
+            frames = enroll.video_frames(video)
+        elif request.files:
+            frames = [upload_bytes(f) for f in request.files.getlist('frames')]
+        else:
+            data = request.get_json(silent=True) or {}
+            frames = data.get('images') or []
+
+        if not isinstance(frames, list) or len(frames) == 0:
+            return jsonify({
+                'success': False,
+                'error': 'At least one frame or a video is required'
+            }), 400
+
+        if len(frames) > enroll.MAX_FRAMES:
+            return jsonify({
+                'success': False,
+                'error': f'At most {enroll.MAX_FRAMES} frames are accepted per enrollment'
+            }), 413
+
+        try:
+            keep = min(int(options.get('keep', enroll.KEEP)), enroll.MAX_FRAMES)
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': '"keep" must be an integer'
+            }), 400
+
+        if keep < enroll.MIN_FRAMES:
+            return jsonify({
+                'success': False,
+                'error': f'"keep" must be at least {enroll.MIN_FRAMES}'
+            }), 400
+
+        report = enroll.enroll(username, frames, keep=keep)
+
+        return jsonify(dict(
+            report,
+            success=True,
+            message=f'User {username} registered successfully from {report["frames_used"]} frames'
+        )), 201
+
+    except RequestEntityTooLarge:
+        raise
+    except EnrollmentError as e:
+        # Too few usable frames, or an unreadable video
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error("Face enrollment API error", extra={'error': str(e)})
+        return jsonify({
+            'success': False,
+            'error': 'Internal server error during enrollment'
+        }), 500
+
 @app.route('/api/face/verify-frame', methods=['POST'])
 def verify_face_frame():
     """
     Verify a single face frame (for real-time verification)
-    Expected JSON: {"image": "base64_encoded_image"}
+    Body: raw JPEG/PNG bytes (Content-Type: image/jpeg), multipart/form-data
+    with an "image" file, or JSON {"image": "base64_encoded_image"}
+    Option: "confidence_threshold" (default 0.65)
     """
     try:
-        data = request.get_json()
-
-        if not data or 'image' not in data:
+        image = uploaded_image()
+        if not image:
             return jsonify({
                 'success': False,
                 'error': 'Image data is required'
             }), 400
 
-        # Decode base64 image
+        try:
+            confidence_threshold = float(request_options().get('confidence_threshold', CONFIDENCE_THRESHOLD))
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid confidence_threshold'
+            }), 400
+
         if DEPENDENCIES_AVAILABLE:
-            # Strip data URL prefix if present (e.g., 'data:image/jpeg;base64,')
-            image_str = data['image']
-            if ',' in image_str:
-                image_str = image_str.split(',', 1)[1]
-            
-            image_data = base64.b64decode(image_str)
-            image = Image.open(io.BytesIO(image_data))
-            frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-
-            # Lazy import face detection functions
-            sys.path.append(os.path.join(os.path.dirname(__file__), 'face_auth'))
-            from face_auth.login_enhanced import detect_face, load_db, verify_face
-
-            # Detect face in the frame
-            embedding = detect_face(frame)
+            # decode (straight to grayscale) -> detect -> match on the pipeline pools,
+            # unless the same frame was just verified
+            result = process_frame(image)
         else:
             # Mock face detection
+            from face_auth.login_enhanced import find_best_match
             embedding = [0.1 + i * 0.01 for i in range(128)]  # Mock embedding
+            result = (embedding,) + find_best_match(embedding)
 
-        if embedding is None:
+        if result is None:
             return jsonify({
                 'success': False,
                 'error': 'No face detected in the image'
             }), 400
 
-        # Check against all registered users
-        db = load_db()
-        best_match = None
-        best_score = 0
-
-        for username, embeddings in db.items():
-            score = verify_face(embedding, embeddings)
-            if score > best_score:
-                best_score = score
-                best_match = username
+        embedding, best_match, best_score = result
+        if best_match is not None:
+            MATCHES.inc()
+        if best_score > confidence_threshold:
+            THRESHOLD_HITS.inc()
 
         return jsonify({
             'success': True,
             'detected': True,
             'best_match': best_match,
             'confidence': float(best_score),
-            'threshold_met': best_score > 0.65
+            'threshold_met': best_score > confidence_threshold
         }), 200
 
+    except PipelineSaturated:
+        return busy_response()
+    except ImageDecodeError:
+        return invalid_image_response()
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"[ERROR] Frame verification error: {e}")
+        logger.error("Frame verification error", extra={'error': str(e)})
         return jsonify({
             'success': False,
             'error': 'Error processing face frame'
         }), 500
 
+@app.route('/api/face/verify-batch', methods=['POST'])
+def verify_face_batch():
+    """
+    Verify several frames of the same person in one request
+    Expected JSON: {"images": ["base64_encoded_image", ...], "confidence_threshold": 0.65}
+    or multipart/form-data with one or more "frames" files
+    """
+    try:
+        if request.files:
+            images = [upload_bytes(f) for f in request.files.getlist('frames')]
+            options = request.form
+        else:
+            data = request.get_json(silent=True) or {}
+            images = data.get('images') or []
+            options = data
+
+        if not isinstance(images, list) or len(images) == 0:
+            return jsonify({
+                'success': False,
+                'error': 'At least one frame is required'
+            }), 400
+
+        if len(images) > MAX_BATCH_FRAMES:
+            return jsonify({
+                'success': False,
+                'error': f'At most {MAX_BATCH_FRAMES} frames are accepted per batch'
+            }), 413
+
+        try:
+            confidence_threshold = float(options.get('confidence_threshold', CONFIDENCE_THRESHOLD))
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid confidence_threshold'
+            }), 400
+
+        if DEPENDENCIES_AVAILABLE:
+            # Locate the face on the first frame, then decode and detect the rest
+            # concurrently, searching only near that face; the faces are embedded
+            # as one batch and matched below in one pass
+            embeddings = embed_frames(images, FaceTracker())
+        else:
+            embeddings = [[0.1 + i * 0.01 for i in range(128)] for _ in images]  # Mock embeddings
+
+        detected = [i for i, e in enumerate(embeddings) if e is not None]
+        frames = [{'detected': False, 'best_match': None, 'confidence': 0.0} for _ in images]
+
+        # The flat index scores every detected frame with one matrix product
+        votes = {}
+        gallery = get_gallery()
+        evidence = EvidenceAggregator(gallery.calibrator())
+        if detected:
+            probes = np.stack([np.asarray(embeddings[i], dtype=np.float32) for i in detected])
+            index = gallery.index()
+            with timed('match'):
+                results = index.search_batch(probes, k=CANDIDATES)
+            for i, matches in zip(detected, results):
+                name, score = matches[0] if matches else (None, 0.0)
+                frames[i] = {'detected': True, 'best_match': name, 'confidence': score}
+                evidence.add(matches, truncated=len(index) > CANDIDATES)
+                if name is not None:
+                    MATCHES.inc()
+                    count, top = votes.get(name, (0, 0.0))
+                    votes[name] = (count + 1, max(top, score))
+
+        # Majority vote across frames, ties broken by the best score,
+        # then the winner's best score is compared to the threshold as in login()
+        best_match, best_votes, best_score = None, 0, 0.0
+        if votes:
+            best_match, (best_votes, best_score) = max(votes.items(), key=lambda item: item[1])
+        if best_score > confidence_threshold:
+            THRESHOLD_HITS.inc()
+
+        return jsonify({
+            'success': True,
+            'frames': frames,
+            'frames_received': len(images),
+            'frames_with_face': len(detected),
+            'best_match': best_match,
+            'votes': best_votes,
+            'confidence': best_score,
+            'threshold_met': best_score > confidence_threshold,
+            # Evidence summed over the frames: "accept", "reject" or null when inconclusive
+            'aggregate': evidence.summary()
+        }), 200
+
+    except PipelineSaturated:
+        return busy_response()
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.error("Batch verification error", extra={'error': str(e)})
+        return jsonify({
+            'success': False,
+            'error': 'Error processing face frames'
+        }), 500
+
+@app.route('/api/face/identify', methods=['POST'])
+def identify_face():
+    """
+    1:N identification: the best K enrolled users for one frame
+    Body: as /api/face/verify-frame
+    Options (query, form or JSON): "k" (default 5), "confidence_threshold" (default 0.65)
+    Response: candidates best first, each with the raw "score" and a calibrated
+    "confidence" (estimated probability that the frame shows that user)
+    """
+    try:
+        image = uploaded_image()
+        if not image:
+            return jsonify({
+                'success': False,
+                'error': 'Image data is required'
+            }), 400
+
+        options = request_options()
+        try:
+            k = int(options.get('k', DEFAULT_TOP_K))
+            confidence_threshold = float(options.get('confidence_threshold', CONFIDENCE_THRESHOLD))
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid k or confidence_threshold'
+            }), 400
+        if not 1 <= k <= MAX_TOP_K:
+            return jsonify({
+                'success': False,
+                'error': f'k must be between 1 and {MAX_TOP_K}'
+            }), 400
+
+        embedding = frame_embedding(image)
+        if embedding is None:
+            return jsonify({
+                'success': False,
+                'error': 'No face detected in the image'
+            }), 400
+
+        # Partial sort (argpartition) over the whole gallery, best K only
+        gallery = get_gallery()
+        with timed('match'):
+            matches = gallery.index().search(embedding, k=k)
+        calibrate = gallery.calibrator()
+        candidates = [{
+            'username': name,
+            'score': score,
+            'confidence': calibrate(score),
+            'threshold_met': score > confidence_threshold
+        } for name, score in matches]
+
+        best = candidates[0] if candidates else None
+        if best is not None:
+            MATCHES.inc()
+            if best['threshold_met']:
+                THRESHOLD_HITS.inc()
+
+        return jsonify({
+            'success': True,
+            'detected': True,
+            'candidates': candidates,
+            'best_match': best['username'] if best else None,
+            'threshold_met': bool(best and best['threshold_met']),
+            # Gap between the two best users; a small margin means an ambiguous match
+            'margin': candidates[0]['score'] - candidates[1]['score'] if len(candidates) > 1 else None,
+            'calibrated': calibrate.fitted
+        }), 200
+
+    except PipelineSaturated:
+        return busy_response()
+    except ImageDecodeError:
+        return invalid_image_response()
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.error("Identification error", extra={'error': str(e)})
+        return jsonify({
+            'success': False,
+            'error': 'Error processing face frame'
+        }), 500
+
+@app.route('/api/face/verify', methods=['POST'])
+def verify_face_claim():
+    """
+    1:1 verification of a frame against one claimed user; only that user's
+    embeddings are scored, so the cost does not grow with the gallery
+    Body: as /api/face/verify-frame
+    Options (query, form or JSON): "username" (required), "confidence_threshold" (default 0.65)
+    """
+    try:
+        options = request_options()
+        username = options.get('username')
+        if not username:
+            return jsonify({
+                'success': False,
+                'error': 'Username is required'
+            }), 400
+        try:
+            confidence_threshold = float(options.get('confidence_threshold', CONFIDENCE_THRESHOLD))
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid confidence_threshold'
+            }), 400
+
+        # Unknown users are rejected before the frame is decoded
+        gallery = get_gallery()
+        enrolled = gallery.user_rows(username)
+        if enrolled is None:
+            return jsonify({
+                'success': False,
+                'error': 'User is not enrolled for face authentication'
+            }), 404
+
+        image = uploaded_image()
+        if not image:
+            return jsonify({
+                'success': False,
+                'error': 'Image data is required'
+            }), 400
+
+        embedding = frame_embedding(image)
+        if embedding is None:
+            return jsonify({
+                'success': False,
+                'error': 'No face detected in the image'
+            }), 400
+
+        with timed('match'):
+            score = score_rows(embedding, enrolled, gallery.metric)
+        verified = score > confidence_threshold
+        if verified:
+            THRESHOLD_HITS.inc()
+
+        return jsonify({
+            'success': True,
+            'detected': True,
+            'username': username,
+            'verified': verified,
+            'score': score,
+            'confidence': gallery.calibrator()(score),
+            'threshold_met': verified
+        }), 200
+
+    except PipelineSaturated:
+        return busy_response()
+    except ImageDecodeError:
+        return invalid_image_response()
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.error("Claimed-user verification error", extra={'error': str(e)})
+        return jsonify({
+            'success': False,
+            'error': 'Error processing face frame'
+        }), 500
+
+@app.route('/api/face/login-stream', methods=['POST'])
+def login_face_stream():
+    """
+    Streaming face login over one chunked HTTP request.
+    Body: a sequence of frames, each a 4-byte big-endian length followed by
+    JPEG/PNG bytes. Query: max_attempts, confidence_threshold,
+    verification_frames, warmup_frames.
+    Response: NDJSON, one progress line per frame and a final line with
+    "done": true, sent as soon as the evidence across frames is conclusive
+    (see face_auth/aggregation.py), usually well before verification_frames.
+    """
+    if not DEPENDENCIES_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'Streaming login requires OpenCV'
+        }), 503
+
+    from face_auth.session import LoginSession, MAX_ATTEMPTS, CONFIDENCE_THRESHOLD, VERIFICATION_FRAMES
+
+    try:
+        max_attempts = int(request.args.get('max_attempts', MAX_ATTEMPTS))
+        confidence_threshold = float(request.args.get('confidence_threshold', CONFIDENCE_THRESHOLD))
+        verification_frames = int(request.args.get('verification_frames', VERIFICATION_FRAMES))
+        warmup_frames = int(request.args.get('warmup_frames', 0))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid session parameters'
+        }), 400
+    if max_attempts < 1 or verification_frames < 1 or warmup_frames < 0:
+        return jsonify({
+            'success': False,
+            'error': 'max_attempts and verification_frames must be at least 1, warmup_frames at least 0'
+        }), 400
+
+    gallery = get_gallery()
+    # Clamped to the server's defaults so the stream's body limit stays bounded
+    max_attempts = min(max_attempts, MAX_ATTEMPTS)
+    session = LoginSession(
+        gallery.matcher(),
+        max_attempts=max_attempts,
+        confidence_threshold=confidence_threshold,
+        verification_frames=min(verification_frames, max_attempts),
+        warmup_frames=min(warmup_frames, MAX_ATTEMPTS),
+        calibrator=gallery.calibrator()
+    )
+
+    # A stream carries its warm-up frames and up to max_attempts more, each capped by
+    # MAX_STREAM_FRAME_BYTES, so it gets its own body limit instead of MAX_UPLOAD_BYTES
+    request.max_content_length = (session.warmup_frames + session.max_attempts) * (MAX_STREAM_FRAME_BYTES + 4)
+    stream = request.stream
+    pipeline = get_pipeline()
+    # Frames of one stream show the same face, so later frames search near the last box
+    tracker = FaceTracker()
+
+    def events():
+        error = None
+        while not session.done:
+            header = read_exact(stream, 4)
+            if header is None:
+                break
+            (size,) = struct.unpack('>I', header)
+            if size > MAX_STREAM_FRAME_BYTES:
+                error = f'Frame larger than {MAX_STREAM_FRAME_BYTES} bytes'
+                break
+            frame = read_exact(stream, size)
+            if frame is None:
+                break
+
+            try:
+                embedding = pipeline.process(frame, stop_after='embed', context=tracker)
+                session.add_embedding(embedding)
+            except PipelineSaturated:
+                error = 'Face service is busy, please retry shortly'
+                break
+            except Exception as e:
+                logger.debug("Skipping streamed frame", extra={'error': str(e)})
+                embedding = None
+                session.add_missed_frame()
+
+            yield json.dumps({
+                'frame': session.frames_seen,
+                'detected': embedding is not None,
+                'best_match': session.best_match_user,
+                'confidence': session.best_match_score
+            }) + '\n'
+
+        final = dict(session.decision(), done=True, success=error is None)
+        if session.authenticated:
+            THRESHOLD_HITS.inc()
+        if error:
+            final['error'] = error
+        yield json.dumps(final) + '\n'
+
+    return Response(stream_with_context(events()), mimetype='application/x-ndjson')
+
+# ------------------ Admin Endpoints ------------------
+
+def token_denied(token, feature):
+    """404 unless the feature's token is set, 401 unless the caller sends it as a Bearer token"""
+    if not token:
+        return jsonify({
+            'success': False,
+            'error': f'{feature.capitalize()} is not enabled on this node'
+        }), 404
+    sent = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode()):
+        return jsonify({
+            'success': False,
+            'error': f'Invalid {feature} token'
+        }), 401
+    return None
+
+def replication_denied():
+    """404 unless FACE_REPLICATION_TOKEN is set, 401 unless the caller sends it"""
+    return token_denied(replication.TOKEN, 'replication')
+
+@app.route('/api/face/profile', methods=['GET', 'DELETE'])
+def get_face_profile():
+    """
+    Profiling report of this serving process (FACE_PROFILE_TOKEN as a Bearer token):
+    hot functions of the profiled requests and the recent slow requests
+    Query: format=json (default), folded (sampled stacks, for flame graph
+    tools) or pstats (cProfile stats, for python -m pstats or snakeviz);
+    top=<functions listed, default 30>
+    DELETE clears the report
+    """
+    denied = token_denied(profiling.TOKEN, 'profiling')
+    if denied:
+        return denied
+    if request.method == 'DELETE':
+        profiling.report.reset()
+        return jsonify({'success': True}), 200
+
+    output = request.args.get('format', 'json')
+    if output == 'folded':
+        return Response(profiling.report.folded(), mimetype='text/plain')
+    if output == 'pstats':
+        dump = profiling.report.pstats_dump()
+        if dump is None:
+            return jsonify({
+                'success': False,
+                'error': 'No request has been profiled with cProfile yet'
+            }), 404
+        return Response(dump, mimetype='application/octet-stream', headers={
+            'Content-Disposition': f'attachment; filename=face-profile-{os.getpid()}.prof'})
+    if output != 'json':
+        return jsonify({
+            'success': False,
+            'error': 'format must be json, folded or pstats'
+        }), 400
+    top = request.args.get('top', 30, type=int)
+    return jsonify(dict(profiling.report.summary(top), success=True)), 200
+
+# ------------------ Replication ------------------
+
+@app.route('/api/face/replication/snapshot', methods=['GET'])
+def get_replication_snapshot():
+    """Every user's embeddings with the store's id and seq, as a binary feed (see face_auth/replication.py)"""
+    denied = replication_denied()
+    if denied:
+        return denied
+    return Response(replication.snapshot_feed(get_gallery().store), mimetype=replication.FEED_TYPE)
+
+@app.route('/api/face/replication/changes', methods=['GET'])
+def get_replication_changes():
+    """
+    Users registered, replaced or removed after a seq, as a binary feed
+    Query: since=<seq>&store_id=<leader store id the follower synced from>
+    410 when the changes are no longer in the WAL: pull a snapshot instead
+    """
+    denied = replication_denied()
+    if denied:
+        return denied
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({
+            'success': False,
+            'error': 'since (a store seq) is required'
+        }), 400
+    try:
+        feed = replication.changes_feed(get_gallery().store, since, request.args.get('store_id') or None)
+    except replication.ResyncRequired as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'resync': True
+        }), 410
+    return Response(feed, mimetype=replication.FEED_TYPE)
+
+@app.route('/api/face/ready', methods=['GET'])
+def get_face_auth_ready():
+    """
+    Readiness probe: 200 once the gallery and detector are loaded, 503 before
+    """
+    if not READY:
+        return jsonify({
+            'success': False,
+            'ready': False
+        }), 503
+
+    return jsonify({
+        'success': True,
+        'ready': True,
+        'pid': os.getpid(),
+        'gallery_version': get_gallery().version
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus metrics: stage/request latency histograms, frame and match
+    counters, gallery gauges (per serving process)
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/face/health', methods=['GET'])
+def get_face_auth_health():
+    """
+    Liveness probe: answers from in-memory state only (no gallery, store or
+    model access), including while warm_up() runs
+    """
+    return jsonify({
+        'success': True,
+        'alive': True,
+        'ready': READY,
+        'pid': os.getpid(),
+        'uptime_seconds': round(startup.uptime(), 3),
+        'registered_users': int(metrics.GALLERY_USERS.value()) if READY else None,
+        'startup': startup.report()
+    }), 200
+
 @app.route('/api/face/status', methods=['GET'])
 def get_face_auth_status():
     """
     Get the status of face authentication system
+    Query: users=1 to include the registered usernames
     """
+    if not READY:
+        # The gallery is still loading; report that rather than wait for it
+        return jsonify({
+            'success': True,
+            'status': 'starting',
+            'ready': False
+        }), 200
+
     try:
-        # Check for database in both possible locations
-        db_path_root = os.path.join(os.path.dirname(__file__), 'face_db.pkl')
-        db_path_subdir = os.path.join(os.path.dirname(__file__), 'face_auth', 'face_db.pkl')
-        
-        db_exists = os.path.exists(db_path_root) or os.path.exists(db_path_subdir)
-        db_path = db_path_root if os.path.exists(db_path_root) else db_path_subdir
-
-        if db_exists:
-            # Load database directly
-            import pickle
-            with open(db_path, 'rb') as f:
-                db = pickle.load(f)
-            user_count = len(db)
-            print(f"[INFO] Database found at {db_path} with {user_count} users: {list(db.keys())}")
-        else:
-            user_count = 0
-            print(f"[INFO] No database found. Checked: {db_path_root} and {db_path_subdir}")
+        gallery = get_gallery()
+        db_exists = gallery.exists
 
-        return jsonify({
+        status = {
             'success': True,
             'database_exists': db_exists,
-            'registered_users': user_count,
+            'registered_users': len(gallery),
             'status': 'ready' if db_exists else 'no_database',
-            'users': list(db.keys()) if db_exists else []
-        }), 200
+            'ready': True,
+            'embedder': gallery.embedder,
+            'gallery_version': gallery.version,
+            'store_seq': gallery.store.seq
+        }
+        replicator = replication.get_replicator()
+        if replicator is not None:
+            status['replica_of'] = replicator.status()
+        index = gallery.index()
+        if hasattr(index, 'stats'):
+            status['index'] = index.stats()
+        # The full user list is O(users) to build and send, so only on request
+        if request.args.get('users') == '1':
+            status['users'] = gallery.users()
+        return jsonify(status), 200
 
     except Exception as e:
-        print(f"[ERROR] Status check error: {e}")
+        logger.error("Status check error", extra={'error': str(e)})
         return jsonify({
             'success': False,
             'error': 'Error checking face auth status'
@@ -259,8 +1084,22 @@ if __name__ == '__main__':
     print("Starting Face Authentication API Server...")
     print("Available endpoints:")
     print("POST /api/face/register - Register user with face")
+    print("POST /api/face/enroll - Register user from a frame burst or video")
     print("POST /api/face/login - Login with face")
     print("POST /api/face/verify-frame - Verify single frame")
+    print("POST /api/face/verify-batch - Verify several frames at once")
+    print("POST /api/face/identify - Top-K candidates for a frame")
+    print("POST /api/face/verify - 1:1 check against a claimed user")
+    print("POST /api/face/login-stream - Streaming login over chunked HTTP")
     print("GET /api/face/status - Check system status")
+    print("GET /metrics - Prometheus metrics")
+    print("GET /api/face/health - Liveness probe")
+    print("GET /api/face/ready - Readiness probe")
+    print("GET /api/face/replication/changes - Change feed for replicas")
+    print("GET /api/face/replication/snapshot - Full gallery for replicas")
+    print("GET /api/face/profile - Profiling report and slow requests (admin token)")
+
+    # Load the gallery in the background; probes answer as soon as the server is up
+    start_warm_up()
 
-    app.run(host='127.0.0.1', port=5002, debug=False)
\ No newline at end of file
+    app.run(host='127.0.0.1', port=5002, debug=False, threaded=True)
@@ -18,6 +18,6 @@ source venv/bin/activate
 echo "Installing dependencies..."
 pip install -r face_auth/requirements.txt
 
-# Start the Flask API
-echo "Starting Flask API server on port 5001..."
-python face_auth_api.py
\ No newline at end of file
+# Start the pre-fork API server (FACE_AUTH_WORKERS workers, default one per CPU)
+echo "Starting face auth API server on port ${FACE_AUTH_PORT:-5002}..."
+python -m face_auth.server
\ No newline at end of file
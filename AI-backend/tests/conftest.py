@@ -0,0 +1,11 @@
+import os
+import sys
+import pytest
+# Add AI-backend to the path so the face_auth package resolves
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    """Base path of a fresh embedding store in a temporary directory"""
+    return str(tmp_path / "face_db")
@@ -0,0 +1,48 @@
+import pytest
+from face_auth.aggregation import ACCEPT, REJECT, EvidenceAggregator
+from face_auth.calibration import ScoreCalibrator
+
+
+def _aggregator():
+    # Default curve: 0.5 at 0.65, 20 log-odds per unit of score
+    return EvidenceAggregator(ScoreCalibrator(20.0, 0.65), alpha=0.001, beta=0.01, min_frames=3,
+                              max_frame_evidence=3.0)
+
+
+@pytest.fixture
+def aggregator():
+    return _aggregator()
+
+
+def _feed(aggregator, candidates, frames):
+    return [aggregator.add(candidates, truncated=False) for _ in range(frames)]
+
+
+def test_no_decision_before_min_frames(aggregator):
+    # Two low frames already reach the reject bound
+    assert _feed(aggregator, [("alice", 0.99), ("bob", 0.1)], 2) == [None, None]
+    rejecting = _aggregator()
+    assert _feed(rejecting, [("alice", 0.1)], 2) == [None, None]
+    assert aggregator.add([], truncated=False) is None
+    assert aggregator.frames == 2
+
+
+def test_accepts_a_consistent_high_scorer(aggregator):
+    assert _feed(aggregator, [("alice", 0.9), ("bob", 0.4), ("carol", 0.3)], 3) == [None, None, ACCEPT]
+    summary = aggregator.summary()
+    assert summary["username"] == "alice"
+    assert summary["decision"] == ACCEPT
+    assert summary["frames"] == 3
+
+
+def test_close_runner_up_prevents_accept(aggregator):
+    decisions = _feed(aggregator, [("alice", 0.92), ("bob", 0.91)], 10)
+    assert ACCEPT not in decisions
+    assert aggregator.evidence("alice") >= aggregator.accept_at
+    assert aggregator.margin() < aggregator.accept_at
+    assert aggregator.decision() is None
+
+
+def test_rejects_consistently_low_scores(aggregator):
+    assert _feed(aggregator, [("alice", 0.4), ("bob", 0.35)], 3) == [None, None, REJECT]
+    assert aggregator.summary()["decision"] == REJECT
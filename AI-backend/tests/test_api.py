@@ -0,0 +1,70 @@
+import io
+import pytest
+import face_auth_api as api
+from face_auth import gallery as gallery_module
+
+
+@pytest.fixture
+def client(monkeypatch, store_path):
+    """API test client serving an empty gallery in a temporary store"""
+    monkeypatch.setenv("FACE_STORE_PATH", store_path)
+    monkeypatch.setattr(gallery_module, "_gallery", gallery_module.FaceGallery(store_path).load())
+    api.warm_up()
+    return api.app.test_client()
+
+
+@pytest.mark.parametrize("endpoint", ["/api/face/verify-frame", "/api/face/identify"])
+@pytest.mark.parametrize("body", [
+    {"data": b"\xff\xd8not a jpeg", "content_type": "image/jpeg"},
+    {"json": {"image": "bm90IGFuIGltYWdl"}},
+    {"json": {"image": "data:image/jpeg;base64,abc"}},
+    {"data": {"image": b"junk"}, "content_type": "multipart/form-data"},
+])
+def test_corrupt_upload_is_a_bad_request(client, endpoint, body):
+    if body.get("content_type") == "multipart/form-data":
+        body = dict(body, data={"image": (io.BytesIO(body["data"]["image"]), "a.jpg")})
+    response = client.post(endpoint, **body)
+    assert response.status_code == 400
+    assert response.get_json() == {"success": False, "error": "Unsupported or corrupt image data"}
+
+
+@pytest.mark.parametrize("endpoint", ["/api/face/verify-frame", "/api/face/identify", "/api/face/verify"])
+def test_invalid_confidence_threshold_is_a_bad_request(client, endpoint):
+    response = client.post(endpoint, query_string={"confidence_threshold": "abc", "username": "alice"},
+                           data=b"\xff\xd8", content_type="image/jpeg")
+    assert response.status_code == 400
+    assert "confidence_threshold" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("query", ["max_attempts=0", "max_attempts=-3", "verification_frames=0", "warmup_frames=-1"])
+def test_login_stream_rejects_out_of_range_parameters(client, query):
+    response = client.post(f"/api/face/login-stream?{query}", data=b"\x00\x00\x00\x03abc",
+                           content_type="application/octet-stream")
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+
+def test_login_stream_body_limit_stays_bounded(client, monkeypatch):
+    monkeypatch.setattr(api, "MAX_STREAM_FRAME_BYTES", 100)
+    from face_auth.session import MAX_ATTEMPTS
+    limit = MAX_ATTEMPTS * 104
+    response = client.post("/api/face/login-stream?max_attempts=1000000000", data=b"\x00" * (limit + 1),
+                           content_type="application/octet-stream")
+    assert response.status_code == 413
+    assert response.get_json()["error"] == f"Request body larger than {limit} bytes"
+
+
+def test_too_large_reports_the_upload_limit(client):
+    response = client.post("/api/face/verify-frame", data=b"\x00" * (api.MAX_UPLOAD_BYTES + 1),
+                           content_type="image/jpeg")
+    assert response.status_code == 413
+    assert response.get_json()["error"] == f"Request body larger than {api.MAX_UPLOAD_BYTES} bytes"
+
+
+@pytest.mark.parametrize("keep", [0, 1, "2"])
+def test_enroll_keeps_at_least_min_frames(client, keep):
+    from face_auth.enroll import MIN_FRAMES
+    response = client.post("/api/face/enroll", json={"username": "alice", "images": ["abc"] * 5, "keep": keep})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == f'"keep" must be at least {MIN_FRAMES}'
+    assert "alice" not in gallery_module.get_gallery()
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from face_auth import cache as cache_module
+from face_auth.cache import ResultCache, embedding_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def test_a_newer_version_empties_the_cache():
+    cache = ResultCache("test", enabled=True)
+    cache.put("a", 1, "alice")
+    cache.put("b", 1, "bob")
+    assert cache.get("a", 1) == "alice"
+
+    assert cache.get("a", 2) is None
+    assert len(cache) == 0
+    cache.put("a", 2, "carol")
+    assert cache.get("a", 2) == "carol"
+
+
+def test_a_put_for_an_older_version_is_dropped():
+    cache = ResultCache("test", enabled=True)
+    cache.put("a", 2, "alice")
+    # Computed before the gallery changed, stored after
+    cache.put("b", 1, "stale")
+    assert cache.version == 2
+    assert cache.get("b", 2) is None
+    assert cache.get("a", 2) == "alice"
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResultCache("test", ttl=30, enabled=True)
+    cache.put("a", 1, "alice")
+    clock.now += 29
+    assert cache.get("a", 1) == "alice"
+    clock.now += 2
+    assert cache.get("a", 1) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache("test", max_entries=2, enabled=True)
+    cache.put("a", 1, "alice")
+    cache.put("b", 1, "bob")
+    cache.get("a", 1)
+    cache.put("c", 1, "carol")
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "alice" and cache.get("c", 1) == "carol"
+
+
+def test_embedding_key_is_stable():
+    embedding = np.random.default_rng(0).normal(0, 1, 128)
+    key = embedding_key(embedding)
+    assert embedding_key(embedding.copy()) == key
+    assert embedding_key(embedding.tolist()) == key
+    assert embedding_key(embedding.astype(np.float32)) == key
+    assert embedding_key(embedding.reshape(1, -1)) == key
+    # Well inside one grid step: same key; a real change: a different one
+    assert embedding_key(embedding * (1 + 1e-7)) == key
+    changed = embedding.copy()
+    changed[0] += 1.0
+    assert embedding_key(changed) != key
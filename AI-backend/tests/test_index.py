@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from face_auth.index import FlatIndex, IVFIndex
+
+
+def _gallery(rng, users=60, dim=16):
+    return {f"user{i}": rng.normal(0, 1, (int(rng.integers(1, 6)), dim)).astype(np.float32) for i in range(users)}
+
+
+def _assert_same_scores(flat, ivf, probes, k=5):
+    for probe in probes:
+        expected = dict(flat.search(probe, k))
+        found = ivf.search(probe, k)
+        assert [name for name, _ in found] == list(expected)
+        for name, score in found:
+            assert score == pytest.approx(expected[name], abs=1e-5)
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+def test_ivf_scores_like_flat_when_every_bucket_is_probed(metric):
+    rng = np.random.default_rng(0)
+    db = _gallery(rng)
+    flat = FlatIndex(metric=metric).build(db)
+    ivf = IVFIndex(nlist=8, nprobe=8, metric=metric).build(db)
+    _assert_same_scores(flat, ivf, rng.normal(0, 1, (10, 16)).astype(np.float32))
+
+
+def test_ivf_cosine_scores_every_row_of_a_candidate(tmp_path):
+    rng = np.random.default_rng(1)
+    db = _gallery(rng)
+    ivf = IVFIndex(nlist=8, nprobe=1, metric="cosine").build(db)
+    flat = FlatIndex(metric="cosine").build(db)
+    probe = db["user3"][0]
+    # One probed bucket holds only part of the user's rows; the score is still their mean
+    scores = dict(ivf.search(probe, 60))
+    assert scores["user3"] == pytest.approx(dict(flat.search(probe, 60))["user3"], abs=1e-5)
+
+    db["user3"] = rng.normal(0, 1, (4, 16)).astype(np.float32)
+    ivf.add("user3", db["user3"])
+    ivf.remove("user7")
+    del db["user7"]
+    path = str(tmp_path / "ivf.npz")
+    ivf.save(path)
+    loaded = IVFIndex.load(path, metric="cosine")
+    loaded.nprobe = ivf.nprobe = 8
+    flat = FlatIndex(metric="cosine").build(db)
+    probes = rng.normal(0, 1, (10, 16)).astype(np.float32)
+    _assert_same_scores(flat, ivf, probes)
+    _assert_same_scores(flat, loaded, probes)
+
+
+def test_sharded_index_follows_writes_by_rebuilding(store_path):
+    from face_auth.gallery import FaceGallery
+    rng = np.random.default_rng(3)
+    gallery = FaceGallery(store_path, check_interval=0, index_kind="sharded").load()
+    for name, rows in _gallery(rng, users=5, dim=8).items():
+        gallery.set_user(name, rows)
+    gallery.remove_user("user2")
+    probe = gallery.get("user4")[0]
+    assert gallery.index().kind == "sharded"
+    assert gallery.index().search(probe, k=len(gallery))[0][0] == "user4"
+    assert "user2" not in dict(gallery.index().search(probe, k=10))
+
+
+def test_ivf_saves_user_names_without_pickle(tmp_path):
+    rng = np.random.default_rng(4)
+    db = _gallery(rng, users=30)
+    path = str(tmp_path / "face_db.ivf.npz")
+    IVFIndex(nlist=4).build(db).save(path)
+    with np.load(path, allow_pickle=False) as data:
+        assert data["users"].dtype.kind == "U"
+    loaded = IVFIndex.load(path)
+    assert loaded.users == list(db) and all(type(name) is str for name in loaded.users)
+
+    # A file from before, with pickled names, is rebuilt rather than unpickled
+    with np.load(path) as data:
+        arrays = dict(data)
+    np.savez(path, **dict(arrays, users=np.asarray(list(db), dtype=object)))
+    assert IVFIndex.load(path) is None
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from face_auth.login_enhanced import verify_face
+from face_auth.matcher import EmbeddingMatcher, score_rows
+from face_auth.store import EmbeddingStore
+
+
+def _users(rng, counts, dim=7):
+    return {f"user{i}": rng.normal(0, 50, (count, dim)).astype(np.float32) for i, count in enumerate(counts)}
+
+
+def _loop_scores(probe, db, metric):
+    """The per-user loop the matcher replaced (verify_face for euclidean)"""
+    if metric == "euclidean":
+        return {name: verify_face(probe, rows) for name, rows in db.items()}
+    return {name: score_rows(probe, rows, "cosine") for name, rows in db.items()}
+
+
+def _assert_matches_loop(matcher, db, probes, metric):
+    scores = matcher.score_matrix(probes, metric)
+    assert sorted(matcher.users) == sorted(db)
+    for probe, row in zip(probes, scores):
+        expected = _loop_scores(probe, db, metric)
+        for name, score in zip(matcher.users, row):
+            assert score == pytest.approx(expected[name], abs=1e-5)
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+def test_scores_match_per_user_loop(metric):
+    rng = np.random.default_rng(0)
+    db = _users(rng, [1, 3, 5, 2, 10, 1])
+    probes = rng.normal(0, 50, (4, 7)).astype(np.float32)
+    _assert_matches_loop(EmbeddingMatcher(db, metric), db, probes, metric)
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+def test_snapshot_with_deleted_rows_matches_per_user_loop(store_path, metric):
+    rng = np.random.default_rng(1)
+    db = _users(rng, [2, 4, 1, 6, 3, 5])
+    store = EmbeddingStore(store_path).open()
+    store.write_many(db.items())
+    # Replaced and removed users leave garbage rows between the live ones
+    db["user1"] = rng.normal(0, 50, (2, 7)).astype(np.float32)
+    store.append("user1", db["user1"])
+    store.remove("user3")
+    del db["user3"]
+    snapshot = store.snapshot()
+    assert store.garbage_rows > 0
+
+    probes = rng.normal(0, 50, (4, 7)).astype(np.float32)
+    _assert_matches_loop(EmbeddingMatcher(snapshot, metric), db, probes, metric)
+
+
+def test_best_match_picks_the_closest_user():
+    rng = np.random.default_rng(2)
+    db = _users(rng, [3, 1, 4])
+    matcher = EmbeddingMatcher(db)
+    name, score = matcher.best_match(db["user2"][1] + 0.5)
+    assert name == "user2"
+    assert score == pytest.approx(verify_face(db["user2"][1] + 0.5, db["user2"]), abs=1e-5)
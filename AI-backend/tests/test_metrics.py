@@ -0,0 +1,13 @@
+from face_auth import metrics
+
+
+def test_label_values_are_escaped():
+    line = metrics._labels(("endpoint", "result"), ('/a\\b', 'say "hi"\nbye'))
+    assert line == '{endpoint="/a\\\\b",result="say \\"hi\\"\\nbye"}'
+
+
+def test_rendered_series_stay_on_one_line():
+    counter = metrics.Counter("face_test_total", "Escaping test", ["result"])
+    metrics.REGISTRY.remove(counter)
+    counter.inc(result='bad\n"frame"')
+    assert counter.render()[-1] == 'face_test_total{result="bad\\n\\"frame\\""} 1'
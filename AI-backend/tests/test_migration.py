@@ -0,0 +1,49 @@
+import pickle
+import numpy as np
+import pytest
+from face_auth import gallery as gallery_module
+from face_auth.store import EmbeddingStore, StoreMismatchError, migrate_from_pickle
+
+
+@pytest.fixture
+def legacy_pickle(tmp_path):
+    path = str(tmp_path / "face_db.pkl")
+    with open(path, "wb") as f:
+        pickle.dump({"alice": [np.ones(128)] * 3}, f)
+    return path
+
+
+def test_migration_tags_the_store_with_the_embedder(legacy_pickle, store_path):
+    store = migrate_from_pickle(legacy_pickle, store_path, "facenet", 128)
+    assert store.embedder == "facenet"
+    assert store.snapshot()["alice"].shape == (3, 128)
+
+
+def test_migration_refuses_vectors_of_another_size(legacy_pickle, store_path):
+    with pytest.raises(StoreMismatchError):
+        migrate_from_pickle(legacy_pickle, store_path, "haar-stats", 7)
+    assert not EmbeddingStore(store_path).exists()
+
+
+def _gallery(monkeypatch, store_path, pickle_path, embedder):
+    monkeypatch.setattr(gallery_module, "DEFAULT_STORE_FILE", store_path)
+    monkeypatch.setattr(gallery_module, "DB_FILE", pickle_path)
+    return gallery_module.FaceGallery(store_path, embedder=embedder).load()
+
+
+def test_default_store_migrates_a_matching_pickle(monkeypatch, legacy_pickle, store_path):
+    monkeypatch.delenv("FACE_STORE_PATH", raising=False)
+    assert len(_gallery(monkeypatch, store_path, legacy_pickle, "facenet")) == 1
+
+
+def test_default_store_skips_a_pickle_of_another_size(monkeypatch, legacy_pickle, store_path):
+    monkeypatch.delenv("FACE_STORE_PATH", raising=False)
+    gallery = _gallery(monkeypatch, store_path, legacy_pickle, "haar-stats")
+    assert len(gallery) == 0
+    gallery.set_user("bob", np.ones((2, 7)))
+    assert gallery.store.dim == 7
+
+
+def test_configured_store_path_is_never_migrated(monkeypatch, legacy_pickle, store_path):
+    monkeypatch.setenv("FACE_STORE_PATH", store_path)
+    assert len(_gallery(monkeypatch, store_path, legacy_pickle, "facenet")) == 0
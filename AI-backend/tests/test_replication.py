@@ -0,0 +1,123 @@
+import io
+import urllib.error
+import numpy as np
+import pytest
+from face_auth import replication
+from face_auth.gallery import FaceGallery
+from face_auth.store import EmbeddingStore
+
+EMBEDDER = "haar-stats"
+
+
+class LocalReplicator(replication.Replicator):
+    """Replicator reading the leader's feeds in-process, answered like the API endpoints"""
+
+    def __init__(self, gallery, leader_store):
+        super().__init__(gallery, leader="http://leader", token="secret")
+        self.leader_store = leader_store
+        self.resyncs = 0
+
+    def _open(self, path, **params):
+        if path == "snapshot":
+            self.resyncs += 1
+            feed = replication.snapshot_feed(self.leader_store)
+        else:
+            try:
+                feed = replication.changes_feed(self.leader_store, int(params["since"]), params["store_id"] or None)
+            except replication.ResyncRequired as e:
+                raise urllib.error.HTTPError(path, 410, str(e), {}, None)
+        return io.BytesIO(b"".join(feed))
+
+
+def _rows(seed, count=3):
+    return np.random.default_rng(seed).normal(0, 1, (count, 7)).astype(np.float32)
+
+
+@pytest.fixture
+def nodes(tmp_path):
+    leader = EmbeddingStore(str(tmp_path / "leader")).open()
+    follower = FaceGallery(str(tmp_path / "follower"), check_interval=0, embedder=EMBEDDER).load()
+    return leader, LocalReplicator(follower, leader)
+
+
+def _assert_converged(leader, replicator):
+    leader.refresh()
+    expected = leader.snapshot()
+    found = replicator.gallery.snapshot()
+    assert sorted(found) == sorted(expected)
+    for name in expected:
+        np.testing.assert_array_equal(found[name], expected[name])
+    assert replicator.state["store_id"] == leader.store_id
+    assert replicator.state["seq"] == leader.seq
+
+
+def test_follower_catches_up_on_every_missed_write(nodes):
+    leader, replicator = nodes
+    leader.append("alice", _rows(0), EMBEDDER)
+    replicator.pull()
+    assert replicator.resyncs == 1
+
+    # Several writes land between two pulls, one user replaced twice
+    leader.append("bob", _rows(1), EMBEDDER)
+    leader.append("carol", _rows(2), EMBEDDER)
+    leader.append("bob", _rows(3, count=5), EMBEDDER)
+    leader.append("bob", _rows(4, count=2), EMBEDDER)
+    assert replicator.pull() == 2
+    assert replicator.resyncs == 1
+    _assert_converged(leader, replicator)
+
+    # Nothing new: nothing written
+    assert replicator.pull() == 0
+    _assert_converged(leader, replicator)
+
+
+def test_follower_applies_deletes(nodes):
+    leader, replicator = nodes
+    for i, name in enumerate(["alice", "bob", "carol"]):
+        leader.append(name, _rows(i), EMBEDDER)
+    replicator.pull()
+
+    leader.remove("bob")
+    leader.append("dave", _rows(3), EMBEDDER)
+    leader.remove("dave")
+    replicator.pull()
+    assert replicator.resyncs == 1
+    assert "bob" not in replicator.gallery and "dave" not in replicator.gallery
+    _assert_converged(leader, replicator)
+
+
+@pytest.mark.parametrize("maintenance", ["checkpoint", "compact"])
+def test_follower_resyncs_after_the_leader_folds_its_wal(nodes, maintenance):
+    leader, replicator = nodes
+    for i, name in enumerate(["alice", "bob", "carol"]):
+        leader.append(name, _rows(i), EMBEDDER)
+    replicator.pull()
+
+    # The writes the follower missed are folded away before it pulls again
+    leader.append("alice", _rows(10), EMBEDDER)
+    leader.remove("bob")
+    leader.append("erin", _rows(11), EMBEDDER)
+    getattr(leader, maintenance)()
+    replicator.pull()
+    assert replicator.resyncs == 2
+    assert "bob" not in replicator.gallery
+    _assert_converged(leader, replicator)
+
+    # Back on the change feed after the resync
+    leader.append("frank", _rows(12), EMBEDDER)
+    assert replicator.pull() == 1
+    assert replicator.resyncs == 2
+    _assert_converged(leader, replicator)
+
+
+def test_follower_resyncs_when_the_leader_store_is_replaced(nodes, tmp_path):
+    leader, replicator = nodes
+    leader.append("alice", _rows(0), EMBEDDER)
+    replicator.pull()
+
+    replacement = EmbeddingStore(str(tmp_path / "new_leader")).open()
+    replacement.append("zoe", _rows(5), EMBEDDER)
+    replicator.leader_store = replacement
+    replicator.pull()
+    assert replicator.resyncs == 2
+    _assert_converged(replacement, replicator)
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from face_auth import store as store_module
+from face_auth.store import OP_PUT, EmbeddingStore, _encode_record
+
+
+def _rows(seed, count=3, dim=8):
+    return np.random.default_rng(seed).normal(0, 1, (count, dim)).astype(np.float32)
+
+
+def _assert_users(store, expected):
+    snapshot = store.snapshot()
+    assert sorted(snapshot) == sorted(expected)
+    for name, rows in expected.items():
+        np.testing.assert_array_equal(snapshot[name], rows)
+
+
+@pytest.mark.parametrize("tail", ["torn", "bad_crc", "garbage"])
+def test_replay_skips_a_damaged_wal_tail(store_path, tail):
+    store = EmbeddingStore(store_path).open()
+    expected = {f"user{i}": _rows(i) for i in range(3)}
+    for name, rows in expected.items():
+        store.append(name, rows)
+
+    record = _encode_record(store.seq + 1, OP_PUT, "ghost", store.meta["rows"], 3, 8)
+    if tail == "torn":
+        damage = record[:len(record) // 2]
+    elif tail == "bad_crc":
+        damage = record[:-1] + bytes([record[-1] ^ 0xFF])
+    else:
+        damage = os.urandom(64)
+    with open(store.wal_path, "ab") as f:
+        f.write(damage)
+
+    reopened = EmbeddingStore(store_path).open()
+    assert reopened.seq == 3
+    _assert_users(reopened, expected)
+
+    # The next writer drops the damaged tail before appending
+    expected["user3"] = _rows(3)
+    reopened.append("user3", expected["user3"])
+    _assert_users(EmbeddingStore(store_path).open(), expected)
+
+
+def test_concurrent_writes_share_one_group_commit(store_path, monkeypatch):
+    store = EmbeddingStore(store_path).open()
+    batches = []
+    commit = EmbeddingStore._commit
+
+    def counting_commit(self, batch):
+        batches.append(len(batch))
+        commit(self, batch)
+
+    monkeypatch.setattr(EmbeddingStore, "_commit", counting_commit)
+    writers = [threading.Thread(target=store.append, args=(f"user{i}", _rows(i))) for i in range(8)]
+    # Hold the writer lock until every writer has queued its write
+    with store._writer_lock():
+        for writer in writers:
+            writer.start()
+        deadline = time.monotonic() + 5
+        while len(store._pending) < len(writers) and time.monotonic() < deadline:
+            time.sleep(0.001)
+    for writer in writers:
+        writer.join()
+
+    assert batches == [len(writers)]
+    assert store.seq == len(writers)
+    _assert_users(EmbeddingStore(store_path).open(), {f"user{i}": _rows(i) for i in range(8)})
+
+
+def test_a_failed_group_commit_fails_every_queued_writer(store_path, monkeypatch):
+    store = EmbeddingStore(store_path).open()
+
+    def full_disk(self, batch):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(EmbeddingStore, "_commit", full_disk)
+    errors = []
+
+    def write(name):
+        try:
+            store.append(name, _rows(0))
+        except OSError as e:
+            errors.append(e.errno)
+
+    writers = [threading.Thread(target=write, args=(f"user{i}",)) for i in range(3)]
+    with store._writer_lock():
+        for writer in writers:
+            writer.start()
+        deadline = time.monotonic() + 5
+        while len(store._pending) < len(writers) and time.monotonic() < deadline:
+            time.sleep(0.001)
+    for writer in writers:
+        writer.join(timeout=5)
+
+    assert not any(writer.is_alive() for writer in writers)
+    assert errors == [28] * len(writers)
+
+
+def test_write_many_commits_puts_and_removals_together(store_path):
+    store = EmbeddingStore(store_path).open()
+    store.append("gone", _rows(0))
+    failed = store.write_many([("a", _rows(1)), ("gone", None), ("bad", np.zeros((2, 5)))])
+    assert [name for name, _ in failed] == ["bad"]
+    assert store.seq == 3
+    _assert_users(EmbeddingStore(store_path).open(), {"a": _rows(1)})
+
+
+def _churned_store(store_path):
+    """A store with replaced and removed users, so it holds garbage rows and a WAL"""
+    store = EmbeddingStore(store_path).open()
+    expected = {}
+    for i in range(6):
+        expected[f"user{i}"] = _rows(i, count=i + 1)
+        store.append(f"user{i}", expected[f"user{i}"])
+    for i in (1, 4):
+        expected[f"user{i}"] = _rows(100 + i, count=2)
+        store.append(f"user{i}", expected[f"user{i}"])
+    store.remove("user2")
+    del expected["user2"]
+    return store, expected
+
+
+def test_checkpoint_preserves_every_user(store_path):
+    store, expected = _churned_store(store_path)
+    store.checkpoint()
+    assert os.path.getsize(store.wal_path) == 0
+    _assert_users(store, expected)
+    _assert_users(EmbeddingStore(store_path).open(), expected)
+
+
+def test_compact_preserves_every_user(store_path):
+    store, expected = _churned_store(store_path)
+    old_data = store.data_path
+    assert store.garbage_rows > 0
+    store.compact()
+    assert store.garbage_rows == 0
+    assert store.meta["rows"] == sum(len(rows) for rows in expected.values())
+    assert not os.path.exists(old_data)
+    _assert_users(store, expected)
+    _assert_users(EmbeddingStore(store_path).open(), expected)
+
+
+def test_reader_follows_writes_across_a_compaction(store_path, monkeypatch):
+    monkeypatch.setattr(store_module, "COMPACT_RATIO", 0.1)
+    reader = EmbeddingStore(store_path).open()
+    writer, expected = _churned_store(store_path)
+    assert reader.refresh()
+    _assert_users(reader, expected)
+    assert writer.needs_compaction()
+    writer.compact()
+    expected["late"] = _rows(7)
+    writer.append("late", expected["late"])
+    assert reader.refresh()
+    _assert_users(reader, expected)
@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pytest
+from face_auth.gallery import FaceGallery
+from face_auth.index import INDEX_TYPES, FlatIndex
+from face_auth.tiered import TieredIndex
+
+DIM = 8
+
+
+class SmallTieredIndex(TieredIndex):
+    """Room for three hot users and 8-row chunks, so searches mix both tiers"""
+
+    def __init__(self, metric="euclidean"):
+        super().__init__(budget_mb=3 * (4 * DIM * 4 + 4 * 8) / 2**20, slot_rows=4, chunk_rows=8, metric=metric)
+
+
+@pytest.fixture
+def tiered_gallery(monkeypatch, store_path):
+    monkeypatch.setitem(INDEX_TYPES, "tiered", SmallTieredIndex)
+
+    def make(metric):
+        gallery = FaceGallery(store_path, check_interval=0, index_kind="tiered")
+        gallery.metric = metric
+        return gallery.load()
+    return make
+
+
+def _rows(rng, count=None):
+    return rng.normal(0, 1, (count or int(rng.integers(1, 6)), DIM)).astype(np.float32)
+
+
+def _open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def _assert_matches_flat(gallery, probes):
+    index = gallery.index()
+    flat = FlatIndex(metric=gallery.metric).build(dict(gallery.snapshot()))
+    assert len(index) == len(flat)
+    for probe in probes:
+        expected = flat.search(probe, 5)
+        found = index.search(probe, 5)
+        assert [name for name, _ in found] == [name for name, _ in expected]
+        assert [score for _, score in found] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+def test_writes_update_the_tiered_index_in_place(tiered_gallery, metric):
+    rng = np.random.default_rng(7)
+    gallery = tiered_gallery(metric)
+    for i in range(20):
+        gallery.set_user(f"user{i}", _rows(rng))
+    index = gallery.index()
+    probes = [gallery.get(f"user{i}")[0] + 0.01 for i in (0, 5, 12)]
+    _assert_matches_flat(gallery, probes)
+    hot = [index.users[i] for i in index._lru]
+
+    # New users, replaced and removed ones, hot and cold alike
+    gallery.set_user("late", _rows(rng, 3))
+    gallery.set_user(hot[0], _rows(rng, 2))
+    gallery.set_user("user3", _rows(rng, 5))
+    gallery.remove_user(hot[-1])
+    gallery.remove_user("user9")
+    gallery.apply_changes([("user1", _rows(rng, 1)), ("user2", None), ("batch", _rows(rng, 4))])
+
+    assert gallery.index() is index
+    assert index.user_rows("user9") is None and index.user_rows(hot[-1]) is None
+    np.testing.assert_array_equal(index.user_rows("user3"), gallery.get("user3"))
+    probes += [gallery.get(name)[0] + 0.01 for name in ("late", hot[0], "user3", "batch")]
+    _assert_matches_flat(gallery, probes)
+
+
+def test_first_write_to_an_empty_store(tiered_gallery):
+    rng = np.random.default_rng(8)
+    gallery = tiered_gallery("euclidean")
+    index = gallery.index()
+    assert len(index) == 0
+    gallery.set_user("alice", _rows(rng, 2))
+    gallery.set_user("bob", _rows(rng, 3))
+    assert gallery.index() is index
+    _assert_matches_flat(gallery, [gallery.get("alice")[1], gallery.get("bob")[0]])
+
+
+def test_replaced_indexes_release_the_store_file(tiered_gallery):
+    rng = np.random.default_rng(9)
+    gallery = tiered_gallery("euclidean")
+    for i in range(10):
+        gallery.set_user(f"user{i}", _rows(rng))
+    gallery.index()
+    baseline = _open_fds()
+    for i in range(5):
+        # Each compaction reloads the store and builds a new index
+        gallery.set_user(f"user{i}", _rows(rng))
+        gallery.store.compact()
+        gallery.refresh(force=True)
+        gallery.index()
+    assert _open_fds() <= baseline
+    _assert_matches_flat(gallery, [gallery.get("user0")[0]])
+
+
+def test_closed_index_still_answers(store_path):
+    rng = np.random.default_rng(10)
+    gallery = FaceGallery(store_path, check_interval=0).load()
+    for i in range(6):
+        gallery.set_user(f"user{i}", _rows(rng))
+    index = SmallTieredIndex().build(gallery.snapshot())
+    before = _open_fds()
+    index.close()
+    assert _open_fds() == before - 1
+    assert index.search(gallery.get("user4")[0], 1)[0][0] == "user4"
+    assert _open_fds() == before - 1
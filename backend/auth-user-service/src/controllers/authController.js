@@ -392,6 +392,62 @@ export const enableFaceAuth = async (req, res) => {
     }
 };
 
+// Decode a base64 frame (optionally a data URL) for a raw image/* upload to the AI backend
+const imageBody = (imageData) => {
+    const dataUrl = /^data:(image\/[\w.+-]+);base64,/.exec(imageData);
+    return {
+        frame: Buffer.from(dataUrl ? imageData.slice(dataUrl[0].length) : imageData, 'base64'),
+        contentType: dataUrl ? dataUrl[1] : 'image/jpeg'
+    };
+};
+
+// The AI backend's liveness probe (answered from memory, also while it is
+// still loading), or null when nothing is listening
+const faceServiceHealth = async (axios) => {
+    try {
+        const health = await axios.get('http://127.0.0.1:5002/api/face/health', { timeout: 1000 });
+        return health.data;
+    } catch (e) {
+        return null;
+    }
+};
+
+// Poll the liveness probe until the AI backend reports ready (false after timeoutMs)
+const waitForFaceService = async (axios, timeoutMs) => {
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+        const health = await faceServiceHealth(axios);
+        if (health && health.ready) {
+            return true;
+        }
+        await new Promise(resolve => setTimeout(resolve, 100));
+    }
+    return false;
+};
+
+// 1:1 check of a frame against one enrolled user on the AI backend.
+// Returns true/false, or null when the AI backend could not be asked.
+// A user the AI backend has no face for is not verified.
+const verifyClaimedFace = async (username, imageData) => {
+    try {
+        const axios = (await import('axios')).default;
+        // Alive but possibly still loading the gallery and model; wait until it is ready
+        if (!(await waitForFaceService(axios, 5000))) {
+            return null;
+        }
+        const { frame, contentType } = imageBody(imageData);
+        const aiResponse = await axios.post('http://127.0.0.1:5002/api/face/verify', frame, {
+            params: { username },
+            headers: { 'Content-Type': contentType },
+            validateStatus: (status) => status < 500
+        });
+        return Boolean(aiResponse.data.success && aiResponse.data.verified);
+    } catch (aiError) {
+        console.error('AI backend verification error:', aiError.message);
+        return null;
+    }
+};
+
 export const loginWithFace = async (req, res) => {
     try {
         const { imageData, username } = req.body;
@@ -428,38 +484,31 @@ export const loginWithFace = async (req, res) => {
                 const axios = (await import('axios')).default;
                 
                 // Check if AI backend is running, if not, try to start it
-                let aiBackendRunning = false;
-                try {
-                    await axios.get('http://127.0.0.1:5002/api/face/status', { timeout: 1000 });
-                    aiBackendRunning = true;
-                } catch (e) {
+                if (!(await faceServiceHealth(axios))) {
                     console.log('AI backend not running, attempting to start...');
                     // Try to start AI backend
                     const { spawn } = await import('child_process');
                     const path = await import('path');
                     const aiBackendPath = path.join(process.cwd(), '..', '..', 'AI-backend');
                     
-                    spawn('python3', ['face_auth_api.py'], {
+                    spawn('python3', ['-m', 'face_auth.server'], {
                         cwd: aiBackendPath,
                         detached: true,
                         stdio: 'ignore'
                     }).unref();
                     
-                    // Wait 3 seconds for it to start
-                    await new Promise(resolve => setTimeout(resolve, 3000));
-                    
-                    try {
-                        await axios.get('http://127.0.0.1:5002/api/face/status', { timeout: 2000 });
-                        aiBackendRunning = true;
-                        console.log('AI backend started successfully');
-                    } catch (e2) {
-                        console.log('Failed to start AI backend automatically');
-                    }
+                }
+                // Alive but possibly still loading the gallery and model; wait until it is ready
+                const aiBackendRunning = await waitForFaceService(axios, 5000);
+                if (!aiBackendRunning) {
+                    console.log('AI backend is not ready');
                 }
                 
                 if (aiBackendRunning) {
-                    const aiResponse = await axios.post('http://127.0.0.1:5002/api/face/verify-frame', {
-                        image: imageData
+                    // Forward the frame as a raw image body instead of base64 JSON
+                    const { frame, contentType } = imageBody(imageData);
+                    const aiResponse = await axios.post('http://127.0.0.1:5002/api/face/verify-frame', frame, {
+                        headers: { 'Content-Type': contentType }
                     });
 
                     if (aiResponse.data.success && aiResponse.data.threshold_met && aiResponse.data.best_match) {
@@ -510,8 +559,34 @@ export const loginWithFace = async (req, res) => {
             });
         }
 
-        // For now, accept any face if face auth is enabled and user is found
-        // In a production system, you would compare the captured face with stored encoding
+        // A claimed username is checked 1:1 against that user's enrolled face only;
+        // without an answer from the AI backend the login is refused
+        if (username) {
+            const verified = await verifyClaimedFace(user.username, imageData);
+            if (verified === null) {
+                await createLoginHistory(user._id, req, 'failed', 'face', 'Face service unavailable');
+
+                return res.status(503).json({
+                    success: false,
+                    error: {
+                        code: 'FACE_SERVICE_UNAVAILABLE',
+                        message: 'Face authentication is temporarily unavailable. Please try again or use password login.'
+                    }
+                });
+            }
+            if (!verified) {
+                await createLoginHistory(user._id, req, 'failed', 'face', 'Face did not match user');
+
+                return res.status(401).json({
+                    success: false,
+                    error: {
+                        code: 'FACE_NOT_RECOGNIZED',
+                        message: 'Face not recognized. Please try again or use password login.'
+                    }
+                });
+            }
+        }
+
         console.log('Face authentication successful for user:', user.username);
 
         // Generate tokens